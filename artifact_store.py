@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Content-addressed store for build outputs and the versions of sources
+
+Every artifact is kept once under .build_cache/store/objects, named by the
+SHA-256 of its bytes, however many paths or pipeline stages produce it.
+A path is materialized from its object by a reflink (a copy-on-write
+clone, on filesystems that have them) or a hardlink, so placing an
+artifact costs no copy of its bytes. Hardlinks are only used for PDFs,
+which the build always replaces by rename and never rewrites in place;
+other files get a reflink or, failing that, a copy, so an editor or
+fixer writing to them cannot change the stored object.
+
+Each path has a history under .build_cache/store/history: the digests it
+held, when and why. Published PDFs and every fixer rewrite are recorded
+there, so an earlier version of a document can be restored. Objects no
+history or working file refers to are removed by `gc`.
+
+Usage:
+    artifact_store.py add [--hardlink] PATH... store files and link them to their objects
+    artifact_store.py history PATH             list the recorded versions of a file
+    artifact_store.py restore PATH [-n N]      put back the version N saves ago (default 1)
+    artifact_store.py gc [--keep N] [--dry-run]
+    artifact_store.py fsck                     re-hash every object
+    artifact_store.py stats
+"""
+
+import argparse
+import errno
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from pathlib import Path
+
+import lesson_paths
+from build_cache import CACHE_DIR
+
+STORE_DIR = CACHE_DIR / 'store'
+OBJECT_DIR = STORE_DIR / 'objects'
+HISTORY_DIR = STORE_DIR / 'history'
+
+# Written only by rename, so a hardlink to the object is safe
+LINK_SUFFIXES = ('.pdf',)
+
+# Versions of each path kept by gc
+KEEP_VERSIONS = 10
+
+# Objects younger than this are never collected: a writer may not have recorded them yet
+GC_GRACE = 3600
+
+# linux/fs.h
+FICLONE = 0x40049409
+
+HASH_BLOCK = 1 << 20
+
+def _tmp(path):
+    return path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def object_path(digest):
+    return OBJECT_DIR / digest[:2] / digest[2:]
+
+def _reflink(source, target):
+    """Clone source into a new file at target; False if the filesystem cannot."""
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            return True
+        except OSError:
+            pass
+    os.unlink(target)
+    return False
+
+def _clone(source, target, hardlink):
+    """Create target with source's content without copying bytes when possible.
+
+    Returns how it was made: 'reflink', 'hardlink' or 'copy'.
+    """
+    if _reflink(source, target):
+        return 'reflink'
+    if hardlink:
+        try:
+            os.link(source, target)
+            return 'hardlink'
+        except OSError:
+            pass
+    shutil.copyfile(source, target)
+    return 'copy'
+
+def _link_safe(path):
+    return Path(path).suffix in LINK_SUFFIXES
+
+def put(path, move=False):
+    """Store a file's content and return its digest.
+
+    With `move` the file is renamed into the store when its content is
+    new, and removed otherwise; it must not be used afterwards.
+    """
+    path = Path(path)
+    digest = file_digest(path)
+    target = object_path(digest)
+    if target.exists():
+        if move:
+            path.unlink()
+        return digest
+    target.parent.mkdir(parents=True, exist_ok=True)
+    if move:
+        try:
+            os.replace(path, target)
+            return digest
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+    tmp = _tmp(target)
+    try:
+        _clone(path, tmp, hardlink=False)
+        os.replace(tmp, target)
+    finally:
+        tmp.unlink(missing_ok=True)
+    if move:
+        path.unlink()
+    return digest
+
+def put_bytes(data):
+    """Store bytes and return their digest."""
+    digest = hashlib.sha256(data).hexdigest()
+    target = object_path(digest)
+    if not target.exists():
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = _tmp(target)
+        tmp.write_bytes(data)
+        os.replace(tmp, target)
+    return digest
+
+def materialize(digest, path, hardlink=False):
+    """Put the object's content at path, atomically; returns how, or None if it was there.
+
+    PDFs, or with `hardlink` any file, may become a hardlink to the object.
+    """
+    path = Path(path)
+    source = object_path(digest)
+    try:
+        if os.path.samefile(source, path):
+            return None
+    except OSError:
+        pass
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = _tmp(path)
+    try:
+        how = _clone(source, tmp, hardlink=hardlink or _link_safe(path))
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return how
+
+# --- History ---------------------------------------------------------------
+
+def _history_file(path):
+    path = Path(path).resolve()
+    try:
+        relative = path.relative_to(lesson_paths.root().resolve())
+    except ValueError:
+        relative = Path('external') / hashlib.sha1(str(path).encode('utf-8')).hexdigest()[:16] / path.name
+    return HISTORY_DIR / f"{relative}.jsonl"
+
+def history(path):
+    """Recorded versions of a path, oldest first: dicts with time, digest and note."""
+    try:
+        with open(_history_file(path), 'r', encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except (OSError, ValueError):
+        return []
+
+def record(path, digest, note):
+    """Add a version to a path's history unless it is already the latest."""
+    versions = history(path)
+    if versions and versions[-1]['digest'] == digest:
+        return
+    log = _history_file(path)
+    log.parent.mkdir(parents=True, exist_ok=True)
+    line = json.dumps({'time': round(time.time(), 3), 'digest': digest, 'note': note}) + '\n'
+    # One write per line, so concurrent writers never interleave
+    with open(log, 'a', encoding='utf-8') as f:
+        f.write(line)
+
+def save(path, note, data=None):
+    """Store a file's current content (or `data`) in its history; returns the digest."""
+    digest = put_bytes(data) if data is not None else put(path)
+    record(path, digest, note)
+    return digest
+
+def publish(built, path, note='publish'):
+    """Move a build output into the store and materialize it at path."""
+    digest = put(built, move=True)
+    materialize(digest, path)
+    record(path, digest, note)
+    return digest
+
+def restore(path, back=1):
+    """Materialize the version recorded `back` saves before the latest one."""
+    versions = history(path)
+    if back >= len(versions):
+        raise ValueError(f"{path} has {len(versions)} recorded versions")
+    version = versions[-1 - back]
+    if not object_path(version['digest']).exists():
+        raise ValueError(f"the object of that version of {path} was collected")
+    digest = save(path, 'before restore') if Path(path).exists() else None
+    materialize(version['digest'], path)
+    record(path, version['digest'], f"restored from {time.strftime('%Y-%m-%d %H:%M', time.localtime(version['time']))}")
+    return digest
+
+# --- Maintenance -----------------------------------------------------------
+
+def objects():
+    """Every stored object: (digest, path)."""
+    if not OBJECT_DIR.exists():
+        return
+    for directory in sorted(OBJECT_DIR.iterdir()):
+        for path in sorted(directory.iterdir()):
+            if not path.name.startswith('.'):
+                yield directory.name + path.name, path
+
+def gc(keep=KEEP_VERSIONS, dry_run=False):
+    """Trim histories to their last `keep` versions and remove unreferenced objects.
+
+    An object is kept while a history refers to it, a working file is
+    hardlinked to it, or it is younger than GC_GRACE. Returns (removed
+    objects, bytes freed).
+    """
+    referenced = set()
+    for log in HISTORY_DIR.rglob('*.jsonl') if HISTORY_DIR.exists() else []:
+        with open(log, 'r', encoding='utf-8') as f:
+            lines = [line for line in f if line.strip()]
+        kept = lines[-keep:] if keep else []
+        referenced.update(json.loads(line)['digest'] for line in kept)
+        if len(kept) < len(lines) and not dry_run:
+            tmp = _tmp(log)
+            tmp.write_text(''.join(kept), encoding='utf-8')
+            os.replace(tmp, log)
+
+    removed = 0
+    freed = 0
+    cutoff = time.time() - GC_GRACE
+    for digest, path in list(objects()):
+        stat = path.stat()
+        if digest in referenced or stat.st_nlink > 1 or stat.st_mtime > cutoff:
+            continue
+        removed += 1
+        freed += stat.st_size
+        if not dry_run:
+            path.unlink()
+    return removed, freed
+
+def fsck():
+    """Digests of the objects whose content no longer matches their name."""
+    return [digest for digest, path in objects() if file_digest(path) != digest]
+
+def add(paths, hardlink=False):
+    """Store files and replace each with a link to its object.
+
+    Only PDFs are hardlinked unless `hardlink`, which is for files nothing
+    rewrites in place, such as archived copies.
+
+    Returns (files, bytes of the files, bytes of the new objects).
+    """
+    files = 0
+    total = 0
+    added = 0
+    for path in paths:
+        path = Path(path)
+        digest = file_digest(path)
+        new = not object_path(digest).exists()
+        put(path)
+        materialize(digest, path, hardlink)
+        record(path, digest, 'add')
+        size = path.stat().st_size
+        files += 1
+        total += size
+        added += size if new else 0
+    return files, total, added
+
+def _size(count):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if count < 1024 or unit == 'GB':
+            return f"{count:.0f} {unit}" if unit == 'B' else f"{count:.1f} {unit}"
+        count /= 1024
+
+def _walk(paths):
+    """Files under the given paths, skipping dot-files and directories."""
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            for child in sorted(path.rglob('*')):
+                if child.is_file() and not any(part.startswith('.') for part in child.relative_to(path).parts):
+                    yield child
+        elif path.is_file():
+            yield path
+
+def main():
+    """Run a store command."""
+    parser = argparse.ArgumentParser(description="Content-addressed store of build artifacts and source versions")
+    commands = parser.add_subparsers(dest='command', required=True)
+    add_parser = commands.add_parser('add', help="store files and link them to their objects")
+    add_parser.add_argument('paths', nargs='+', help="files or directories")
+    add_parser.add_argument('--hardlink', action='store_true',
+                            help="hardlink every file, not only PDFs (for files never rewritten in place)")
+    history_parser = commands.add_parser('history', help="list the recorded versions of a file")
+    history_parser.add_argument('path')
+    restore_parser = commands.add_parser('restore', help="put back an earlier version of a file")
+    restore_parser.add_argument('path')
+    restore_parser.add_argument('-n', type=int, default=1, help="versions back from the latest (default: 1)")
+    gc_parser = commands.add_parser('gc', help="remove objects nothing refers to")
+    gc_parser.add_argument('--keep', type=int, default=KEEP_VERSIONS,
+                           help=f"versions kept per file (default: {KEEP_VERSIONS})")
+    gc_parser.add_argument('--dry-run', action='store_true')
+    commands.add_parser('fsck', help="re-hash every object")
+    commands.add_parser('stats', help="object count and size")
+    args = parser.parse_args()
+
+    if args.command == 'add':
+        start = time.perf_counter()
+        files, total, added = add(_walk(args.paths), args.hardlink)
+        print(f"{files} files, {_size(total)}: {_size(added)} new in the store, "
+              f"{_size(total - added)} shared ({time.perf_counter() - start:.2f} s)")
+    elif args.command == 'history':
+        versions = history(args.path)
+        for back, version in enumerate(reversed(versions)):
+            stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(version['time']))
+            present = '' if object_path(version['digest']).exists() else '  (collected)'
+            print(f"{back:3}  {stamp}  {version['digest'][:12]}  {version['note']}{present}")
+        if not versions:
+            print(f"No recorded versions of {args.path}")
+    elif args.command == 'restore':
+        try:
+            restore(args.path, args.n)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 1
+        print(f"Restored {args.path}")
+    elif args.command == 'gc':
+        removed, freed = gc(args.keep, args.dry_run)
+        print(f"{'Would remove' if args.dry_run else 'Removed'} {removed} objects, {_size(freed)}")
+    elif args.command == 'fsck':
+        bad = fsck()
+        for digest in bad:
+            print(f"corrupt: {digest}")
+        print(f"{len(bad)} corrupt objects")
+        return 1 if bad else 0
+    elif args.command == 'stats':
+        sizes = [path.stat() for _, path in objects()]
+        linked = sum(1 for stat in sizes if stat.st_nlink > 1)
+        print(f"{len(sizes)} objects, {_size(sum(stat.st_size for stat in sizes))}, {linked} linked from the tree")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for each stage of the lesson build
+
+Times component extraction, Unicode translation, every fix rule and fix
+profile, the linter and pdflatex separately, against the real lessons or
+a synthetic corpus that scales the raw lesson format to any number of
+lessons and any source size. Each stage runs --repeat times; the best,
+mean and first (cold) times go to a JSON results file.
+
+Given a baseline (a results file from an earlier run on the same
+machine), any stage whose best time grew beyond the tolerance fails the
+run, so a slower fixer shows up before it reaches a full build.
+
+Usage:
+    benchmark.py run [--synthetic N --scale K] [--stages PREFIX,...] [--compile N]
+                     [--output FILE] [--baseline FILE] [--update-baseline]
+    benchmark.py corpus DIR [--lessons N] [--scale K] [--seed S]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import artifact_store
+import compile_stage
+import component_index
+import lesson_paths
+import preamble_format
+import tikz_externalize
+from build_cache import CACHE_DIR, toolchain_version
+from fix_rules import PROFILES, RULES, apply_rules, lesson_number
+from latex_unicode import translate as translate_unicode
+from lint_latex import lint
+from process_lessons import extract_lesson_components
+
+# Cache directories the benchmarked stages write to, redirected into the
+# benchmark's temporary directory: (module, attribute, subdirectory)
+CACHE_DIRS = [
+    (component_index, 'INDEX_DIR', 'components'),
+    (tikz_externalize, 'FIGURE_DIR', 'figures'),
+    (preamble_format, 'FORMAT_DIR', 'formats'),
+    (artifact_store, 'STORE_DIR', 'store'),
+    (artifact_store, 'OBJECT_DIR', 'store/objects'),
+    (artifact_store, 'HISTORY_DIR', 'store/history'),
+]
+
+RESULTS_FILE = CACHE_DIR / 'benchmark' / 'results.json'
+BASELINE_FILE = CACHE_DIR / 'benchmark' / 'baseline.json'
+
+# A stage is slower than its baseline beyond this fraction...
+DEFAULT_TOLERANCE = 0.25
+# ...and by more than this many seconds, so timer noise on tiny stages never fails
+NOISE_FLOOR = 0.005
+
+LATEX_BLOCK = re.compile(r'```latex(.*?)```', re.DOTALL)
+SECTION_START = re.compile(r'(?=\\section\*?\{)')
+
+def _scale_document(block, scale, rng):
+    """Resample a document's sections to `scale` times as many."""
+    begin = block.find('\\begin{document}')
+    end = block.rfind('\\end{document}')
+    if begin < 0 or end < begin:
+        return block
+    begin += len('\\begin{document}')
+    parts = SECTION_START.split(block[begin:end])
+    intro, sections = parts[0], parts[1:] or parts
+    body = ''.join(rng.choice(sections) for _ in range(len(sections) * scale))
+    return block[:begin] + intro + body + block[end:]
+
+def synthetic_source(seed_text, number, scale, rng):
+    """A raw lesson source in the format of `seed_text`, `scale` times as long."""
+    first_block = seed_text.find('```latex')
+    prefix, rest = seed_text[:first_block], seed_text[first_block:]
+
+    paragraphs = prefix.split('\n\n')
+    extra = [rng.choice(paragraphs[1:] or paragraphs) for _ in range(len(paragraphs) * (scale - 1))]
+    prefix = '\n\n'.join(paragraphs[:-1] + extra + paragraphs[-1:])
+    prefix = re.sub(r'Lesson \d+:', f'Lesson {number}:', prefix, count=1)
+
+    rest = LATEX_BLOCK.sub(lambda m: f"```latex{_scale_document(m.group(1), scale, rng)}```", rest, count=2)
+    return prefix + rest
+
+def generate_corpus(directory, lessons, scale=1, seed=0):
+    """Write `lessons` synthetic raw sources (1.txt, 2.txt, ...) into directory.
+
+    Each one is built from a randomly chosen real lesson, with its audio
+    paragraphs and document sections resampled `scale` times over. The
+    same seed always gives the same corpus.
+    """
+    seeds = []
+    for lesson_num in lesson_paths.raw_lessons():
+        text = lesson_paths.raw_source(lesson_num).read_text(encoding='utf-8', errors='replace')
+        if len(LATEX_BLOCK.findall(text)) >= 2:
+            seeds.append(text)
+    if not seeds:
+        raise FileNotFoundError(f"no raw lesson sources in {lesson_paths.raw_dir()}")
+
+    rng = random.Random(seed)
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for number in range(1, lessons + 1):
+        path = directory / f"{number}.txt"
+        path.write_text(synthetic_source(rng.choice(seeds), number, scale, rng), encoding='utf-8')
+        paths.append(path)
+    return paths
+
+def _time(func, repeat):
+    """Run func() `repeat` times; return the wall times in seconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+def _summary(times, items, size):
+    best = min(times)
+    return {
+        'best': best,
+        'mean': statistics.fmean(times),
+        'first': times[0],
+        'runs': len(times),
+        'items': items,
+        'bytes': size,
+        'mb_per_s': size / best / 1e6 if best and size else None,
+    }
+
+def _documents_of(sources):
+    """The theory and problems documents extracted from raw sources."""
+    documents = []
+    for source in sources:
+        _, theory, problems = extract_lesson_components(source)
+        number = int(Path(source).stem)
+        for kind, content in (('lesson', theory), ('problems', problems)):
+            if content:
+                documents.append((f"{kind}_{number:02d}.tex", content))
+    return documents
+
+def _fresh_index_dir(directory):
+    shutil.rmtree(directory, ignore_errors=True)
+    component_index.INDEX_DIR = directory
+
+def stages(sources, documents, work_dir, compile_count):
+    """Yield (name, func, items, bytes) for every benchmarked stage."""
+    source_bytes = sum(os.path.getsize(source) for source in sources)
+    document_bytes = sum(len(content.encode('utf-8')) for _, content in documents)
+    contexts = [{'path': name, 'lesson_num': lesson_number(name)} for name, _ in documents]
+
+    index_dir = work_dir / 'components'
+
+    def extract_cold():
+        _fresh_index_dir(index_dir)
+        for source in sources:
+            extract_lesson_components(source)
+
+    def extract_indexed():
+        for source in sources:
+            extract_lesson_components(source)
+
+    yield 'extract', extract_cold, len(sources), source_bytes
+    yield 'extract_indexed', extract_indexed, len(sources), source_bytes
+
+    def unicode():
+        for _, content in documents:
+            translate_unicode(content)
+
+    yield 'unicode', unicode, len(documents), document_bytes
+
+    def chain(rules):
+        def run():
+            for (_, content), ctx in zip(documents, contexts):
+                apply_rules(content, rules, dict(ctx))
+        return run
+
+    for name in RULES:
+        yield f'rule:{name}', chain([name]), len(documents), document_bytes
+    for name, rules in PROFILES.items():
+        yield f'profile:{name}', chain(rules), len(documents), document_bytes
+
+    def lint_all():
+        for _, content in documents:
+            lint(content)
+
+    yield 'lint', lint_all, len(documents), document_bytes
+
+    if compile_count and shutil.which('pdflatex'):
+        compiled = documents[:compile_count]
+        tex_dir = work_dir / 'tex'
+        tex_dir.mkdir(parents=True, exist_ok=True)
+        paths = []
+        for name, content in compiled:
+            path = tex_dir / name
+            path.write_text(content, encoding='utf-8')
+            paths.append(path)
+
+        def pdflatex():
+            for path in paths:
+                compile_stage.run_pdflatex(path, timeout=120, check=False, local=True, note_passes=False,
+                                           pdf_path=path.with_suffix('.pdf'))
+
+        size = sum(len(content.encode('utf-8')) for _, content in compiled)
+        yield 'pdflatex', pdflatex, len(paths), size
+
+def run_benchmarks(sources, documents, repeat=3, only=None, compile_count=2, report=print):
+    """Time every stage whose name starts with one of `only` (all by default).
+
+    Generated index files, build directories, figures, formats, stored
+    artifacts and PDFs go to a temporary directory, so benchmarking never
+    touches the lessons or the caches.
+    """
+    results = {}
+    saved_dirs = [(module, name, getattr(module, name)) for module, name, _ in CACHE_DIRS]
+    saved_build_dir = os.environ.get(compile_stage.BUILD_DIR_ENV)
+    with tempfile.TemporaryDirectory(prefix='ode-bench-') as tmp:
+        work_dir = Path(tmp)
+        os.environ[compile_stage.BUILD_DIR_ENV] = str(work_dir / 'build')
+        for module, name, directory in CACHE_DIRS:
+            setattr(module, name, work_dir / directory)
+        _fresh_index_dir(work_dir / 'components')
+        try:
+            for name, func, items, size in stages(sources, documents, work_dir, compile_count):
+                if only and not any(name.startswith(prefix) for prefix in only):
+                    continue
+                results[name] = _summary(_time(func, repeat), items, size)
+                report(f"{name:45} {results[name]['best'] * 1000:10.1f} ms")
+        finally:
+            for module, name, directory in saved_dirs:
+                setattr(module, name, directory)
+            if saved_build_dir is None:
+                os.environ.pop(compile_stage.BUILD_DIR_ENV, None)
+            else:
+                os.environ[compile_stage.BUILD_DIR_ENV] = saved_build_dir
+    return results
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Return a message for every stage slower than its baseline.
+
+    A baseline stage may carry its own 'tolerance' overriding the default.
+    """
+    regressions = []
+    for name, stage in results.items():
+        base = baseline.get('stages', {}).get(name)
+        if not base:
+            continue
+        allowed = base['best'] * (1 + base.get('tolerance', tolerance))
+        if stage['best'] > allowed and stage['best'] - base['best'] > NOISE_FLOOR:
+            regressions.append(f"{name}: {stage['best'] * 1000:.1f} ms, baseline {base['best'] * 1000:.1f} ms "
+                               f"(+{(stage['best'] / base['best'] - 1) * 100:.0f}%)")
+    return regressions
+
+def _write_json(path, data):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=1)
+    os.replace(tmp, path)
+
+def run(args):
+    """Benchmark the real or a synthetic corpus and check it against the baseline."""
+    with tempfile.TemporaryDirectory(prefix='ode-corpus-') as tmp:
+        if args.synthetic:
+            sources = generate_corpus(tmp, args.synthetic, args.scale, args.seed)
+            corpus = {'kind': 'synthetic', 'lessons': args.synthetic, 'scale': args.scale, 'seed': args.seed}
+            documents = _documents_of(sources)
+        else:
+            sources = [lesson_paths.raw_source(lesson_num) for lesson_num in lesson_paths.raw_lessons()]
+            corpus = {'kind': 'real', 'lessons': len(sources)}
+            documents = [(path.name, path.read_text(encoding='utf-8')) for path in lesson_paths.documents()]
+        corpus['documents'] = len(documents)
+        corpus['source_bytes'] = sum(os.path.getsize(source) for source in sources)
+        print(f"Corpus: {corpus['lessons']} lessons, {len(documents)} documents, "
+              f"{corpus['source_bytes'] / 1e6:.1f} MB of raw sources")
+
+        only = args.stages.split(',') if args.stages else None
+        results = run_benchmarks(sources, documents, args.repeat, only, args.compile)
+
+    data = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.node(),
+        'toolchain': toolchain_version(),
+        'corpus': corpus,
+        'stages': results,
+    }
+    _write_json(args.output, data)
+    print(f"Results written to {args.output}")
+
+    if args.update_baseline:
+        _write_json(args.baseline, data)
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+
+    try:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    except (OSError, ValueError):
+        print(f"No baseline at {args.baseline}; record one with --update-baseline")
+        return 0
+    if baseline.get('corpus') != corpus:
+        print(f"Baseline {args.baseline} was recorded on a different corpus; not comparing")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    for message in regressions:
+        print(f"SLOWER {message}", file=sys.stderr)
+    return 1 if regressions else 0
+
+def main():
+    """Run the benchmarks or write a synthetic corpus."""
+    parser = argparse.ArgumentParser(description="Benchmark the stages of the lesson build")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="time every stage")
+    run_parser.add_argument('--synthetic', type=int, metavar='N',
+                            help="benchmark N synthetic lessons instead of the real ones")
+    run_parser.add_argument('--scale', type=int, default=1, help="synthetic lesson length multiplier")
+    run_parser.add_argument('--seed', type=int, default=0, help="synthetic corpus seed")
+    run_parser.add_argument('--repeat', type=int, default=3, help="runs per stage (default: 3)")
+    run_parser.add_argument('--stages', help="comma-separated stage name prefixes to run (e.g. rule:,unicode)")
+    run_parser.add_argument('--compile', type=int, default=2, metavar='N',
+                            help="documents compiled with pdflatex (default: 2, 0 to skip)")
+    run_parser.add_argument('--output', default=RESULTS_FILE, help=f"results file (default: {RESULTS_FILE})")
+    run_parser.add_argument('--baseline', default=BASELINE_FILE, help=f"baseline file (default: {BASELINE_FILE})")
+    run_parser.add_argument('--update-baseline', action='store_true', help="record these results as the baseline")
+    run_parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                            help=f"allowed slowdown as a fraction (default: {DEFAULT_TOLERANCE})")
+
+    corpus_parser = commands.add_parser('corpus', help="write a synthetic corpus")
+    corpus_parser.add_argument('directory')
+    corpus_parser.add_argument('--lessons', type=int, default=1000)
+    corpus_parser.add_argument('--scale', type=int, default=1)
+    corpus_parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == 'corpus':
+        paths = generate_corpus(args.directory, args.lessons, args.scale, args.seed)
+        size = sum(os.path.getsize(path) for path in paths)
+        print(f"Wrote {len(paths)} lessons ({size / 1e6:.1f} MB) to {args.directory}")
+        return 0
+    return run(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Single entry point for building the lessons
+
+Every lesson document (lesson_NN and problems_NN) goes through a graph of
+stages:
+
+    extract -> fix -> lint -> compile -> verify
+
+A stage runs only when its inputs changed since it last completed, as
+recorded in the build cache: extract when the raw source's block changed
+or the .tex is missing, fix and lint when the .tex changed, compile when
+the PDF is not built from the current source, verify when the PDF
+changed. A failed stage blocks the stages after it for that document.
+
+A .tex that exists before its raw source was ever extracted is treated
+as current (it may hold hand edits); --force re-extracts it.
+
+With --watch the build then keeps running: each burst of saves to a
+lesson's src/ or to a raw source rebuilds just the documents it feeds,
+so an edit costs about one pdflatex run.
+
+Usage:
+    build.py [--lessons 19-50,7] [--until STAGE] [--force] [--dry-run] [-j N] [--watch]
+"""
+
+import argparse
+import hashlib
+import re
+import sys
+import time
+from collections import namedtuple
+from functools import partial
+from pathlib import Path
+
+import file_watch
+import lesson_paths
+from build_cache import is_up_to_date, record_build, record_stage, stage_stamp
+from build_trace import add_trace_argument
+from compile_stage import add_jobs_argument, add_server_argument, run_lessons, run_pdflatex
+from fix_rules import PROFILES, fix_file
+from latex_log import first_error, parse_log
+from lesson_paths import add_lessons_argument
+from lint_latex import format_issues, lint_file
+from process_lessons import extract_lesson_components, prepare_latex, write_document
+from split_prompts import iter_sections, split_dump
+from verify_pdfs import check_pdf
+
+# name: the stage's name, deps: stages that must complete first,
+# stamp(doc, options): hash of the inputs or None, stale(doc, options):
+# overrides the stamp comparison, run(doc, options): (ok, note)
+Stage = namedtuple('Stage', ['name', 'deps', 'stamp', 'stale', 'run'])
+
+class Document:
+    """One .tex document of a lesson."""
+
+    def __init__(self, lesson, kind):
+        self.lesson = lesson
+        self.kind = kind
+        self.name = f"{kind}_{lesson:02d}"
+        self.tex = lesson_paths.tex_path(lesson, kind)
+        self.pdf = lesson_paths.pdf_path(lesson, kind)
+        self.raw = lesson_paths.raw_source(lesson)
+
+def _hash(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+def _file_hash(path, *extra):
+    try:
+        return _hash(path.read_bytes(), *extra)
+    except OSError:
+        return None
+
+# extract
+
+def _raw_block(doc):
+    """The document's LaTeX block in its raw source, or '' if it has none."""
+    _, theory, problems = extract_lesson_components(doc.raw)
+    return theory if doc.kind == 'lesson' else problems
+
+def _prompt_lessons():
+    """Lessons the prompt dump holds."""
+    dump = lesson_paths.prompt_dump()
+    if not dump.exists():
+        return set()
+    with open(dump, 'r', encoding='utf-8') as f:
+        return {event[1] for event in iter_sections(f) if event[0] == 'lesson'}
+
+def extract_stamp(doc, options):
+    if not doc.raw.exists():
+        return None
+    return _hash(doc.kind, _raw_block(doc))
+
+def extract_stale(doc, options):
+    if not doc.tex.exists():
+        return True
+    current = extract_stamp(doc, options)
+    recorded = stage_stamp(doc.tex, 'extract')
+    if recorded is None:
+        # Adopt a document that predates the build graph instead of
+        # overwriting edits made to it
+        if current is not None and not options.dry_run:
+            record_stage(doc.tex, 'extract', current)
+        return False
+    return current is not None and recorded != current
+
+def extract_run(doc, options):
+    if doc.raw.exists():
+        audio, _, _ = extract_lesson_components(doc.raw)
+        block = _raw_block(doc)
+        if not block:
+            return False, f"no {doc.kind} block in {doc.raw.name}"
+        write_document(doc.lesson, doc.kind, prepare_latex(block))
+        if doc.kind == 'lesson' and audio:
+            lesson_paths.script_path(doc.lesson).write_text(audio, encoding='utf-8')
+        return True, None
+    if doc.lesson in _prompt_lessons():
+        split_dump(lesson_paths.prompt_dump(), lesson_paths.root(), lessons={doc.lesson})
+        if doc.tex.exists():
+            return True, None
+    return False, "no source to extract from"
+
+# fix
+
+def fix_stamp(doc, options):
+    return _file_hash(doc.tex, options.profile)
+
+def fix_run(doc, options):
+    changed, hits = fix_file(doc.tex, PROFILES[options.profile], doc.lesson)
+    count = sum(hits.values())
+    return True, f"{count} fix{'es' if count != 1 else ''}" if changed else None
+
+# lint
+
+def lint_stamp(doc, options):
+    return _file_hash(doc.tex)
+
+def lint_run(doc, options):
+    issues = lint_file(doc.tex)
+    if issues:
+        first = format_issues(doc.tex.name, issues[:1])
+        more = f" (+{len(issues) - 1} more)" if len(issues) > 1 else ''
+        return False, first + more
+    return True, None
+
+# compile
+
+def compile_stale(doc, options):
+    return not is_up_to_date(doc.tex, doc.pdf)
+
+def compile_run(doc, options):
+    # Lint already ran as its own stage
+    result = run_pdflatex(doc.tex, check=False, pdf_path=doc.pdf)
+    if not result.ok:
+        error = first_error(parse_log(result.log))
+        return False, f"{doc.tex.name}:{error.line}: {error.message}" if error else "pdflatex failed"
+    record_build(doc.tex, doc.pdf)
+    return True, f"{result.passes} passes" if result.passes > 1 else None
+
+# verify
+
+def verify_stamp(doc, options):
+    return _file_hash(doc.pdf)
+
+def verify_run(doc, options):
+    check = check_pdf(doc.pdf)
+    if check.error is not None:
+        return False, f"{doc.pdf.name}: {check.error}"
+    return True, check.warning
+
+STAGES = [
+    Stage('extract', (), extract_stamp, extract_stale, extract_run),
+    Stage('fix', ('extract',), fix_stamp, None, fix_run),
+    Stage('lint', ('fix',), lint_stamp, None, lint_run),
+    Stage('compile', ('lint',), None, compile_stale, compile_run),
+    Stage('verify', ('compile',), verify_stamp, None, verify_run),
+]
+
+def plan(stages, until=None):
+    """The stages needed to reach `until` (all by default), dependencies first."""
+    by_name = {stage.name: stage for stage in stages}
+    ordered = []
+
+    def visit(name, path=()):
+        if name in path:
+            raise ValueError(f"stage cycle: {' -> '.join(path + (name,))}")
+        stage = by_name[name]
+        if stage in ordered:
+            return
+        for dep in stage.deps:
+            visit(dep, path + (name,))
+        ordered.append(stage)
+
+    for name in ([until] if until else by_name):
+        visit(name)
+    return ordered
+
+def is_stale(stage, doc, options):
+    if stage.stale is not None:
+        return stage.stale(doc, options)
+    recorded = stage_stamp(doc.tex, stage.name)
+    return recorded is None or recorded != stage.stamp(doc, options)
+
+def build_document(doc, stages, options):
+    """Run the stale stages of one document; return [(stage, status, note)].
+
+    status is 'ran', 'failed', 'blocked' or, with options.dry_run, 'stale'.
+    """
+    results = []
+    done = set()
+    pending = set()     # stale in a dry run, so everything after is too
+    for stage in stages:
+        if any(dep not in done for dep in stage.deps):
+            results.append((stage.name, 'blocked', None))
+            continue
+        if options.dry_run:
+            if options.force or pending.intersection(stage.deps) or is_stale(stage, doc, options):
+                pending.add(stage.name)
+                results.append((stage.name, 'stale', None))
+            done.add(stage.name)
+            continue
+        if not (options.force or is_stale(stage, doc, options)):
+            done.add(stage.name)
+            continue
+        try:
+            ok, note = stage.run(doc, options)
+        except Exception as e:
+            ok, note = False, str(e)
+        if ok:
+            done.add(stage.name)
+            stamp = stage.stamp(doc, options) if stage.stamp else None
+            if stamp is not None:
+                record_stage(doc.tex, stage.name, stamp)
+        results.append((stage.name, 'ran' if ok else 'failed', note))
+    return results
+
+def report_line(doc, results, dry_run=False):
+    """One line describing a document's stage results, and whether it failed."""
+    ran = [f"{name} ({note})" if note else name for name, status, note in results if status in ('ran', 'stale')]
+    failed = [(name, note) for name, status, note in results if status == 'failed']
+    if failed:
+        name, note = failed[0]
+        return f"{doc.name}: ✗ {name}: {note}", True
+    if ran:
+        return f"{doc.name}: {'would run' if dry_run else 'ran'} {', '.join(ran)}", False
+    return f"{doc.name}: up to date", False
+
+def build_lesson(lesson_num, stages, options):
+    """Build the documents of one lesson, printing what happened.
+
+    Returns the number of failed documents.
+    """
+    print(f"Lesson {lesson_num}:")
+    failures = 0
+    for kind in lesson_paths.DOCUMENT_KINDS:
+        doc = Document(lesson_num, kind)
+        if not doc.tex.exists() and not doc.raw.exists() and lesson_num not in _prompt_lessons():
+            print(f"  {doc.name}: no source")
+            continue
+        line, failed = report_line(doc, build_document(doc, stages, options), options.dry_run)
+        failures += failed
+        print(f"  {line}")
+    return failures
+
+def affected_documents(path, lessons):
+    """Documents a changed file feeds, among the given lessons.
+
+    A raw source feeds both documents of its lesson; a .tex feeds itself;
+    anything else in a src/ directory (a local package or figure) feeds
+    both documents next to it. A watched directory itself, which the
+    watcher reports when it dropped events, feeds every document that
+    could have changed in it.
+    """
+    path = Path(path)
+    if path == lesson_paths.raw_dir():
+        return [Document(lesson_num, kind) for lesson_num in lessons
+                if lesson_paths.raw_source(lesson_num).exists() for kind in lesson_paths.DOCUMENT_KINDS]
+    if path.parent == lesson_paths.raw_dir() and path.suffix == '.txt' and path.stem.isdigit():
+        lesson_num, kinds = int(path.stem), lesson_paths.DOCUMENT_KINDS
+    elif path.name == 'src' and re.fullmatch(r'lesson_(\d+)', path.parent.name):
+        lesson_num, kinds = int(path.parent.name[len('lesson_'):]), lesson_paths.DOCUMENT_KINDS
+    else:
+        match = re.fullmatch(r'lesson_(\d+)', path.parent.parent.name) if path.parent.name == 'src' else None
+        if match is None:
+            return []
+        lesson_num = int(match.group(1))
+        document = re.fullmatch(r'(lesson|problems)_(\d+)\.tex', path.name)
+        kinds = (document.group(1),) if document else lesson_paths.DOCUMENT_KINDS
+    if lesson_num not in lessons:
+        return []
+    return [Document(lesson_num, kind) for kind in kinds]
+
+def watch(stages, lessons, options):
+    """Rebuild the documents fed by each batch of saved files until interrupted.
+
+    Documents whose stages are all fresh stay silent, so the files the
+    build itself writes (extracted and fixed sources) do not echo.
+    """
+    directories = [lesson_paths.raw_dir()] + [lesson_paths.tex_path(n).parent for n in lessons]
+    watcher = file_watch.watcher(directories)
+    print(f"Watching {len(lessons)} lessons ({type(watcher).__name__}); Ctrl-C to stop")
+    try:
+        for changed in file_watch.batches(watcher, options.debounce):
+            seen = set()
+            for path in sorted(changed):
+                for doc in affected_documents(path, lessons):
+                    if doc.name in seen:
+                        continue
+                    seen.add(doc.name)
+                    start = time.monotonic()
+                    results = build_document(doc, stages, options)
+                    if not results:
+                        continue
+                    line, _ = report_line(doc, results)
+                    print(f"[{time.strftime('%H:%M:%S')}] {line} in {time.monotonic() - start:.1f}s", flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+    return 0
+
+def main():
+    """Build the selected lessons."""
+    parser = argparse.ArgumentParser(description="Build lessons through extract, fix, lint, compile and verify")
+    add_lessons_argument(parser)
+    parser.add_argument('--until', choices=[stage.name for stage in STAGES],
+                        help="stop after this stage (default: run every stage)")
+    parser.add_argument('--profile', default='cleanup', choices=sorted(PROFILES),
+                        help="fix rule chain (default: cleanup)")
+    parser.add_argument('--force', action='store_true', help="run the stages even if they are up to date")
+    parser.add_argument('--dry-run', action='store_true', help="only report the stages that would run")
+    parser.add_argument('--watch', action='store_true',
+                        help="after building, rebuild the documents fed by each saved file")
+    parser.add_argument('--debounce', type=float, default=0.3,
+                        help="seconds of quiet that end a burst of saves in --watch (default: 0.3)")
+    add_jobs_argument(parser)
+    add_server_argument(parser)
+    add_trace_argument(parser)
+    args = parser.parse_args()
+
+    stages = plan(STAGES, args.until)
+    lessons = lesson_paths.selected(args.lessons)
+    failures = 0
+    failed_lessons = []
+    worker = partial(build_lesson, stages=stages, options=args)
+    for lesson_num, failed, error in run_lessons(worker, lessons, args.jobs):
+        if error is not None:
+            print(f"  Error building lesson {lesson_num}: {error}")
+            failed = 1
+        if failed:
+            failures += failed
+            failed_lessons.append(lesson_num)
+
+    print(f"\n{len(lessons)} lessons, {failures} failed documents")
+    if failed_lessons:
+        print(f"Lessons needing attention: {failed_lessons}")
+    if args.watch and not args.dry_run:
+        args.force = False
+        return watch(stages, lessons, args)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
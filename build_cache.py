@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Content-hash build cache deciding whether a lesson PDF is up to date
+
+A PDF is fresh when it exists and was built from exactly the current .tex
+source, the local files that source pulls in, and the same TeX toolchain.
+File timestamps are never consulted, so a checkout or `touch` does not
+trigger a rebuild while any edit does.
+
+Usage:
+    build_cache.py stale TEX...        print the sources whose PDF is stale
+    build_cache.py record TEX [PDF]    record a successful build
+    build_cache.py clear               forget every recorded build
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+CACHE_DIR = Path(__file__).resolve().parent / '.build_cache'
+
+# Commands whose argument names a local file the document depends on
+INPUT_PATTERN = re.compile(
+    r'\\(input|include|usepackage|documentclass|includegraphics)\s*(?:\[[^\]]*\])?\s*\{([^}]+)\}'
+)
+INPUT_EXTENSIONS = {
+    'input': ['', '.tex'],
+    'include': ['.tex'],
+    'usepackage': ['.sty'],
+    'documentclass': ['.cls'],
+    'includegraphics': ['', '.pdf', '.png', '.jpg'],
+}
+
+_toolchain_version = None
+
+def _hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+def _write_json(path, data):
+    """Write JSON atomically so parallel workers never see a partial file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=1)
+    os.replace(tmp, path)
+
+def _read_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def toolchain_version():
+    """Return the pdflatex version banner.
+
+    The banner is memoized on disk against the binary's path, size and
+    mtime so checking freshness does not spawn pdflatex every time.
+    """
+    global _toolchain_version
+    if _toolchain_version is not None:
+        return _toolchain_version
+
+    binary = shutil.which('pdflatex')
+    if binary is None:
+        _toolchain_version = 'pdflatex-not-found'
+        return _toolchain_version
+
+    stat = os.stat(binary)
+    stamp = f"{binary}:{stat.st_size}:{stat.st_mtime_ns}"
+    memo_file = CACHE_DIR / 'toolchain.json'
+    memo = _read_json(memo_file)
+    if memo and memo.get('stamp') == stamp:
+        _toolchain_version = memo['version']
+        return _toolchain_version
+
+    try:
+        result = subprocess.run([binary, '--version'], capture_output=True,
+                                text=True, errors='replace', timeout=30)
+        version = result.stdout.splitlines()[0] if result.stdout else 'unknown'
+    except Exception:
+        version = 'unknown'
+    _write_json(memo_file, {'stamp': stamp, 'version': version})
+    _toolchain_version = version
+    return version
+
+def find_inputs(tex_path, content=None, _seen=None):
+    """Return the local files a .tex source pulls in, following nested \\input."""
+    tex_path = Path(tex_path)
+    if _seen is None:
+        _seen = set()
+    if content is None:
+        content = tex_path.read_text(encoding='utf-8', errors='replace')
+
+    inputs = []
+    for match in INPUT_PATTERN.finditer(content):
+        command, names = match.groups()
+        for name in names.split(','):
+            name = name.strip()
+            if not name:
+                continue
+            for ext in INPUT_EXTENSIONS[command]:
+                candidate = tex_path.parent / f"{name}{ext}"
+                if candidate.is_file():
+                    resolved = candidate.resolve()
+                    if resolved not in _seen:
+                        _seen.add(resolved)
+                        inputs.append(resolved)
+                        if resolved.suffix in ('.tex', '.sty', '.cls'):
+                            inputs.extend(find_inputs(resolved, _seen=_seen))
+                    break
+    return inputs
+
+def source_key(tex_path, extra=''):
+    """Hash of the source, its local inputs and the TeX toolchain version."""
+    tex_path = Path(tex_path)
+    data = tex_path.read_bytes()
+    digest = hashlib.sha256()
+    digest.update(toolchain_version().encode('utf-8'))
+    digest.update(b'\0' + extra.encode('utf-8'))
+    digest.update(b'\0' + data)
+    content = data.decode('utf-8', errors='replace')
+    for path in find_inputs(tex_path, content):
+        digest.update(b'\0' + str(path).encode('utf-8'))
+        digest.update(b'\0' + _hash_bytes(path.read_bytes()).encode('ascii'))
+    return digest.hexdigest()
+
+def default_pdf_path(tex_path):
+    """PDF location for a source: lesson_XX/src/name.tex -> lesson_XX/name.pdf."""
+    tex_path = Path(tex_path)
+    out_dir = tex_path.parent.parent if tex_path.parent.name == 'src' else tex_path.parent
+    return out_dir / f"{tex_path.stem}.pdf"
+
+def _entry_path(tex_path):
+    name = hashlib.sha1(str(Path(tex_path).resolve()).encode('utf-8')).hexdigest()
+    return CACHE_DIR / 'entries' / f"{name}.json"
+
+def is_up_to_date(tex_path, pdf_path=None, extra=''):
+    """True if pdf_path was built from the current contents of tex_path."""
+    pdf_path = Path(pdf_path) if pdf_path else default_pdf_path(tex_path)
+    entry = _read_json(_entry_path(tex_path))
+    if not entry or not pdf_path.exists():
+        return False
+    if entry.get('pdf_size') != pdf_path.stat().st_size:
+        return False
+    return entry.get('key') == source_key(tex_path, extra)
+
+def note_compile(tex_path, **details):
+    """Remember details of the latest compile (such as its pass count).
+
+    record_build() stores them with the build, so they reach the cache
+    entry even when the build is recorded by a separate process.
+    """
+    path = _entry_path(tex_path)
+    entry = _read_json(path) or {'source': str(Path(tex_path).resolve())}
+    entry['last_compile'] = details
+    _write_json(path, entry)
+
+def record_build(tex_path, pdf_path=None, extra='', **details):
+    """Remember that pdf_path is now built from the current tex_path."""
+    pdf_path = Path(pdf_path) if pdf_path else default_pdf_path(tex_path)
+    previous = _read_json(_entry_path(tex_path)) or {}
+    entry = {
+        'source': str(Path(tex_path).resolve()),
+        'key': source_key(tex_path, extra),
+        'pdf': str(pdf_path.resolve()),
+        'pdf_size': pdf_path.stat().st_size,
+    }
+    entry.update(previous.get('last_compile', {}))
+    entry.update(details)
+    if 'stages' in previous:
+        entry['stages'] = previous['stages']
+    _write_json(_entry_path(tex_path), entry)
+
+def stage_stamp(tex_path, stage):
+    """Stamp recorded when a build stage last completed for a source, or None."""
+    entry = _read_json(_entry_path(tex_path)) or {}
+    return entry.get('stages', {}).get(stage)
+
+def record_stage(tex_path, stage, stamp):
+    """Remember the stamp (typically an input hash) a build stage completed with."""
+    path = _entry_path(tex_path)
+    entry = _read_json(path) or {'source': str(Path(tex_path).resolve())}
+    entry.setdefault('stages', {})[stage] = stamp
+    _write_json(path, entry)
+
+def lookup(tex_path):
+    """Return the recorded build entry for a source, or None."""
+    return _read_json(_entry_path(tex_path))
+
+def clear():
+    """Forget every recorded build."""
+    shutil.rmtree(CACHE_DIR / 'entries', ignore_errors=True)
+
+def main():
+    """Command line interface used by the shell scripts."""
+    if len(sys.argv) < 2:
+        print(__doc__.strip())
+        return 2
+
+    command, args = sys.argv[1], sys.argv[2:]
+    if command == 'stale':
+        for tex in args:
+            if not is_up_to_date(tex):
+                print(tex)
+        return 0
+    if command == 'record' and args:
+        record_build(args[0], args[1] if len(args) > 1 else None)
+        return 0
+    if command == 'clear':
+        clear()
+        return 0
+
+    print(__doc__.strip())
+    return 2
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Structured timing trace of the build stages
+
+With ODE_TRACE_FILE set (or --trace FILE), every stage appends one JSON
+line per unit of work: extraction of a raw source, each fix rule on each
+document, lint, figure externalization, each pdflatex pass (wall time,
+exit code, pages and output size) and the publish of the PDF. Lines are
+appended with a single write each, so parallel workers can share a file.
+
+    {"ts": 1760000000.1, "pid": 4242, "stage": "pdflatex", "seconds": 1.92,
+     "tex": "lesson_32/src/lesson_32.tex", "run": 1, "returncode": 0,
+     "pages": 14, "bytes": 301233}
+
+Usage:
+    build_trace.py report [FILE] [--top N]
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import re
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+TRACE_ENV = 'ODE_TRACE_FILE'
+
+# Fields naming the document an event belongs to, in order of preference
+DOCUMENT_FIELDS = ('tex', 'path', 'source')
+
+# Document names of a lesson: its theory and problems documents and its raw source
+LESSON_NAME = re.compile(r'(?:lesson|problems)_(\d+)|(\d+)')
+
+# Source names of figure builds: the figure's cache key
+FIGURE_BUILD = re.compile(r'[0-9a-f]{24}')
+
+def trace_file():
+    """Path events are appended to, or None when tracing is off."""
+    return os.environ.get(TRACE_ENV) or None
+
+def enabled():
+    return trace_file() is not None
+
+def emit(stage, **fields):
+    """Append one event to the trace file, if tracing is on."""
+    path = trace_file()
+    if path is None:
+        return
+    event = {'ts': round(time.time(), 3), 'pid': os.getpid(), 'stage': stage}
+    event.update(fields)
+    line = json.dumps(event, default=str) + '\n'
+    # One O_APPEND write per event keeps lines from parallel workers whole
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    try:
+        os.write(fd, line.encode('utf-8'))
+    finally:
+        os.close(fd)
+
+@contextlib.contextmanager
+def span(stage, **fields):
+    """Time the enclosed block and emit it as one event.
+
+    Yields the event's field dict, so the block can add results such as
+    exit codes or sizes. An exception is recorded and re-raised.
+    """
+    if not enabled():
+        yield fields
+        return
+    start = time.perf_counter()
+    try:
+        yield fields
+    except BaseException as e:
+        fields['error'] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        emit(stage, seconds=round(time.perf_counter() - start, 6), **fields)
+
+class _EnableTrace(argparse.Action):
+    def __call__(self, parser, namespace, values, option_string=None):
+        path = str(Path(values).resolve())
+        setattr(namespace, self.dest, path)
+        # Set in the environment so pool workers trace too; the compile
+        # server is a separate process and traces only if it was started
+        # with ODE_TRACE_FILE set
+        os.environ[TRACE_ENV] = path
+
+def add_trace_argument(parser):
+    """Add the shared --trace option to an argparse parser."""
+    parser.add_argument(
+        '--trace',
+        metavar='FILE',
+        action=_EnableTrace,
+        help=f"append timing events to a JSONL file (same as {TRACE_ENV}=FILE)"
+    )
+
+def read_events(path):
+    """Yield the events in a trace file, skipping lines cut short."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+def lesson_of(event):
+    """Lesson a traced event belongs to, like 'lesson_32', for either of its documents.
+
+    Builds of cached TikZ figures belong to no lesson: their time is
+    already part of the externalize event of the document using them.
+    """
+    for field in DOCUMENT_FIELDS:
+        if event.get(field):
+            name = Path(event[field]).stem
+            if FIGURE_BUILD.fullmatch(name):
+                return None
+            match = LESSON_NAME.fullmatch(name)
+            if match:
+                return f"lesson_{int(match.group(1) or match.group(2)):02d}"
+            return name
+    return None
+
+def summarize(events):
+    """Aggregate events into total seconds per stage, lesson and fix rule.
+
+    Returns (stages, lessons, rules). stages maps a stage name to
+    [count, total seconds, max seconds]; lessons and rules map to total
+    seconds.
+    """
+    stages = defaultdict(lambda: [0, 0.0, 0.0])
+    lessons = defaultdict(float)
+    rules = defaultdict(float)
+    for event in events:
+        seconds = event.get('seconds')
+        if seconds is None:
+            continue
+        stage = stages[event['stage']]
+        stage[0] += 1
+        stage[1] += seconds
+        stage[2] = max(stage[2], seconds)
+        lesson = lesson_of(event)
+        if lesson is not None:
+            lessons[lesson] += seconds
+        if event['stage'] == 'fix' and event.get('rule'):
+            rules[event['rule']] += seconds
+    return dict(stages), dict(lessons), dict(rules)
+
+def report(path, top=10):
+    """Print time per stage and the slowest lessons and rules."""
+    stages, lessons, rules = summarize(read_events(path))
+    if not stages:
+        print(f"No timed events in {path}")
+        return
+
+    print(f"{'stage':16} {'count':>7} {'total s':>10} {'mean ms':>10} {'max ms':>10}")
+    for name, (count, total, longest) in sorted(stages.items(), key=lambda item: -item[1][1]):
+        print(f"{name:16} {count:7} {total:10.2f} {total / count * 1000:10.1f} {longest * 1000:10.1f}")
+
+    for title, totals in (("Slowest lessons", lessons), ("Slowest rules", rules)):
+        if not totals:
+            continue
+        print(f"\n{title}:")
+        for name, total in sorted(totals.items(), key=lambda item: -item[1])[:top]:
+            print(f"  {name:40} {total:8.2f} s")
+
+def main():
+    """Summarize a trace file."""
+    parser = argparse.ArgumentParser(description="Summarize build timing traces")
+    commands = parser.add_subparsers(dest='command', required=True)
+    report_parser = commands.add_parser('report', help="time per stage, slowest lessons and rules")
+    report_parser.add_argument('file', nargs='?', default=os.environ.get(TRACE_ENV),
+                               help=f"trace file (default: ${TRACE_ENV})")
+    report_parser.add_argument('--top', type=int, default=10, help="lessons and rules listed (default: 10)")
+    args = parser.parse_args()
+
+    if not args.file:
+        parser.error(f"no trace file given and {TRACE_ENV} is not set")
+    try:
+        report(args.file, args.top)
+    except OSError as e:
+        print(f"Cannot read {args.file}: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
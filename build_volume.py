@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+Whole-course volumes typeset in one TeX run with \\include/\\includeonly
+
+All theory documents go into one master document (course_notes.pdf) and
+all problem sets into another (problem_sets.pdf). The master carries one
+merged preamble: packages with their options united, libraries and
+\\geometry once. Each lesson is one \\include'd chapter whose own
+definitions (\\newtheorem, \\newmdenv, \\newcommand, \\title, ...) sit
+in a group, so lessons cannot clash.
+
+Chapter files are rewritten only when their content changes, and the
+chapter .aux files stay in the build directory between runs. When only
+some chapters changed and the preamble did not, the master is run with
+\\includeonly on those chapters; the kept .aux files supply the numbering
+of the others. The new pages are then spliced into the previous volume
+with pdfpages, so one edited lesson re-typesets one chapter. A chapter
+whose page count changed also re-typesets the chapters after it, which
+is what their page numbers require; so does adding, leaving out or
+moving a lesson. Only a change to the merged preamble typesets the
+whole volume again.
+
+Usage:
+    build_volume.py [--kind lesson|problems] [--lessons SPEC] [--full]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+from collections import OrderedDict
+
+import compile_stage
+import lesson_paths
+import tikz_externalize
+from build_cache import CACHE_DIR
+from latex_log import first_error, parse_log
+from lesson_paths import add_lessons_argument
+from lint_latex import lint
+
+VOLUME_DIR = CACHE_DIR / 'volume'
+
+# Document kind -> name of its volume
+VOLUMES = {'lesson': 'course_notes', 'problems': 'problem_sets'}
+
+PACKAGE = re.compile(r'\\(?:usepackage|RequirePackage)\s*(?:\[([^\]]*)\])?\s*\{([^}]*)\}\s*$', re.DOTALL)
+
+# Preamble statements that cannot run inside a chapter; they go to the
+# master once, deduplicated by their text
+MASTER_ONLY = ('usetikzlibrary', 'usepgfplotslibrary', 'tcbuselibrary', 'geometry')
+
+# Preamble commands that only work before \begin{document}, deduplicated
+# by the command they define
+MASTER_DEFINITIONS = ('DeclareMathOperator',)
+
+# Restores what \maketitle disables after its first use, resets the
+# per-lesson counters and records the physical page each chapter starts on.
+# \newtheorem defines globally, so each chapter's theorems first forget
+# the previous chapter's ones of the same name.
+VOLUME_MACROS = r"""\makeatletter
+\def\volume@forget#1{%
+  \global\expandafter\let\csname #1\endcsname\@undefined
+  \global\expandafter\let\csname end#1\endcsname\@undefined
+  \global\expandafter\let\csname c@#1\endcsname\@undefined}
+\let\volume@newtheorem\newtheorem
+\def\volume@theorem#1#2{\volume@forget{#2}#1{#2}}
+\def\newtheorem{\@ifstar{\volume@theorem{\volume@newtheorem*}}{\volume@theorem\volume@newtheorem}}
+\let\volume@maketitle\maketitle
+\let\volume@title\title
+\let\volume@author\author
+\let\volume@date\date
+\let\volume@thanks\thanks
+\let\volume@and\and
+\newcount\volume@shipped
+\AddToHook{shipout/before}{\global\advance\volume@shipped\@ne}
+\newwrite\volume@pages
+\immediate\openout\volume@pages=\jobname.pages\relax
+\newcommand\volumechapter[1]{%
+  \global\let\maketitle\volume@maketitle
+  \global\let\title\volume@title
+  \global\let\author\volume@author
+  \global\let\date\volume@date
+  \global\let\thanks\volume@thanks
+  \global\let\and\volume@and
+  \setcounter{section}{0}\setcounter{equation}{0}\setcounter{footnote}{0}%
+  \write\volume@pages{#1 \the\volume@shipped}}
+\makeatother
+"""
+
+def split_document(content):
+    """(preamble, body) of a standalone document, or None if it has no body."""
+    begin = content.find('\\begin{document}')
+    end = content.rfind('\\end{document}')
+    if begin < 0 or end < begin:
+        return None
+    return content[:begin], content[begin + len('\\begin{document}'):end]
+
+def statements(preamble):
+    """Split a preamble into brace-balanced statements, dropping comments and blank lines."""
+    pending = []
+    depth = 0
+    for line in preamble.splitlines():
+        code = re.sub(r'(?<!\\)%.*', '', line)
+        if not code.strip() and not pending:
+            continue
+        pending.append(code.rstrip())
+        depth += code.count('{') - code.count('}')
+        if depth <= 0:
+            yield '\n'.join(pending).strip()
+            pending = []
+            depth = 0
+    if pending:
+        yield '\n'.join(pending).strip()
+
+def _command(statement):
+    match = re.match(r'\\([A-Za-z@]+)', statement)
+    return match.group(1) if match else None
+
+def merge_preambles(preambles):
+    """Merge standalone preambles into a master preamble and per-chapter prologues.
+
+    Returns (master preamble, [prologue for each preamble]).
+    """
+    document_class = None
+    packages = OrderedDict()    # name -> options, in first-use order
+    master_lines = []
+    definitions = {}
+    prologues = []
+    for preamble in preambles:
+        prologue = []
+        for statement in statements(preamble):
+            command = _command(statement)
+            package = PACKAGE.match(statement)
+            if command == 'documentclass':
+                document_class = document_class or statement
+            elif package:
+                options = [o.strip() for o in (package.group(1) or '').split(',') if o.strip()]
+                for name in package.group(2).split(','):
+                    merged = packages.setdefault(name.strip(), [])
+                    merged.extend(option for option in options if option not in merged)
+            elif command in MASTER_ONLY:
+                if statement not in master_lines:
+                    master_lines.append(statement)
+            elif command in MASTER_DEFINITIONS:
+                name = re.match(r'\\[A-Za-z]+\*?\s*\{?\\?([A-Za-z]+)', statement)
+                definitions.setdefault(name.group(1) if name else statement, statement)
+            else:
+                prologue.append(statement)
+        prologues.append('\n'.join(prologue))
+
+    lines = [document_class or '\\documentclass{article}']
+    for name, options in packages.items():
+        lines.append(f"\\usepackage[{','.join(options)}]{{{name}}}" if options else f"\\usepackage{{{name}}}")
+    lines += master_lines
+    lines += definitions.values()
+    return '\n'.join(lines) + '\n', prologues
+
+def chapter_text(name, source, prologue, body):
+    """Contents of the \\include'd file for one lesson."""
+    return (f"% Generated from {source}\n"
+            f"\\volumechapter{{{name}}}\n"
+            f"\\begingroup\n{prologue}\n{body}\n\\endgroup\n")
+
+def master_text(preamble, chapters, only=None):
+    """The master document including every chapter, typesetting only `only` if given."""
+    lines = [preamble, VOLUME_MACROS]
+    if only is not None:
+        lines.append(f"\\includeonly{{{','.join(only)}}}\n")
+    lines.append('\\begin{document}\n')
+    lines += [f"\\include{{{name}}}\n" for name in chapters]
+    lines.append('\\end{document}\n')
+    return ''.join(lines)
+
+def _hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def _write_if_changed(path, text):
+    """Write text unless the file already holds it; True if it was written."""
+    try:
+        if path.read_text(encoding='utf-8') == text:
+            return False
+    except OSError:
+        pass
+    path.write_text(text, encoding='utf-8')
+    return True
+
+def _read_state(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _write_state(path, state):
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=1)
+    os.replace(tmp, path)
+
+def page_ranges(master, result):
+    """Physical page range of each chapter a run typeset, or None if unknown."""
+    pages_file = compile_stage.build_dir_for(master) / f"{master.stem}.pages"
+    written = compile_stage.OUTPUT_WRITTEN.search(result.log)
+    try:
+        lines = pages_file.read_text(encoding='utf-8').split('\n')
+    except OSError:
+        return None
+    if written is None:
+        return None
+    starts = []
+    for line in lines:
+        parts = line.split()
+        if len(parts) == 2 and parts[1].isdigit():
+            starts.append((parts[0], int(parts[1])))
+    total = int(written.group(1))
+    ranges = {}
+    for (name, start), following in zip(starts, starts[1:] + [(None, total + 1)]):
+        ranges[name] = [start, following[1] - 1]
+    return ranges
+
+def splice(volume_dir, chapters, old_ranges, new_ranges, report=print):
+    """Assemble book.pdf from its old pages and the re-typeset chapters in partial.pdf.
+
+    Returns the page ranges of the assembled book, or None on failure.
+    """
+    lines = ['\\documentclass{article}\n', '\\usepackage{pdfpages}\n', '\\begin{document}\n']
+    ranges = {}
+    page = 1
+    for name in chapters:
+        source, (first, last) = ('partial.pdf', new_ranges[name]) if name in new_ranges else ('book.pdf', old_ranges[name])
+        if last >= first:
+            lines.append(f"\\includepdf[pages={{{first}-{last}}}]{{{source}}}\n")
+        ranges[name] = [page, page + last - first]
+        page += last - first + 1
+    lines.append('\\end{document}\n')
+
+    assemble = volume_dir / 'assemble.tex'
+    assemble.write_text(''.join(lines), encoding='utf-8')
+    result = compile_stage.run_pdflatex(assemble, timeout=300, check=False, local=True, use_format=False,
+                                        externalize=False, note_passes=False,
+                                        pdf_path=volume_dir / 'assembled.pdf')
+    if not result.ok:
+        report(f"  Splicing failed; {first_error(parse_log(result.log)) or 'see the log'}")
+        return None
+    os.replace(volume_dir / 'assembled.pdf', volume_dir / 'book.pdf')
+    return ranges
+
+def build_volume(kind, lessons, full=False, timeout=600, report=print):
+    """Build or update the volume of one document kind; return its PDF path or None."""
+    volume = VOLUMES[kind]
+    volume_dir = VOLUME_DIR / kind
+    volume_dir.mkdir(parents=True, exist_ok=True)
+    master = volume_dir / f"{volume}.tex"
+    book = volume_dir / 'book.pdf'
+    state_file = volume_dir / 'state.json'
+    state = _read_state(state_file)
+
+    # Read every lesson, leaving out the ones the linter rejects
+    names, sources, preambles, bodies = [], [], [], []
+    for lesson_num in lessons:
+        tex = lesson_paths.tex_path(lesson_num, kind)
+        if not tex.exists():
+            continue
+        content = tex.read_text(encoding='utf-8', errors='replace')
+        parts = split_document(content)
+        if parts is None or lint(content):
+            report(f"  Leaving out {tex.name}: it does not lint cleanly")
+            continue
+        name = tex.stem
+        # Figures resolve relative to the volume directory, where the chapter lives
+        content, _ = tikz_externalize.externalize(volume_dir / f"{name}.tex", content)
+        preamble, body = split_document(content)
+        names.append(name)
+        sources.append(os.path.relpath(tex, lesson_paths.root()))
+        preambles.append(preamble)
+        bodies.append(body)
+    if not names:
+        report(f"  No {kind} documents to bind")
+        return None
+
+    preamble, prologues = merge_preambles(preambles)
+    hashes = {}
+    for name, source, prologue, body in zip(names, sources, prologues, bodies):
+        text = chapter_text(name, source, prologue, body)
+        _write_if_changed(volume_dir / f"{name}.tex", text)
+        hashes[name] = _hash(text)
+
+    build_dir = compile_stage.build_dir_for(master)
+    old_names = state.get('chapters', [])
+    # A chapter is typeset again when its text changed, or when the chapters
+    # before it are not the ones it followed last time (a lesson was added,
+    # left out or moved), which moves its pages
+    changed = [name for index, name in enumerate(names)
+               if state.get('hashes', {}).get(name) != hashes[name] or name not in old_names
+               or old_names[:old_names.index(name)] != names[:index]]
+    rebuild_all = (full or not book.exists() or state.get('preamble') != _hash(preamble)
+                   or 'ranges' not in state
+                   or any(not (build_dir / f"{name}.aux").exists() for name in names if name not in changed))
+
+    target = lesson_paths.root() / f"{volume}.pdf"
+    if not rebuild_all and not changed and names == old_names:
+        report(f"  {volume}: up to date ({len(names)} chapters)")
+        if target.exists():
+            return target
+    elif rebuild_all:
+        report(f"  {volume}: typesetting all {len(names)} chapters")
+        _write_if_changed(master, master_text(preamble, names))
+        result = compile_stage.run_pdflatex(master, timeout=timeout, check=False, local=True,
+                                            externalize=False, note_passes=False, pdf_path=book)
+        ranges = page_ranges(master, result) if result.ok else None
+        if not result.ok:
+            error = first_error(parse_log(result.log))
+            report(f"  {volume}: failed" + (f" at {error.file or master.name}:{error.line}: {error.message}" if error else ''))
+            return None
+        state = {'preamble': _hash(preamble), 'chapters': names, 'hashes': hashes}
+        if ranges is not None:
+            state['ranges'] = ranges
+    else:
+        ranges = state['ranges']
+        new_ranges = {}
+        only = list(changed)
+        # Only dropping the last lessons leaves nothing to typeset
+        while only:
+            report(f"  {volume}: typesetting {', '.join(only)}")
+            _write_if_changed(master, master_text(preamble, names, only))
+            result = compile_stage.run_pdflatex(master, timeout=timeout, check=False, local=True,
+                                                externalize=False, note_passes=False,
+                                                pdf_path=volume_dir / 'partial.pdf')
+            new_ranges = page_ranges(master, result) if result.ok else None
+            if new_ranges is None or set(new_ranges) != set(only):
+                report(f"  {volume}: partial run failed; rerun with --full")
+                return None
+            # A chapter that grew or shrank moves the page numbers of the ones after it
+            moved = next((names.index(name) for name in names if name in new_ranges and name in ranges
+                          and new_ranges[name][1] - new_ranges[name][0] != ranges[name][1] - ranges[name][0]), None)
+            later = [name for name in names[moved + 1:] if name not in only] if moved is not None else []
+            if not later:
+                break
+            only = [name for name in names if name in only or name in later]
+
+        ranges = splice(volume_dir, names, ranges, new_ranges, report)
+        if ranges is None:
+            return None
+        state = dict(state, chapters=names, hashes=hashes, ranges=ranges)
+
+    _write_state(state_file, state)
+    staging = volume_dir / f"{volume}.publish.pdf"
+    shutil.copyfile(book, staging)
+    compile_stage.publish(staging, target)
+    return target
+
+def main():
+    """Bind the lessons into volumes."""
+    parser = argparse.ArgumentParser(description="Typeset all lessons into course volumes")
+    parser.add_argument('--kind', choices=sorted(VOLUMES), help="only this volume (default: both)")
+    add_lessons_argument(parser)
+    parser.add_argument('--full', action='store_true', help="typeset every chapter again")
+    args = parser.parse_args()
+
+    lessons = lesson_paths.selected(args.lessons)
+    failed = 0
+    for kind in ([args.kind] if args.kind else list(VOLUMES)):
+        print(f"Building {VOLUMES[kind]}...")
+        target = build_volume(kind, lessons, args.full)
+        if target is None:
+            failed += 1
+        else:
+            print(f"  Published {target}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,60 +1,60 @@
 #!/bin/bash
 
-# Compile all missing PDFs for lessons 19-50
+# Compile all missing PDFs, for every lesson or the lessons a spec such as
+# 19-50,7 selects:  compile_all_pdfs.sh [SPEC]
 
-echo "Compiling PDFs for lessons 19-50..."
+# Work from the checkout this script lives in
+cd "$(dirname "$0")" || exit 1
+
+spec="$1"
+echo "Compiling PDFs for ${spec:+lessons }${spec:-every lesson}..."
 echo "=================================="
 
 successful=0
 failed=0
 
-for i in {19..50}; do
-    lesson_dir="lesson_${i}"
+# Lesson numbers come from lesson_paths, which knows the lesson directories
+# (lesson_07, lesson_19, ...) and the raw sources of lessons not yet extracted
+lessons=$(python3 lesson_paths.py $spec | awk '{print $1}')
+lesson_root=$(python3 -c 'import lesson_paths; print(lesson_paths.root())')
+
+sources=()
+for i in $lessons; do
+    n=$(printf '%02d' "$i")
+    sources+=("$lesson_root/lesson_$n/src/lesson_$n.tex" "$lesson_root/lesson_$n/src/problems_$n.tex")
+done
+
+# Ask the content-hash build cache which sources changed since their last build
+stale=$(python3 build_cache.py stale "${sources[@]}")
+
+# compile_doc <lesson_dir> <name> <tag> <separator>
+compile_doc() {
+    local tex="$1/src/$2.tex"
+    if [ ! -f "$tex" ]; then
+        echo -n "[$3-]$4"
+    elif ! grep -qxF "$tex" <<< "$stale"; then
+        echo -n "[$3✓]$4"
+    else
+        # Builds in .build/ and publishes the PDF into $1/ only on success
+        if python3 compile_stage.py "$tex" > /dev/null 2>&1; then
+            python3 build_cache.py record "$tex"
+            echo -n "[$3✓]$4"
+            ((successful++))
+        else
+            echo -n "[$3✗]$4"
+            ((failed++))
+        fi
+    fi
+}
+
+for i in $lessons; do
+    n=$(printf '%02d' "$i")
+    lesson_dir="$lesson_root/lesson_$n"
     
     if [ -d "$lesson_dir" ]; then
         echo -n "Lesson $i: "
-        
-        # Check if lesson PDF exists, if not compile it
-        if [ ! -f "$lesson_dir/lesson_${i}.pdf" ]; then
-            if [ -f "$lesson_dir/src/lesson_${i}.tex" ]; then
-                cd "$lesson_dir/src"
-                pdflatex -interaction=nonstopmode lesson_${i}.tex > /dev/null 2>&1
-                if [ -f "lesson_${i}.pdf" ]; then
-                    mv lesson_${i}.pdf ../
-                    echo -n "[L✓] "
-                    ((successful++))
-                else
-                    echo -n "[L✗] "
-                    ((failed++))
-                fi
-                cd ../..
-            else
-                echo -n "[L-] "
-            fi
-        else
-            echo -n "[L✓] "
-        fi
-        
-        # Check if problems PDF exists, if not compile it
-        if [ ! -f "$lesson_dir/problems_${i}.pdf" ]; then
-            if [ -f "$lesson_dir/src/problems_${i}.tex" ]; then
-                cd "$lesson_dir/src"
-                pdflatex -interaction=nonstopmode problems_${i}.tex > /dev/null 2>&1
-                if [ -f "problems_${i}.pdf" ]; then
-                    mv problems_${i}.pdf ../
-                    echo "[P✓]"
-                    ((successful++))
-                else
-                    echo "[P✗]"
-                    ((failed++))
-                fi
-                cd ../..
-            else
-                echo "[P-]"
-            fi
-        else
-            echo "[P✓]"
-        fi
+        compile_doc "$lesson_dir" "lesson_$n" L " "
+        compile_doc "$lesson_dir" "problems_$n" P $'\n'
     fi
 done
 
@@ -65,25 +65,5 @@ echo "Successful: $successful"
 echo "Failed: $failed"
 echo ""
 
-# Count total PDFs
-total_pdfs=$(find . -name "*.pdf" -type f | wc -l)
-echo "Total PDFs in project: $total_pdfs"
-
-# Show which lessons are missing PDFs
-echo ""
-echo "Missing PDFs:"
-for i in {19..50}; do
-    lesson_dir="lesson_${i}"
-    if [ -d "$lesson_dir" ]; then
-        missing=""
-        if [ ! -f "$lesson_dir/lesson_${i}.pdf" ]; then
-            missing="lesson "
-        fi
-        if [ ! -f "$lesson_dir/problems_${i}.pdf" ]; then
-            missing="${missing}problems"
-        fi
-        if [ -n "$missing" ]; then
-            echo "  Lesson $i: $missing"
-        fi
-    fi
-done
\ No newline at end of file
+# Missing, truncated or suspiciously short PDFs, and the valid total
+python3 verify_pdfs.py ${spec:+--lessons "$spec"}
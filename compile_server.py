@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+Local compile server: one queue of pdflatex jobs shared by every script
+
+The server listens on a Unix socket under .build_cache and speaks JSON
+lines. A request
+
+    {"op": "compile", "id": 1, "tex": "/abs/lesson_32.tex",
+     "priority": "interactive", "use_format": true, "check": true, "fix": false,
+     "pdf": "/abs/lesson_32.pdf"}
+
+is answered with a stream of events carrying the same id:
+
+    {"id": 1, "event": "queued", "coalesced": false, "position": 0}
+    {"id": 1, "event": "started"}
+    {"id": 1, "event": "message", "text": "Fixed lesson_32.tex line 4: ..."}
+    {"id": 1, "event": "finished", "ok": true, "log": "...", "passes": 2}
+
+Requests for a document that is already queued join that job instead of
+compiling it again; an interactive request also moves it ahead of the
+batch jobs. At most --max-jobs TeX processes run at once. The scripts use
+the server when ODE_COMPILE_SERVER is set (or --server is given) and it
+is running, and compile in-process otherwise.
+
+Usage:
+    compile_server.py serve [--max-jobs N]
+    compile_server.py compile TEX... [--batch] [--fix]
+    compile_server.py status
+    compile_server.py stop
+"""
+
+import argparse
+import asyncio
+import functools
+import itertools
+import json
+import os
+import socket
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import compile_stage
+from build_cache import CACHE_DIR
+from compile_stage import CompileResult
+
+SOCKET_PATH = CACHE_DIR / 'compile.sock'
+
+PRIORITIES = {'interactive': 0, 'batch': 1}
+
+class Job:
+    """One compile of one document, shared by every request that asked for it."""
+
+    def __init__(self, key, request):
+        self.key = key
+        self.tex = key[0]
+        self.use_format, self.check, self.fix, self.pdf_path = key[1:]
+        self.timeout = request.get('timeout', 30)
+        self.max_passes = request.get('max_passes', compile_stage.MAX_PASSES)
+        self.rank = PRIORITIES.get(request.get('priority'), PRIORITIES['batch'])
+        self.state = 'queued'
+        self.subscribers = []   # (send coroutine function, request id)
+        self.started_stat = None
+
+    async def emit(self, event):
+        for send, request_id in list(self.subscribers):
+            await send(dict(event, id=request_id))
+
+def _stat(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+class CompileServer:
+    def __init__(self, max_jobs):
+        self.max_jobs = max_jobs
+        self.queue = asyncio.PriorityQueue()
+        self.order = itertools.count()
+        self.queued = {}    # key -> Job waiting to start
+        self.running = {}   # key -> Job compiling now
+        self.busy = set()   # tex paths with a job compiling now
+        self.parked = {}    # tex path -> Jobs dequeued while it was busy
+        self.executor = ThreadPoolExecutor(max_workers=max_jobs)
+        self.stopping = asyncio.Event()
+        self.completed = 0
+        self.coalesced = 0
+
+    def submit(self, request, send):
+        """Queue a compile request, joining an existing job when possible."""
+        tex = str(Path(request['tex']).resolve())
+        key = (tex, bool(request.get('use_format', True)), bool(request.get('check', True)),
+               bool(request.get('fix', False)), request.get('pdf'))
+        rank = PRIORITIES.get(request.get('priority'), PRIORITIES['batch'])
+
+        job = self.queued.get(key)
+        if job is None:
+            running = self.running.get(key)
+            # A running job only serves the request if the source has not
+            # changed since it started
+            if running is not None and running.started_stat == _stat(tex):
+                job = running
+        coalesced = job is not None
+
+        if job is None:
+            job = Job(key, request)
+            self.queued[key] = job
+            self.queue.put_nowait((job.rank, next(self.order), job))
+        elif job.state == 'queued' and rank < job.rank:
+            # Re-queue at the higher priority; the old entry is skipped
+            job.rank = rank
+            self.queue.put_nowait((job.rank, next(self.order), job))
+        if coalesced:
+            self.coalesced += 1
+
+        job.subscribers.append((send, request.get('id')))
+        return job, coalesced
+
+    def position(self, job):
+        """Number of queued jobs that start before `job`."""
+        if job.state != 'queued':
+            return 0
+        return sum(1 for other in self.queued.values() if other is not job and other.rank <= job.rank)
+
+    async def worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            _, _, job = await self.queue.get()
+            if job.state != 'queued':
+                continue
+            # Jobs for one document share its build dir and jobname, so
+            # they run one at a time; this one waits for the running job
+            if job.tex in self.busy:
+                self.parked.setdefault(job.tex, []).append(job)
+                continue
+            self.busy.add(job.tex)
+            job.state = 'running'
+            del self.queued[job.key]
+            self.running[job.key] = job
+            job.started_stat = _stat(job.tex)
+            await job.emit({'event': 'started'})
+
+            def report(text):
+                asyncio.run_coroutine_threadsafe(job.emit({'event': 'message', 'text': text}), loop)
+
+            if job.fix:
+                compile_job = functools.partial(
+                    compile_stage.compile_with_log_fixes, job.tex, report=report, local=True,
+                    pdf_path=job.pdf_path)
+            else:
+                compile_job = functools.partial(
+                    compile_stage.run_pdflatex, job.tex, timeout=job.timeout,
+                    use_format=job.use_format, check=job.check, local=True, max_passes=job.max_passes,
+                    pdf_path=job.pdf_path)
+            try:
+                result = await loop.run_in_executor(self.executor, compile_job)
+                event = {'event': 'finished', 'ok': result.ok, 'log': result.log, 'passes': result.passes}
+            except Exception as e:
+                event = {'event': 'finished', 'ok': False, 'log': '', 'error': str(e)}
+
+            job.state = 'done'
+            if self.running.get(job.key) is job:
+                del self.running[job.key]
+            self.busy.discard(job.tex)
+            for parked in self.parked.pop(job.tex, []):
+                self.queue.put_nowait((parked.rank, next(self.order), parked))
+            self.completed += 1
+            await job.emit(event)
+
+    def status(self):
+        return {
+            'event': 'status',
+            'max_jobs': self.max_jobs,
+            'running': sorted(job.tex for job in self.running.values()),
+            'queued': [job.tex for job in sorted(self.queued.values(), key=lambda j: j.rank)],
+            'completed': self.completed,
+            'coalesced': self.coalesced,
+        }
+
+    async def handle(self, reader, writer):
+        lock = asyncio.Lock()
+
+        async def send(event):
+            async with lock:
+                try:
+                    writer.write((json.dumps(event) + '\n').encode('utf-8'))
+                    await writer.drain()
+                except (ConnectionError, RuntimeError):
+                    pass
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    await send({'event': 'error', 'error': 'invalid JSON'})
+                    continue
+
+                op = request.get('op')
+                if op == 'compile' and request.get('tex'):
+                    job, coalesced = self.submit(request, send)
+                    await send({'id': request.get('id'), 'event': 'queued',
+                                'coalesced': coalesced, 'position': self.position(job)})
+                elif op == 'status':
+                    await send(dict(self.status(), id=request.get('id')))
+                elif op == 'stop':
+                    await send({'id': request.get('id'), 'event': 'stopping'})
+                    self.stopping.set()
+                    break
+                else:
+                    await send({'id': request.get('id'), 'event': 'error', 'error': f"unknown request {op!r}"})
+        finally:
+            writer.close()
+
+    async def serve(self, path):
+        server = await asyncio.start_unix_server(self.handle, path=str(path))
+        workers = [asyncio.create_task(self.worker()) for _ in range(self.max_jobs)]
+        print(f"Compile server listening on {path} ({self.max_jobs} TeX processes)")
+        try:
+            async with server:
+                await self.stopping.wait()
+        finally:
+            for task in workers:
+                task.cancel()
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+def _connect(timeout=None):
+    """Open a connection to the running server, or return None."""
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(timeout)
+    try:
+        client.connect(str(SOCKET_PATH))
+    except OSError:
+        client.close()
+        return None
+    return client
+
+def _events(client):
+    """Yield the JSON events a server connection sends."""
+    with client.makefile('r', encoding='utf-8') as stream:
+        for line in stream:
+            yield json.loads(line)
+
+def _request(client, payload):
+    client.sendall((json.dumps(payload) + '\n').encode('utf-8'))
+
+def is_running():
+    """True if a compile server is accepting connections."""
+    client = _connect(timeout=1)
+    if client is None:
+        return False
+    client.close()
+    return True
+
+def submit(tex, priority='batch', use_format=True, check=True, fix=False, timeout=30,
+           max_passes=compile_stage.MAX_PASSES, on_message=print, pdf_path=None):
+    """Compile a document on the server and wait for the result.
+
+    Returns a CompileResult, or None if no server is running so the caller
+    can compile in-process instead. on_message receives the progress
+    messages the compile prints (such as applied fixes). The PDF goes to
+    pdf_path, by default the lesson directory.
+    """
+    client = _connect()
+    if client is None:
+        return None
+    with client:
+        _request(client, {'op': 'compile', 'id': 1, 'tex': str(Path(tex).resolve()),
+                          'priority': priority, 'use_format': use_format, 'check': check,
+                          'fix': fix, 'timeout': timeout, 'max_passes': max_passes,
+                          'pdf': str(Path(pdf_path).resolve()) if pdf_path else None})
+        for event in _events(client):
+            if event.get('event') == 'message' and on_message is not None:
+                on_message(event['text'])
+            elif event.get('event') == 'finished':
+                if event.get('error'):
+                    raise RuntimeError(event['error'])
+                return CompileResult(event['ok'], event['log'], event.get('passes', 1))
+    raise ConnectionError("compile server closed the connection")
+
+def serve(max_jobs):
+    """Run the server until it is asked to stop."""
+    if is_running():
+        print(f"A compile server is already listening on {SOCKET_PATH}")
+        return 1
+    SOCKET_PATH.parent.mkdir(parents=True, exist_ok=True)
+    SOCKET_PATH.unlink(missing_ok=True)
+    # Compiles started by the server must never be sent back to it
+    os.environ.pop(compile_stage.SERVER_ENV, None)
+    try:
+        asyncio.run(CompileServer(max_jobs).serve(SOCKET_PATH))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        SOCKET_PATH.unlink(missing_ok=True)
+    return 0
+
+def compile_documents(files, priority, fix):
+    """Submit several documents over one connection and stream their results."""
+    client = _connect()
+    if client is None:
+        print(f"No compile server on {SOCKET_PATH}; start one with: compile_server.py serve")
+        return 1
+    pending = {}
+    with client:
+        for request_id, tex in enumerate(files, 1):
+            pending[request_id] = tex
+            _request(client, {'op': 'compile', 'id': request_id, 'tex': str(Path(tex).resolve()),
+                              'priority': priority, 'fix': fix})
+        failed = 0
+        for event in _events(client):
+            tex = pending.get(event.get('id'))
+            kind = event.get('event')
+            if kind == 'queued' and event.get('coalesced'):
+                print(f"{tex}: joined a queued compile")
+            elif kind == 'message':
+                print(event['text'])
+            elif kind == 'finished':
+                print(f"{'✓' if event['ok'] else '✗'} {tex} ({event.get('passes', 1)} passes)")
+                failed += not event['ok']
+                del pending[event['id']]
+                if not pending:
+                    break
+    return 1 if failed else 0
+
+def main():
+    """Run the server or talk to it."""
+    parser = argparse.ArgumentParser(description="Local compile server for the lesson documents")
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve_parser = commands.add_parser('serve', help="run the server in the foreground")
+    serve_parser.add_argument('--max-jobs', type=int, default=compile_stage.default_jobs(),
+                              help="TeX processes run at once (default: CPU count)")
+    compile_parser = commands.add_parser('compile', help="compile documents on the server")
+    compile_parser.add_argument('tex', nargs='+')
+    compile_parser.add_argument('--batch', action='store_true', help="queue behind interactive requests")
+    compile_parser.add_argument('--fix', action='store_true', help="apply log-driven fixes between runs")
+    commands.add_parser('status', help="show running and queued jobs")
+    commands.add_parser('stop', help="stop the server")
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        return serve(args.max_jobs)
+    if args.command == 'compile':
+        return compile_documents(args.tex, 'batch' if args.batch else 'interactive', args.fix)
+
+    client = _connect()
+    if client is None:
+        print(f"No compile server on {SOCKET_PATH}")
+        return 1
+    with client:
+        _request(client, {'op': args.command})
+        for event in _events(client):
+            if args.command == 'status':
+                print(f"running ({len(event['running'])}/{event['max_jobs']}): {', '.join(event['running']) or '-'}")
+                print(f"queued: {len(event['queued'])}")
+                for tex in event['queued']:
+                    print(f"  {tex}")
+                print(f"completed: {event['completed']}, coalesced: {event['coalesced']}")
+            else:
+                print("Compile server stopping")
+            break
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
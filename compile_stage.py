@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Shared compile stage for the lesson scripts: pdflatex runs and a bounded
+process pool that works through lessons in parallel
+
+With ODE_COMPILE_SERVER set (or --server), compiles go to the running
+compile server (compile_server.py) instead of spawning TeX here.
+
+pdflatex writes everything it produces into a build directory mirroring
+the repository layout under .build/, or under ODE_BUILD_DIR (a tmpfs such
+as /dev/shm works well). Only the finished PDF leaves it, renamed into
+place next to the lesson so readers never see a half-written file.
+"""
+
+import argparse
+import contextlib
+import hashlib
+import io
+import os
+import re
+import subprocess
+import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import artifact_store
+import preamble_format
+import tikz_externalize
+from build_cache import default_pdf_path, note_compile
+from build_trace import add_trace_argument, span
+from lint_latex import format_issues, lint
+from latex_log import first_error, fix_errors, parse_log
+
+CompileResult = namedtuple('CompileResult', ['ok', 'log', 'passes'], defaults=(1,))
+
+SERVER_ENV = 'ODE_COMPILE_SERVER'
+
+BUILD_DIR_ENV = 'ODE_BUILD_DIR'
+
+REPO_DIR = Path(__file__).resolve().parent
+
+# Upper bound on pdflatex passes per document
+MAX_PASSES = 3
+
+# Auxiliary files whose contents the next pass reads back
+AUX_EXTENSIONS = ('.aux', '.toc', '.out')
+
+# pdflatex's closing summary; TeX may wrap it across lines
+OUTPUT_WRITTEN = re.compile(r'Output written on.*?\((\d+)\s+pages?,\s+(\d+)\s+bytes\)', re.DOTALL)
+
+# Lines that make a pass depend on the previous pass's .aux
+CROSS_REFERENCE = re.compile(r'\\(?:newlabel|bibcite|@writefile|contentsline)\b')
+
+def default_jobs():
+    """Default number of parallel lesson workers."""
+    return os.cpu_count() or 1
+
+def add_jobs_argument(parser):
+    """Add the shared --jobs option to an argparse parser."""
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        default=default_jobs(),
+        help=f"number of lessons processed in parallel (default: {default_jobs()})"
+    )
+
+class _EnableServer(argparse.Action):
+    def __call__(self, parser, namespace, values, option_string=None):
+        setattr(namespace, self.dest, True)
+        # Set in the environment so pool workers submit to the server too
+        os.environ[SERVER_ENV] = '1'
+
+def add_server_argument(parser):
+    """Add the shared --server option to an argparse parser."""
+    parser.add_argument(
+        '--server',
+        nargs=0,
+        action=_EnableServer,
+        default=False,
+        help=f"compile on the running compile server (same as {SERVER_ENV}=1)"
+    )
+
+def server_enabled():
+    """True if compiles should be submitted to the compile server."""
+    return os.environ.get(SERVER_ENV, '') not in ('', '0')
+
+def _submit(tex_path, **options):
+    """Compile on the server; None if no server is running."""
+    import compile_server
+    return compile_server.submit(tex_path, **options)
+
+def build_root():
+    """Directory holding every build directory."""
+    return Path(os.environ.get(BUILD_DIR_ENV) or REPO_DIR / '.build')
+
+def build_dir_for(tex_path):
+    """Build directory of a document: its source directory mirrored under build_root()."""
+    source_dir = Path(tex_path).resolve().parent
+    try:
+        return build_root() / source_dir.relative_to(REPO_DIR)
+    except ValueError:
+        name = hashlib.sha1(str(source_dir).encode('utf-8')).hexdigest()[:16]
+        return build_root() / 'external' / name
+
+def publish(built, pdf_path):
+    """Move a built PDF into the artifact store and link it at pdf_path.
+
+    The PDF is stored once by content and pdf_path is replaced by a link
+    to it with a rename, so a reader sees either the old file or the new
+    one, never a partial write, and no bytes are copied.
+    """
+    pdf_path = Path(pdf_path)
+    artifact_store.publish(built, pdf_path)
+    return pdf_path
+
+def _aux_state(job_path):
+    """Hash the auxiliary files a pass leaves for the next one.
+
+    Returns (digest, has_references). A document whose .aux holds no
+    labels, citations or contents lines and that has no .toc or .out never
+    needs another pass, whatever else its .aux records.
+    """
+    digest = hashlib.sha256()
+    has_references = False
+    for extension in AUX_EXTENSIONS:
+        path = job_path.parent / f"{job_path.name}{extension}"
+        try:
+            data = path.read_bytes()
+        except OSError:
+            continue
+        digest.update(extension.encode('ascii') + b'\0' + data + b'\0')
+        if extension != '.aux' and data.strip():
+            has_references = True
+        elif extension == '.aux' and CROSS_REFERENCE.search(data.decode('utf-8', errors='replace')):
+            has_references = True
+    return digest.hexdigest(), has_references
+
+def run_pdflatex(tex_path, timeout=30, use_format=True, check=True, local=False, max_passes=MAX_PASSES,
+                 externalize=True, note_passes=True, pdf_path=None):
+    """Run pdflatex on a .tex file from its own directory into its build directory.
+
+    With `check`, the document is linted first and a document with issues
+    fails immediately, its log listing them, without starting TeX. When the
+    document's package-loading head can be precompiled, the run uses the
+    shared preamble format and skips loading those packages. With
+    `externalize`, TikZ pictures are replaced by their cached PDFs.
+
+    After each pass the .aux/.toc/.out files are hashed; another pass runs
+    only if they changed and hold cross-references, up to max_passes. The
+    pass count is returned in the result and, with note_passes, noted in
+    the build cache. A successful PDF is published to pdf_path (by default
+    the lesson directory above src/).
+    Unless `local`, the compile server runs it when enabled and available.
+    """
+    if not local and server_enabled():
+        result = _submit(tex_path, timeout=timeout, use_format=use_format, check=check,
+                         max_passes=max_passes, pdf_path=pdf_path)
+        if result is not None:
+            return result
+
+    tex_path = Path(tex_path)
+    pdf_path = Path(pdf_path) if pdf_path else default_pdf_path(tex_path)
+    source = tex_path.read_text(encoding='utf-8', errors='replace')
+    if check:
+        with span('lint', tex=str(tex_path)) as event:
+            issues = lint(source)
+            event['issues'] = len(issues)
+        if issues:
+            return CompileResult(False, format_issues(tex_path.name, issues) + '\n', 0)
+
+    content = source
+    if externalize:
+        with span('externalize', tex=str(tex_path)) as event:
+            content, stats = tikz_externalize.externalize(tex_path, content)
+            event.update(stats)
+    prepared = preamble_format.prepare(tex_path, content) if use_format else None
+
+    out_dir = build_dir_for(tex_path)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    job = out_dir / tex_path.stem
+    command = ['pdflatex', '-interaction=nonstopmode', '-file-line-error', f'-output-directory={out_dir}']
+    env = None
+    body = None
+    if prepared is not None:
+        fmt, body = prepared
+        command.append(f'-fmt={fmt}')
+        env = preamble_format.format_env()
+    elif content != source:
+        body = content
+
+    body_file = None
+    if body is None:
+        command.append(tex_path.name)
+    else:
+        body_file = out_dir / f"{tex_path.stem}.body.tex"
+        body_file.write_text(body, encoding='utf-8')
+        command += [f'-jobname={tex_path.stem}', str(body_file)]
+
+    passes = 0
+    try:
+        state = _aux_state(job)
+        while True:
+            with span('pdflatex', tex=str(tex_path), run=passes + 1,
+                      format=prepared is not None) as event:
+                result = subprocess.run(
+                    command,
+                    cwd=tex_path.parent,
+                    capture_output=True,
+                    text=True,
+                    errors='replace',
+                    timeout=timeout,
+                    env=env
+                )
+                event['returncode'] = result.returncode
+                written = OUTPUT_WRITTEN.search(result.stdout)
+                if written:
+                    event['pages'], event['bytes'] = int(written.group(1)), int(written.group(2))
+            passes += 1
+            if result.returncode != 0 or passes >= max_passes:
+                break
+            previous, state = state, _aux_state(job)
+            if state == previous or not state[1]:
+                break
+    finally:
+        if body_file is not None:
+            body_file.unlink(missing_ok=True)
+
+    log = result.stdout
+    if body_file is not None:
+        log = log.replace(str(body_file), tex_path.name).replace(body_file.name, tex_path.name)
+    built = job.parent / f"{job.name}.pdf"
+    ok = result.returncode == 0 and built.exists()
+    if ok:
+        with span('publish', tex=str(tex_path), pdf=str(pdf_path), bytes=built.stat().st_size):
+            publish(built, pdf_path)
+    if ok and note_passes:
+        note_compile(tex_path, passes=passes)
+    return CompileResult(ok, log, passes)
+
+def compile_with_log_fixes(tex_path, max_attempts=4, report=print, local=False, pdf_path=None):
+    """Compile a document, fixing the lines its log points at between runs.
+
+    Another run only happens when a fix was applied, so an error nothing
+    can repair costs one compile instead of max_attempts. Progress goes to
+    report(); unless `local`, the compile server runs the loop when enabled.
+    """
+    if not local and server_enabled():
+        result = _submit(tex_path, fix=True, on_message=report, pdf_path=pdf_path)
+        if result is not None:
+            return result
+
+    tex_path = Path(tex_path)
+    for attempt in range(max_attempts):
+        result = run_pdflatex(tex_path, local=True, pdf_path=pdf_path)
+        if result.ok or attempt == max_attempts - 1:
+            return result
+
+        errors = parse_log(result.log)
+        content = tex_path.read_text(encoding='utf-8')
+        fixed, applied = fix_errors(content, errors, tex_path.name)
+        if not applied:
+            error = first_error(errors)
+            if error is not None:
+                report(f"    {tex_path.name}:{error.line}: {error.message}")
+            return result
+
+        with open(tex_path, 'w', encoding='utf-8') as f:
+            f.write(fixed)
+        for description in applied:
+            report(f"    Fixed {tex_path.name} {description}")
+    return result
+
+def _limit_figure_jobs(jobs):
+    tikz_externalize.FIGURE_JOBS = jobs
+
+def _run_captured(func, lesson_num):
+    """Run func(lesson_num) in a worker, capturing everything it prints."""
+    buffer = io.StringIO()
+    result = None
+    error = None
+    with contextlib.redirect_stdout(buffer):
+        try:
+            result = func(lesson_num)
+        except Exception as e:
+            error = e
+    return result, error, buffer.getvalue()
+
+def run_lessons(func, lesson_nums, jobs=1):
+    """Run func(lesson_num) for every lesson on a pool of up to `jobs` processes.
+
+    Yields (lesson_num, result, error) in lesson order. The output a lesson
+    prints is written out as one block before it is yielded, so parallel
+    lessons never interleave. With jobs <= 1 lessons run in this process.
+    """
+    lesson_nums = list(lesson_nums)
+
+    if jobs <= 1 or len(lesson_nums) <= 1:
+        saved = tikz_externalize.FIGURE_JOBS
+        _limit_figure_jobs(max(1, jobs))
+        try:
+            for lesson_num in lesson_nums:
+                try:
+                    yield lesson_num, func(lesson_num), None
+                except Exception as e:
+                    yield lesson_num, None, e
+        finally:
+            _limit_figure_jobs(saved)
+        return
+
+    workers = min(jobs, len(lesson_nums))
+    # Each worker builds its figures with its share of the jobs
+    with ProcessPoolExecutor(max_workers=workers, initializer=_limit_figure_jobs,
+                             initargs=(max(1, jobs // workers),)) as executor:
+        futures = [executor.submit(_run_captured, func, n) for n in lesson_nums]
+        for lesson_num, future in zip(lesson_nums, futures):
+            result, error, output = future.result()
+            print(output, end='', flush=True)
+            yield lesson_num, result, error
+
+def main():
+    """Compile the given .tex files, publishing each PDF next to its lesson."""
+    parser = argparse.ArgumentParser(description="Compile LaTeX documents with the shared preamble format")
+    parser.add_argument('tex', nargs='+', help=".tex files to compile")
+    parser.add_argument('--no-format', action='store_true', help="do not use a precompiled preamble")
+    parser.add_argument('--no-lint', action='store_true', help="run pdflatex even if the linter finds issues")
+    parser.add_argument('--max-passes', type=int, default=MAX_PASSES,
+                        help=f"most pdflatex passes per document (default: {MAX_PASSES})")
+    add_server_argument(parser)
+    add_trace_argument(parser)
+    args = parser.parse_args()
+
+    failed = 0
+    for tex in args.tex:
+        try:
+            result = run_pdflatex(tex, use_format=not args.no_format, check=not args.no_lint,
+                                  max_passes=args.max_passes)
+            ok = result.ok
+            error = None if ok else first_error(parse_log(result.log))
+            if error is not None:
+                print(f"{tex}:{error.line}: {error.message}", file=sys.stderr)
+        except Exception as e:
+            print(f"{tex}: {e}", file=sys.stderr)
+            ok = False
+        if not ok:
+            failed += 1
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Persistent offset index of the components in raw lesson sources
+
+`Lessons 19 and more/N.txt` holds an audio script and two ```latex blocks.
+Finding them takes several DOTALL scans of the whole file, so the byte
+offsets are stored once in a sidecar index under .build_cache/components,
+validated against the file's size, mtime and SHA-256. Reading a component
+afterwards is a slice of a memory-mapped file.
+
+Usage:
+    component_index.py [--component audio|theory|problems|title] FILE...
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import re
+import sys
+from pathlib import Path
+
+from build_cache import CACHE_DIR
+
+INDEX_DIR = CACHE_DIR / 'components'
+INDEX_VERSION = 1
+
+AUDIO_PATTERN = re.compile(rb'(Component 1:|Part 1:)(.*?)```latex', re.DOTALL)
+LATEX_BLOCK_PATTERN = re.compile(rb'```latex(.*?)```', re.DOTALL)
+TITLE_PATTERN = re.compile(rb'Lesson \d+:\s*(.+?)(?:\n|$)')
+
+COMPONENTS = ('audio', 'theory', 'problems', 'title')
+
+def _index_path(source):
+    name = hashlib.sha1(str(Path(source).resolve()).encode('utf-8')).hexdigest()
+    return INDEX_DIR / f"{name}.json"
+
+def _map(source):
+    """Memory-map a source file read-only; returns None for empty files."""
+    with open(source, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def scan(data):
+    """Find the component offsets in the bytes of a raw lesson source."""
+    spans = {}
+
+    audio = AUDIO_PATTERN.search(data)
+    if audio:
+        spans['audio'] = [audio.start(2), audio.end(2)]
+        spans['audio_mode'] = 'component'
+    else:
+        first_latex = data.find(b'```latex')
+        if first_latex > 0:
+            spans['audio'] = [0, first_latex]
+            spans['audio_mode'] = 'prefix'
+
+    blocks = []
+    for match in LATEX_BLOCK_PATTERN.finditer(data):
+        blocks.append([match.start(1), match.end(1)])
+        if len(blocks) == 2:
+            break
+    spans['blocks'] = blocks
+
+    title = TITLE_PATTERN.search(data)
+    if title:
+        spans['title'] = [title.start(1), title.end(1)]
+    return spans
+
+def build_index(source):
+    """Scan a source file and write its sidecar index."""
+    stat = os.stat(source)
+    data = _map(source)
+    try:
+        digest = hashlib.sha256(data if data is not None else b'').hexdigest()
+        spans = scan(data) if data is not None else {'blocks': []}
+    finally:
+        if data is not None:
+            data.close()
+
+    index = {
+        'version': INDEX_VERSION,
+        'source': str(Path(source).resolve()),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': digest,
+        'spans': spans,
+    }
+    _write_index(source, index)
+    return index
+
+def _write_index(source, index):
+    path = _index_path(source)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    os.replace(tmp, path)
+
+def load_index(source):
+    """Return the component index for a source, rebuilding it if the file changed."""
+    try:
+        with open(_index_path(source), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return build_index(source)
+
+    if index.get('version') != INDEX_VERSION:
+        return build_index(source)
+
+    stat = os.stat(source)
+    if index['size'] == stat.st_size and index['mtime_ns'] == stat.st_mtime_ns:
+        return index
+    if index['size'] != stat.st_size:
+        return build_index(source)
+
+    # Same size, new mtime (checkout, touch): only rescan if the bytes differ
+    data = _map(source)
+    try:
+        digest = hashlib.sha256(data if data is not None else b'').hexdigest()
+    finally:
+        if data is not None:
+            data.close()
+    if digest != index['sha256']:
+        return build_index(source)
+    index['mtime_ns'] = stat.st_mtime_ns
+    _write_index(source, index)
+    return index
+
+def read_components(source, names=COMPONENTS):
+    """Read the requested raw components of a source as text.
+
+    Returns a dict mapping each name to its text ('' when absent), plus
+    'audio_mode' and 'block_count' describing how the source is laid out.
+    """
+    index = load_index(source)
+    spans = index['spans']
+    blocks = spans.get('blocks', [])
+    wanted = {
+        'audio': spans.get('audio'),
+        'theory': blocks[0] if len(blocks) >= 1 else None,
+        'problems': blocks[1] if len(blocks) >= 2 else None,
+        'title': spans.get('title'),
+    }
+
+    result = {'audio_mode': spans.get('audio_mode'), 'block_count': len(blocks)}
+    data = None
+    try:
+        for name in names:
+            span = wanted[name]
+            if span is None:
+                result[name] = ''
+                continue
+            if data is None:
+                data = _map(source)
+            result[name] = data[span[0]:span[1]].decode('utf-8', errors='replace')
+    finally:
+        if data is not None:
+            data.close()
+    return result
+
+def read_component(source, name):
+    """Read a single raw component ('audio', 'theory', 'problems' or 'title')."""
+    return read_components(source, (name,))[name]
+
+def main():
+    """Print a component of each source, building indexes as needed."""
+    parser = argparse.ArgumentParser(description="Read components of raw lesson sources via the offset index")
+    parser.add_argument('files', nargs='+', help="raw lesson sources")
+    parser.add_argument('--component', choices=COMPONENTS, help="print this component")
+    args = parser.parse_args()
+
+    for source in args.files:
+        if args.component:
+            print(read_component(source, args.component).strip())
+        else:
+            spans = load_index(source)['spans']
+            print(f"{source}: audio={spans.get('audio')} blocks={spans.get('blocks')} title={spans.get('title')}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
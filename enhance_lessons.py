@@ -3,217 +3,91 @@
 Enhance quality of lessons 19-50 to match the high standards of lessons 7-18
 """
 
-import os
-import re
-import subprocess
-from pathlib import Path
+import argparse
 
-def fix_latex_document(content):
-    """Fix LaTeX document issues and enhance quality."""
-    
-    # Fix subscript/superscript issues with dollar signs
-    content = re.sub(r'\$_\{(\d+)\}\$', r'_{\1}', content)
-    content = re.sub(r'\$\^\{(\d+)\}\$', r'^{\1}', content)
-    content = re.sub(r'q\$_\{([0-9]+)\}\$', r'q_{\1}', content)
-    content = re.sub(r'c\$_\{([0-9]+)\}\$', r'c_{\1}', content)
-    content = re.sub(r'y\$_\{([0-9pn]+)\}\$', r'y_{\1}', content)
-    content = re.sub(r'x\$_\{([0-9]+)\}\$', r'x_{\1}', content)
-    content = re.sub(r'a\$_\{([0-9]+)\}\$', r'a_{\1}', content)
-    content = re.sub(r'b\$_\{([0-9]+)\}\$', r'b_{\1}', content)
-    content = re.sub(r'\$\$([^$]+)\$\$\$', r'$$\1$$', content)
-    
-    # Fix common LaTeX errors
-    content = content.replace('\\Rightarrow', '\\Rightarrow')
-    content = content.replace('\\mathbb{R}', '\\mathbb{R}')
-    content = content.replace('\\checkmark', '$\\checkmark$')
-    
-    # Ensure proper math mode
-    content = re.sub(r'([^\\$])(e\^[{]?[^$\s]+[}]?)([^$])', r'\1$\2$\3', content)
-    
-    # Fix bmatrix environment
-    if '\\bmatrix' in content or '\\pmatrix' in content:
-        if 'amsmath' not in content:
-            content = content.replace('\\usepackage{geometry',
-                                    '\\usepackage{amsmath}\n\\usepackage{geometry')
-    
-    # Add missing packages if needed
-    required_packages = {
-        '\\mathbb': 'amssymb',
-        '\\bmatrix': 'amsmath',
-        '\\pmatrix': 'amsmath',
-        'tikzpicture': 'tikz',
-        'mdframed': 'mdframed',
-        'enumerate': 'enumitem'
-    }
-    
-    for command, package in required_packages.items():
-        if command in content and package not in content:
-            # Add after documentclass
-            insert_pos = content.find('\\begin{document}')
-            if insert_pos > 0:
-                content = content[:insert_pos] + f'\\usepackage{{{package}}}\n' + content[insert_pos:]
-    
-    # Ensure document structure
-    if '\\end{document}' not in content:
-        content += '\n\\end{document}'
-    
-    # Fix alignment environments
-    content = re.sub(r'\\begin\{align\}([^$]*)\$([^$]*)\$([^$]*)\\end\{align\}',
-                     r'\\begin{align}\1\2\3\\end{align}', content)
-    
-    return content
+import lesson_paths
+from build_cache import is_up_to_date, record_build
+from build_trace import add_trace_argument
+from compile_stage import add_jobs_argument, add_server_argument, compile_with_log_fixes, run_lessons
+from fix_rules import PROFILES, fix_file
+from lesson_catalog import PROBLEM_TARGET, missing_parts, open_catalog, problem_count, update_file
+from lesson_paths import add_lessons_argument
+from verify_pdfs import describe, lesson_checks
 
 def enhance_theory_document(filepath, lesson_num):
     """Enhance the theory document to match high-quality standards."""
-    with open(filepath, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    original = content
-    
-    # Fix LaTeX issues
-    content = fix_latex_document(content)
-    
-    # Ensure proper title format
-    if f'Lesson {lesson_num}:' not in content:
-        content = re.sub(r'\\title\{([^}]+)\}',
-                        f'\\\\title{{ODE Lesson {lesson_num}: \\1}}', content)
-    
-    # Ensure author line
-    if 'Prof. Adi Ditkowski' not in content:
-        content = re.sub(r'\\author\{[^}]*\}',
-                        r'\\author{ODE 1 - Prof. Adi Ditkowski}', content)
-    
-    # Add custom environments if missing
-    if '\\newmdenv' not in content:
-        environments = """% Custom environments
-\\newtheorem{definition}{Definition}
-\\newtheorem{theorem}{Theorem}
-\\newtheorem{method}{Method}
-\\newtheorem{example}{Example}
-\\newmdenv[linecolor=blue,linewidth=2pt]{keypoint}
-\\newmdenv[linecolor=red,linewidth=2pt]{warning}
-\\newmdenv[linecolor=green,linewidth=2pt]{insight}
-
-"""
-        content = content.replace('\\begin{document}', environments + '\\begin{document}')
-    
-    if content != original:
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(content)
-        return True
-    return False
+    changed, _ = fix_file(filepath, PROFILES['enhance_theory'], lesson_num)
+    return changed
 
 def enhance_problems_document(filepath, lesson_num):
     """Enhance the problems document to ensure 28 problems."""
-    with open(filepath, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    original = content
-    
-    # Fix LaTeX issues
-    content = fix_latex_document(content)
-    
-    # Count problems
-    problem_count = content.count('\\item')
-    
-    # Ensure proper title
-    if 'Practice Problems' not in content:
-        content = re.sub(r'\\title\{([^}]+)\}',
-                        f'\\\\title{{Practice Problems: Lesson {lesson_num}}}', content)
-    
-    # Check for proper sections
-    sections_needed = [
-        'Part A:',
-        'Part B:',
-        'Part C:',
-        'Part D:',
-        'Part E:'
-    ]
-    
-    for section in sections_needed:
-        if section not in content:
-            print(f"  Warning: Missing section '{section}' in problems_{lesson_num:02d}.tex")
-    
-    if content != original:
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(content)
-        return True
-    return False
+    changed, _ = fix_file(filepath, PROFILES['enhance_problems'], lesson_num)
+    
+    # Count problems and check the Parts in the catalog, which parses the
+    # file again only if it changed
+    catalog = open_catalog()
+    try:
+        update_file(catalog, filepath, lesson_num, 'problems')
+        count = problem_count(catalog, lesson_num)
+        missing = missing_parts(catalog, lesson_num)
+    finally:
+        catalog.close()
+    
+    if count < PROBLEM_TARGET:
+        print(f"  Warning: {count}/{PROBLEM_TARGET} problems in problems_{lesson_num:02d}.tex")
+    for part in missing:
+        print(f"  Warning: Missing section 'Part {part}:' in problems_{lesson_num:02d}.tex")
+    
+    return changed
 
-def compile_with_fixes(filepath, max_attempts=2):
-    """Try to compile LaTeX with automatic fixes."""
-    directory = filepath.parent
-    filename = filepath.name
-    
-    for attempt in range(max_attempts):
-        try:
-            result = subprocess.run(
-                ['pdflatex', '-interaction=nonstopmode', filename],
-                cwd=directory,
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
-            
-            if result.returncode == 0:
-                return True
-            
-            # Try to fix common errors
-            if attempt == 0:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                # Fix based on error messages
-                if 'Undefined control sequence' in result.stdout:
-                    content = fix_latex_document(content)
-                    
-                with open(filepath, 'w', encoding='utf-8') as f:
-                    f.write(content)
-        except Exception as e:
-            print(f"    Compilation error: {e}")
-            
-    return False
+def compile_with_fixes(filepath, max_attempts=4):
+    """Try to compile LaTeX, fixing the errors the log reports."""
+    try:
+        return compile_with_log_fixes(filepath, max_attempts).ok
+    except Exception as e:
+        print(f"    Compilation error: {e}")
+        return False
 
 def process_lesson(lesson_num):
     """Process and enhance a single lesson."""
-    base_dir = Path(f"/home/archer/Desktop/ODE 50 Lessons Plan/lesson_{lesson_num:02d}")
-    
-    if not base_dir.exists():
+    if not lesson_paths.lesson_dir(lesson_num).exists():
         print(f"  Lesson {lesson_num} directory not found")
         return False
     
     print(f"Processing Lesson {lesson_num}...")
     
     # Check and enhance theory document
-    theory_file = base_dir / f"lesson_{lesson_num:02d}.tex"
-    theory_pdf = base_dir / f"lesson_{lesson_num:02d}.pdf"
+    theory_file = lesson_paths.tex_path(lesson_num, 'lesson')
+    theory_pdf = lesson_paths.pdf_path(lesson_num, 'lesson')
     
     if theory_file.exists():
         if enhance_theory_document(theory_file, lesson_num):
             print(f"  Enhanced theory document")
         
-        if not theory_pdf.exists() or theory_file.stat().st_mtime > theory_pdf.stat().st_mtime:
+        if not is_up_to_date(theory_file, theory_pdf):
             if compile_with_fixes(theory_file):
+                record_build(theory_file, theory_pdf)
                 print(f"  ✓ Compiled lesson_{lesson_num:02d}.pdf")
             else:
                 print(f"  ✗ Failed to compile theory PDF")
     
     # Check and enhance problems document
-    problems_file = base_dir / f"problems_{lesson_num:02d}.tex"
-    problems_pdf = base_dir / f"problems_{lesson_num:02d}.pdf"
+    problems_file = lesson_paths.tex_path(lesson_num, 'problems')
+    problems_pdf = lesson_paths.pdf_path(lesson_num, 'problems')
     
     if problems_file.exists():
         if enhance_problems_document(problems_file, lesson_num):
             print(f"  Enhanced problems document")
         
-        if not problems_pdf.exists() or problems_file.stat().st_mtime > problems_pdf.stat().st_mtime:
+        if not is_up_to_date(problems_file, problems_pdf):
             if compile_with_fixes(problems_file):
+                record_build(problems_file, problems_pdf)
                 print(f"  ✓ Compiled problems_{lesson_num:02d}.pdf")
             else:
                 print(f"  ✗ Failed to compile problems PDF")
     
     # Check audio script
-    script_file = base_dir / "lesson_script.txt"
+    script_file = lesson_paths.script_path(lesson_num)
     if script_file.exists():
         with open(script_file, 'r', encoding='utf-8') as f:
             script_content = f.read()
@@ -229,21 +103,28 @@ def process_lesson(lesson_num):
     return True
 
 def main():
-    """Enhance all lessons 19-50."""
-    print("Enhancing lessons 19-50 to match quality standards...")
+    """Enhance the selected lessons (19-50 by default)."""
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    add_jobs_argument(parser)
+    add_server_argument(parser)
+    add_trace_argument(parser)
+    add_lessons_argument(parser, default='19-50')
+    args = parser.parse_args()
+    lessons = args.lessons
+    
+    print(f"Enhancing lessons {lessons[0]}-{lessons[-1]} to match quality standards...")
     print("=" * 50)
     
     successful = 0
     failed = []
     
-    for lesson_num in range(19, 51):
-        try:
-            if process_lesson(lesson_num):
-                successful += 1
-            else:
-                failed.append(lesson_num)
-        except Exception as e:
-            print(f"  Error processing lesson {lesson_num}: {e}")
+    for lesson_num, ok, error in run_lessons(process_lesson, lessons, args.jobs):
+        if error is not None:
+            print(f"  Error processing lesson {lesson_num}: {error}")
+            failed.append(lesson_num)
+        elif ok:
+            successful += 1
+        else:
             failed.append(lesson_num)
         print()
     
@@ -253,33 +134,33 @@ def main():
     if failed:
         print(f"Lessons needing attention: {failed}")
     
-    # Summary of PDF status
+    # Summary of PDF status: a PDF counts only if it is complete
     print("\nPDF Compilation Status:")
-    pdf_count = 0
-    for lesson_num in range(19, 51):
-        base_dir = Path(f"/home/archer/Desktop/ODE 50 Lessons Plan/lesson_{lesson_num:02d}")
-        if base_dir.exists():
-            theory_pdf = base_dir / f"lesson_{lesson_num:02d}.pdf"
-            problems_pdf = base_dir / f"problems_{lesson_num:02d}.pdf"
-            
+    checks = {(lesson_num, kind): check for lesson_num, kind, check in lesson_checks(lessons)}
+    for lesson_num in lessons:
+        if lesson_paths.lesson_dir(lesson_num).exists():
             status = []
-            if theory_pdf.exists():
-                status.append("T")
-                pdf_count += 1
-            else:
-                status.append("-")
-            
-            if problems_pdf.exists():
-                status.append("P")
-                pdf_count += 1
-            else:
-                status.append("-")
+            for kind, tag in (('lesson', 'T'), ('problems', 'P')):
+                check = checks.get((lesson_num, kind))
+                if check is None or check.error == "missing":
+                    status.append("-")
+                elif check.error is not None:
+                    status.append("!")
+                else:
+                    status.append(tag)
             
             print(f"  Lesson {lesson_num:02d}: [{''.join(status)}]", end="")
             if lesson_num % 4 == 0:
                 print()
     
-    print(f"\n\nTotal PDFs: {pdf_count}/64")
+    valid = sum(1 for check in checks.values() if check.error is None)
+    print(f"\n\nTotal PDFs: {valid}/{len(checks)}")
+    problems = [describe(check) for check in checks.values()
+                if check.error != "missing" and (check.error or check.warning)]
+    if problems:
+        print("Corrupt or short PDFs:")
+        for line in problems:
+            print(f"  {line}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
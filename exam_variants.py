@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+Exam variants of the problem sets, with answer keys, built in one batch
+
+For each seed a variant of problems_NN.tex is written with the problems of
+every list shuffled (Parts keep their order, so difficulty still rises)
+and renumbered continuously, and with its Solutions sections removed. A
+matching answer key lists each variant problem with the source problem it
+came from and that problem's worked solution, if the source has one.
+
+A problem becomes a template by marking its numbers with \\vary:
+
+    % vary a: 2, 3, 5
+    % vary b: 1..6
+    \\newcommand{\\vary}[2]{#2}
+    ...
+    \\item Solve $y' = \\vary{a}{2}y$, $y(0) = \\vary{b}{1}$.
+    ...
+    \\textbf{Problem 3:} $y = \\vary{b}{1}e^{\\vary{a}{2}x}$, so $y(1) = \\vary{b*a}{2}e^{2}$.
+
+The first argument is an arithmetic expression over the declared
+parameters, the second what the source itself prints. Each variant draws
+every parameter from its seed and prints the value of each expression
+(a fraction as \\frac), in the problems and in the key alike.
+
+Variants share the source's preamble head, so they all compile against
+the one precompiled format, and are compiled in parallel. A variant whose
+source and PDF are unchanged since its last build is not compiled again.
+
+Usage:
+    exam_variants.py --lessons 21 --seeds 1-20 [--no-keys] [--output DIR] [-j N] [--dry-run]
+"""
+
+import argparse
+import ast
+import operator
+import random
+import re
+import sys
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
+from pathlib import Path
+
+import compile_stage
+import lesson_paths
+from build_cache import CACHE_DIR, is_up_to_date, record_build
+from latex_log import first_error, parse_log
+from latex_tokens import tokenize
+from lesson_catalog import LISTS, NEWMDENV, NEWTHEOREM, PART_HEADING, SECTIONS, _argument
+from lesson_paths import add_lessons_argument, parse_lessons
+
+VARIANT_DIR = CACHE_DIR / 'variants'
+
+# number: what the source prints, start/end: the \item and its text
+Problem = namedtuple('Problem', ['number', 'start', 'end'])
+# begin/body: offsets of \begin{enumerate} and of what follows its options
+ProblemList = namedtuple('ProblemList', ['begin', 'body', 'options', 'problems'])
+# lists: the shuffled lists, removed: spans of the Solutions sections,
+# solutions: source problem number -> worked solution
+Layout = namedtuple('Layout', ['lists', 'removed', 'solutions'])
+
+LIST_OPTIONS = re.compile(r'\s*\[([^\]]*)\]')
+START_OPTION = re.compile(r'^\s*(?:start\s*=\s*(\d+)|resume\*?)\s*$')
+# "\textbf{Problem 3:}", "\textbf{Key Insight for Problem 3:}" or "\textbf{3.}"
+SOLUTION_MARK = re.compile(r'\\textbf\{(?:[^{}]*?Problem\s+(\d+)[^{}]*|\s*(\d+)\s*[.:)]?\s*)\}')
+SOLUTIONS_HEADING = re.compile(r'solution|answer|hint', re.IGNORECASE)
+DECLARATION = re.compile(r'^\s*%+\s*vary\s+([A-Za-z]\w*)\s*:\s*(.+?)\s*$', re.MULTILINE)
+RANGE = re.compile(r'^(-?\d+)\s*\.\.\s*(-?\d+)$')
+VARY = re.compile(r'\\vary(?![A-Za-z])')
+
+def _start(options, previous):
+    """Number of the first item of a list with these options, after `previous` items."""
+    for option in options.split(','):
+        match = START_OPTION.match(option)
+        if match:
+            return int(match.group(1)) if match.group(1) else previous + 1
+    return 1
+
+def layout(content):
+    """Problem lists and Solutions sections of a problems document.
+
+    Problems are the top-level items of lists outside Solutions sections,
+    hint boxes and theorem-like environments, as in the catalog.
+    """
+    theorem_kinds = set(NEWTHEOREM.findall(content)) | {'problem'}
+    box_kinds = set(NEWMDENV.findall(content)) | {'mdframed'}
+    begin = max(content.find('\\begin{document}'), 0)
+    body = content[begin:]
+
+    lists = []
+    removed = []
+    depth = 0               # depth of nested enumerate/itemize
+    current = None          # ProblemList being read, with a list of problems
+    item = None             # start of the problem being read
+    envs = 0                # depth of theorem-like environments and boxes
+    solutions = None        # start of the Solutions section being read
+    number = 0              # printed number of the last problem
+    answers = []            # (number, start, end) of the items of numbered answer lists
+    answer = None           # [number, start] of the answer item being read
+    answer_list = False     # inside a numbered list of a Solutions section
+    answer_number = 0       # printed number of the last answer item
+
+    def close_item(end):
+        nonlocal item, number
+        if item is not None:
+            number += 1
+            current.problems.append(Problem(number, item, begin + len(body[:end].rstrip())))
+            item = None
+
+    def close_answer(end):
+        nonlocal answer
+        if answer is not None:
+            answers.append((answer[0], answer[1], begin + end))
+            answer = None
+
+    for token in tokenize(body):
+        text = body[token.start:token.end]
+        if token.kind == 'command' and text in SECTIONS and text.startswith('\\section'):
+            heading, _ = _argument(body, token.end)
+            match = PART_HEADING.match(' '.join(heading.split()))
+            is_solutions = not match and SOLUTIONS_HEADING.search(heading) is not None
+            close_answer(token.start)
+            if solutions is not None and not is_solutions:
+                removed.append((solutions, begin + token.start))
+                solutions = None
+            elif solutions is None and is_solutions:
+                solutions = begin + token.start
+        elif token.kind == 'command' and text == '\\item' and current is not None and depth == 1:
+            close_item(token.start)
+            item = begin + token.start
+        elif token.kind == 'command' and text == '\\item' and answer_list and depth == 1:
+            close_answer(token.start)
+            answer_number += 1
+            answer = [answer_number, begin + token.end]
+        elif token.kind == 'env':
+            match = re.match(r'\\(begin|end)\s*\{([^}]*)\}', text)
+            if match is None:
+                continue
+            side, name = match.group(1), match.group(2).strip()
+            if name in LISTS:
+                if side == 'begin' and depth == 0 and solutions is None and not envs:
+                    options = LIST_OPTIONS.match(body, token.end)
+                    option_text = options.group(1) if options else ''
+                    number = _start(option_text, number) - 1
+                    current = ProblemList(begin + token.start, begin + (options.end() if options else token.end),
+                                          option_text, [])
+                elif side == 'begin' and depth == 0 and solutions is not None and name == 'enumerate':
+                    options = LIST_OPTIONS.match(body, token.end)
+                    answer_number = _start(options.group(1) if options else '', answer_number) - 1
+                    answer_list = True
+                elif side == 'end' and depth == 1 and answer_list:
+                    close_answer(token.start)
+                    answer_list = False
+                elif side == 'end' and depth == 1 and current is not None:
+                    close_item(token.start)
+                    if current.problems:
+                        lists.append(current)
+                    current = None
+                depth += 1 if side == 'begin' else -1
+            elif name in box_kinds or name in theorem_kinds:
+                envs += 1 if side == 'begin' else -1
+            elif name == 'document' and side == 'end' and solutions is not None:
+                removed.append((solutions, begin + token.start))
+                solutions = None
+
+    numbers = [problem.number for group in lists for problem in group.problems]
+    solution_texts = {}
+    # Worked solutions are only matched when the printed numbers are unambiguous
+    if len(numbers) == len(set(numbers)):
+        found = [(number, start, end) for number, start, end in answers]
+        for start, end in removed:
+            marks = list(SOLUTION_MARK.finditer(content, start, end))
+            for mark, following in zip(marks, marks[1:] + [None]):
+                found.append((int(mark.group(1) or mark.group(2)), mark.end(),
+                              following.start() if following else end))
+        for number, start, end in sorted(found, key=lambda found: found[1]):
+            text = content[start:end].strip()
+            if number in solution_texts:
+                text = f"{solution_texts[number]}\n\n{text}"
+            solution_texts[number] = text
+    return Layout(lists, removed, solution_texts)
+
+# --- Templates -------------------------------------------------------------
+
+OPERATORS = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul,
+    ast.Div: operator.truediv, ast.Pow: operator.pow, ast.USub: operator.neg, ast.UAdd: operator.pos,
+}
+
+def _number(text):
+    return Fraction(text.strip())
+
+def parameters(content):
+    """Declared parameters: name -> list of possible values."""
+    declared = {}
+    for name, values in DECLARATION.findall(content):
+        match = RANGE.match(values)
+        if match:
+            declared[name] = [Fraction(v) for v in range(int(match.group(1)), int(match.group(2)) + 1)]
+        else:
+            declared[name] = [_number(value) for value in values.split(',') if value.strip()]
+    return declared
+
+def evaluate(expression, values):
+    """Value of an arithmetic expression over the parameters, as a Fraction."""
+    def walk(node):
+        if isinstance(node, ast.Expression):
+            return walk(node.body)
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            return Fraction(str(node.value))
+        if isinstance(node, ast.Name) and node.id in values:
+            return values[node.id]
+        if isinstance(node, ast.BinOp) and type(node.op) in OPERATORS:
+            left, right = walk(node.left), walk(node.right)
+            if isinstance(node.op, ast.Pow) and right.denominator != 1:
+                raise ValueError(f"non-integer power in {expression!r}")
+            return OPERATORS[type(node.op)](left, right)
+        if isinstance(node, ast.UnaryOp) and type(node.op) in OPERATORS:
+            return OPERATORS[type(node.op)](walk(node.operand))
+        raise ValueError(f"cannot evaluate {expression!r}")
+    try:
+        return walk(ast.parse(expression, mode='eval'))
+    except (SyntaxError, ZeroDivisionError) as e:
+        raise ValueError(f"cannot evaluate {expression!r}: {e}") from None
+
+def format_value(value):
+    if value.denominator == 1:
+        return str(value.numerator)
+    sign = '-' if value < 0 else ''
+    return f"{sign}\\frac{{{abs(value.numerator)}}}{{{value.denominator}}}"
+
+def fill_template(content, values):
+    """Replace every \\vary{expression}{default} of the body with the expression's value."""
+    pieces = []
+    last = max(content.find('\\begin{document}'), 0)
+    pieces.append(content[:last])
+    for match in VARY.finditer(content, last):
+        if match.start() < last:
+            continue
+        expression, after = _argument(content, match.end())
+        _, after = _argument(content, after)
+        pieces.append(content[last:match.start()])
+        pieces.append(format_value(evaluate(expression, values)))
+        last = after
+    pieces.append(content[last:])
+    return ''.join(pieces)
+
+# --- Variants --------------------------------------------------------------
+
+def _retitle(head, suffix):
+    """Head of a document with a line added to its \\title."""
+    match = re.search(r'\\title\s*(?=\{)', head)
+    if match is None:
+        return head
+    title, end = _argument(head, match.end())
+    return f"{head[:match.start()]}\\title{{{title} \\\\ \\large {suffix}}}{head[end:]}"
+
+def variant(content, parsed, name, seed):
+    """Source of the variant for a seed, its answer key, and its problem order.
+
+    The order lists (variant number, source number) for every problem.
+    """
+    rng = random.Random(f"{name}:{seed}")
+    values = {key: rng.choice(choices) for key, choices in sorted(parameters(content).items())}
+
+    # (start, end, replacement) of the shuffled lists and the removed sections
+    edits = [(start, end, '') for start, end in parsed.removed]
+    order = []
+    for group in parsed.lists:
+        problems = list(group.problems)
+        rng.shuffle(problems)
+        kept = [option for option in group.options.split(',')
+                if option.strip() and not START_OPTION.match(option)]
+        options = ','.join(kept + [f"start={len(order) + 1}"])
+        first = group.problems[0]
+        gap = content[first.end:group.problems[1].start] if len(group.problems) > 1 else '\n'
+        shuffled = gap.join(content[problem.start:problem.end] for problem in problems)
+        edits.append((group.begin, group.problems[-1].end,
+                      f"\\begin{{enumerate}}[{options}]{content[group.body:first.start]}{shuffled}"))
+        order.extend((len(order) + 1, problem.number) for problem in problems)
+
+    pieces = []
+    last = 0
+    for start, end, replacement in sorted(edits):
+        pieces += [content[last:start], replacement]
+        last = end
+    pieces.append(content[last:])
+    source = ''.join(pieces)
+
+    begin = source.find('\\begin{document}')
+    source = _retitle(source[:begin], f"Version {seed}") + source[begin:]
+
+    lines = ['\\begin{document}', '\\maketitle', '', '\\section*{Answer Key}', '']
+    for number, original in order:
+        solution = parsed.solutions.get(original, 'No worked solution in the source.')
+        lines += [f"\\textbf{{Problem {number}}} (source problem {original}): {solution}", '']
+    lines.append('\\end{document}')
+    head = content[:content.find('\\begin{document}')]
+    key = _retitle(head, f"Answer Key, Version {seed}") + '\n'.join(lines) + '\n'
+    return fill_template(source, values), fill_template(key, values), order
+
+def _write_if_changed(path, text):
+    try:
+        if path.read_text(encoding='utf-8') == text:
+            return
+    except OSError:
+        pass
+    path.write_text(text, encoding='utf-8')
+
+def write_variants(lesson_num, seeds, keys=True):
+    """Write the variant (and key) sources of a problem set; returns their paths."""
+    tex = lesson_paths.tex_path(lesson_num, 'problems')
+    content = tex.read_text(encoding='utf-8')
+    parsed = layout(content)
+    out_dir = VARIANT_DIR / tex.stem
+    out_dir.mkdir(parents=True, exist_ok=True)
+    written = []
+    for seed in seeds:
+        source, key, _ = variant(content, parsed, tex.stem, seed)
+        for suffix, text in [('', source)] + ([('_key', key)] if keys else []):
+            path = out_dir / f"{tex.stem}_v{seed}{suffix}.tex"
+            _write_if_changed(path, text)
+            written.append(path)
+    return written
+
+def compile_variant(tex, output):
+    """Compile a variant source into output; returns (ok, note)."""
+    pdf = output / f"{tex.stem}.pdf"
+    if is_up_to_date(tex, pdf):
+        return True, 'up to date'
+    result = compile_stage.run_pdflatex(tex, timeout=60, note_passes=False, pdf_path=pdf)
+    if not result.ok:
+        error = first_error(parse_log(result.log))
+        return False, f"line {error.line}: {error.message}" if error else 'see the log'
+    record_build(tex, pdf)
+    return True, None
+
+def main():
+    """Generate and compile the variants of the selected problem sets."""
+    parser = argparse.ArgumentParser(description="Build shuffled exam variants of the problem sets")
+    add_lessons_argument(parser)
+    parser.add_argument('--seeds', type=parse_lessons, default=parse_lessons('1-4'),
+                        help="variant seeds, e.g. 1-20,42 (default: 1-4)")
+    parser.add_argument('--no-keys', dest='keys', action='store_false', help="skip the answer keys")
+    parser.add_argument('--output', type=Path,
+                        help="directory for the PDFs (default: lesson_NN/variants)")
+    parser.add_argument('--dry-run', action='store_true', help="write the sources without compiling them")
+    compile_stage.add_jobs_argument(parser)
+    args = parser.parse_args()
+
+    jobs = []
+    for lesson_num in lesson_paths.selected(args.lessons):
+        if not lesson_paths.tex_path(lesson_num, 'problems').exists():
+            continue
+        try:
+            sources = write_variants(lesson_num, args.seeds, args.keys)
+        except ValueError as e:
+            print(f"Lesson {lesson_num:2}: {e}")
+            continue
+        output = args.output or lesson_paths.lesson_dir(lesson_num) / 'variants'
+        jobs += [(lesson_num, tex, output) for tex in sources]
+        print(f"Lesson {lesson_num:2}: {len(sources)} sources in {sources[0].parent}" if sources else
+              f"Lesson {lesson_num:2}: no seeds")
+    if args.dry_run or not jobs:
+        return 0
+
+    for output in {output for _, _, output in jobs}:
+        output.mkdir(parents=True, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=min(args.jobs, len(jobs))) as executor:
+        results = list(executor.map(lambda job: compile_variant(job[1], job[2]), jobs))
+    failed = 0
+    for (_, tex, _), (ok, note) in zip(jobs, results):
+        if not ok:
+            failed += 1
+            print(f"  {tex.stem}: failed, {note}")
+    current = sum(1 for _, note in results if note == 'up to date')
+    print(f"{len(jobs) - failed - current} built, {current} up to date, {failed} failed")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Watch directories for changed files, with inotify or by polling
+
+On Linux the kernel's inotify interface is used through ctypes, so a save
+is seen as soon as the editor closes the file. Elsewhere, or when
+inotify is unavailable, the directories are polled by comparing the size
+and mtime of their files. Either way, bursts of events (editors that
+write, rename and touch in quick succession, a `git checkout`) are
+collected until the directories have been quiet for a short while and
+reported as one batch.
+
+Usage:
+    file_watch.py DIR...    print batches of changed files
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+
+# inotify(7) event masks
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_MOVED_FROM = 0x00000040
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_CREATE | IN_DELETE
+
+EVENT_HEADER = struct.Struct('iIII')
+
+# Editor swap and backup files, and the temporary files written before a rename
+IGNORED_SUFFIXES = ('~', '.swp', '.swx', '.tmp')
+
+def ignored(path):
+    name = Path(path).name
+    return name.startswith(('.', '#')) or name.endswith(IGNORED_SUFFIXES)
+
+class InotifyWatcher:
+    """Changed files in a set of directories, from the kernel's inotify."""
+
+    def __init__(self, directories):
+        libc_name = ctypes.util.find_library('c')
+        if libc_name is None:
+            raise OSError("libc not found")
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories = {}   # watch descriptor -> directory
+        for directory in directories:
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(str(directory)), WATCH_MASK)
+            if wd < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), f"cannot watch {directory}")
+            self.directories[wd] = Path(directory)
+
+    def wait(self, timeout):
+        """Changed paths seen within `timeout` seconds (None waits forever)."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        changed = set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped; report every watched directory
+                changed.update(self.directories.values())
+                continue
+            if wd in self.directories and name:
+                path = self.directories[wd] / os.fsdecode(name)
+                if not ignored(path):
+                    changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+class PollingWatcher:
+    """Changed files in a set of directories, found by comparing stat results."""
+
+    def __init__(self, directories, interval=0.5):
+        self.directories = [Path(directory) for directory in directories]
+        self.interval = interval
+        self.state = self._snapshot()
+
+    def _snapshot(self):
+        state = {}
+        for directory in self.directories:
+            try:
+                entries = os.scandir(directory)
+            except OSError:
+                continue
+            with entries:
+                for entry in entries:
+                    if ignored(entry.name):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    state[entry.path] = (stat.st_size, stat.st_mtime_ns)
+        return state
+
+    def wait(self, timeout):
+        """Changed paths seen within `timeout` seconds (None waits forever)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            pause = self.interval if deadline is None else min(self.interval, max(0, deadline - time.monotonic()))
+            time.sleep(pause)
+            state = self._snapshot()
+            changed = {Path(path) for path in state.keys() | self.state.keys()
+                       if state.get(path) != self.state.get(path)}
+            self.state = state
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed
+
+    def close(self):
+        pass
+
+def watcher(directories, poll_interval=0.5):
+    """An inotify watcher where the platform has one, a polling watcher otherwise."""
+    directories = [directory for directory in directories if Path(directory).is_dir()]
+    try:
+        return InotifyWatcher(directories)
+    except (OSError, AttributeError):
+        return PollingWatcher(directories, poll_interval)
+
+def batches(watch, debounce=0.3):
+    """Yield sets of changed paths, each collected until `debounce` seconds pass quietly."""
+    while True:
+        changed = watch.wait(None)
+        while changed:
+            more = watch.wait(debounce)
+            if not more:
+                break
+            changed |= more
+        if changed:
+            yield changed
+
+def main():
+    """Print each batch of changes in the given directories."""
+    parser = argparse.ArgumentParser(description="Print batches of changed files")
+    parser.add_argument('directories', nargs='+')
+    parser.add_argument('--debounce', type=float, default=0.3, help="quiet time closing a batch (seconds)")
+    args = parser.parse_args()
+
+    watch = watcher(args.directories)
+    print(f"Watching {len(args.directories)} directories ({type(watch).__name__})")
+    try:
+        for changed in batches(watch, args.debounce):
+            for path in sorted(changed):
+                print(path)
+            print()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watch.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,506 @@
+#!/usr/bin/env python3
+"""
+Registry of LaTeX fix passes shared by the lesson fixer scripts
+
+Every fix is a named rule that rewrites a document in memory and reports
+how many changes it made. A profile is an ordered list of rule names; the
+old per-script fixers are now profiles over the same registry. The driver
+reads each document once, runs the selected passes, and writes it back
+only if its bytes changed, recording the versions before and after in
+the artifact store so a fix can be undone.
+
+Usage:
+    fix_rules.py [--profile NAME | --rules a,b,...] [--dry-run] [FILE...]
+    fix_rules.py --list
+"""
+
+import argparse
+import re
+import sys
+from collections import Counter
+from pathlib import Path
+
+import artifact_store
+import lesson_paths
+from build_trace import add_trace_argument, span
+from latex_tokens import map_text, map_tokens
+from latex_unicode import describe_unmapped
+from latex_unicode import translate as translate_unicode
+
+# name -> function(content, ctx) returning (content, hits)
+RULES = {}
+
+def rule(name):
+    """Register a fix pass under `name`."""
+    def register(func):
+        RULES[name] = func
+        return func
+    return register
+
+def regex_rule(name, substitutions, flags=0, text_only=False):
+    """Register a pass made of (pattern, replacement) substitutions applied in order.
+
+    With text_only the substitutions only see text-mode runs (text and the
+    commands used in it), so patterns that put material into math mode
+    never touch what is already math.
+    """
+    compiled = [(re.compile(pattern, flags), repl) for pattern, repl in substitutions]
+
+    def apply(content, ctx):
+        hits = 0
+        for pattern, repl in compiled:
+            if text_only:
+                content, n = map_text(content, lambda text: pattern.subn(repl, text), with_commands=True)
+            else:
+                content, n = pattern.subn(repl, content)
+            hits += n
+        return content, hits
+
+    RULES[name] = apply
+    return apply
+
+def _insert_before_document(content, line):
+    """Insert a preamble line right before \\begin{document}, if there is one."""
+    insert_pos = content.find('\\begin{document}')
+    if insert_pos > 0:
+        return content[:insert_pos] + line + '\n' + content[insert_pos:], 1
+    return content, 0
+
+# --- Packages -------------------------------------------------------------
+
+regex_rule('remove_nicematrix_package', [
+    (r'\\usepackage\{nicematrix\}\s*\n?', ''),
+])
+
+regex_rule('remove_unavailable_packages', [
+    (r'\\usepackage\{nicematrix[^}]*\}', ''),
+    (r'\\usepackage\{[^}]*nicematrix[^}]*\}', ''),
+    (r'\\usepackage\{[^}]*systeme[^}]*\}', ''),
+    # Fix the package line if it becomes empty
+    (r'\\usepackage\{\s*,\s*', r'\\usepackage{'),
+    (r',\s*\}', r'}'),
+    (r'\\usepackage\{\s*\}', ''),
+])
+
+regex_rule('replace_nicematrix_environments', [
+    (r'\\begin\{bNiceMatrix\}', r'\\begin{bmatrix}'),
+    (r'\\end\{bNiceMatrix\}', r'\\end{bmatrix}'),
+    (r'\\begin\{pNiceMatrix\}', r'\\begin{pmatrix}'),
+    (r'\\end\{pNiceMatrix\}', r'\\end{pmatrix}'),
+])
+
+regex_rule('replace_systeme', [
+    (r'\\systeme\{([^}]+)\}',
+     lambda m: r'\begin{aligned}' + m.group(1).replace(',', r'\\') + r'\end{aligned}'),
+])
+
+@rule('require_amsmath_after_documentclass')
+def require_amsmath_after_documentclass(content, ctx):
+    """Load amsmath right after \\documentclass when matrices or aligned are used."""
+    if 'bmatrix' in content or 'pmatrix' in content or 'aligned' in content:
+        if 'amsmath' not in content:
+            return re.subn(r'(\\documentclass[^}]+\})', r'\1\n\\usepackage{amsmath}', content)
+    return content, 0
+
+@rule('require_amssymb_amsmath')
+def require_amssymb_amsmath(content, ctx):
+    """Load amssymb for \\mathbb and amsmath for \\bmatrix."""
+    hits = 0
+    if '\\mathbb' in content and 'amssymb' not in content:
+        content = content.replace('\\begin{document}', '\\usepackage{amssymb}\n\\begin{document}')
+        hits += 1
+    if '\\bmatrix' in content and 'amsmath' not in content:
+        content = content.replace('\\begin{document}', '\\usepackage{amsmath}\n\\begin{document}')
+        hits += 1
+    return content, hits
+
+@rule('require_used_packages')
+def require_used_packages(content, ctx):
+    """Add packages for matrices, \\mathbb, tikz, mdframed and enumerate if missing."""
+    hits = 0
+
+    # Fix bmatrix environment
+    if '\\bmatrix' in content or '\\pmatrix' in content:
+        if 'amsmath' not in content and '\\usepackage{geometry' in content:
+            content = content.replace('\\usepackage{geometry',
+                                      '\\usepackage{amsmath}\n\\usepackage{geometry')
+            hits += 1
+
+    required_packages = {
+        '\\mathbb': 'amssymb',
+        '\\bmatrix': 'amsmath',
+        '\\pmatrix': 'amsmath',
+        'tikzpicture': 'tikz',
+        'mdframed': 'mdframed',
+        'enumerate': 'enumitem'
+    }
+    for command, package in required_packages.items():
+        if command in content and package not in content:
+            content, n = _insert_before_document(content, f'\\usepackage{{{package}}}')
+            hits += n
+    return content, hits
+
+# --- Unicode and control sequences ---------------------------------------
+
+@rule('translate_unicode')
+def translate_unicode_rule(content, ctx):
+    """Translate Unicode symbols to LaTeX in one pass."""
+    translated, unmapped = translate_unicode(content)
+    for message in describe_unmapped(unmapped):
+        print(f"{ctx.get('path', '<document>')}: unmapped character at {message}")
+    return translated, int(translated != content)
+
+@rule('replace_undefined_shortcuts')
+def replace_undefined_shortcuts(content, ctx):
+    """Replace shortcut macros (\\RR, \\CC, ...) that the documents never define."""
+    fixes = {
+        r'\\Rightarrow': r'\\rightarrow',
+        r'\\RR': r'\\mathbb{R}',
+        r'\\CC': r'\\mathbb{C}',
+        r'\\NN': r'\\mathbb{N}',
+        r'\\ZZ': r'\\mathbb{Z}',
+        r'\\QQ': r'\\mathbb{Q}',
+    }
+    hits = 0
+    for old, new in fixes.items():
+        hits += content.count(old)
+        content = content.replace(old, new)
+    return content, hits
+
+@rule('checkmark_math_mode')
+def checkmark_math_mode(content, ctx):
+    """Put \\checkmark in math mode where it is used in text."""
+    return map_tokens(content, lambda text: ('$\\checkmark$', 1) if text == '\\checkmark' else (text, 0),
+                      kinds=('command',))
+
+# --- Titles --------------------------------------------------------------
+
+regex_rule('ode_title_prefix', [
+    (r'\\title\{Lesson (\d+):', r'\\title{ODE Lesson \1:'),
+])
+
+# --- Sub/superscripts and exponentials -------------------------------------
+
+regex_rule('unwrap_dollar_scripts', [
+    # Fix malformed subscripts: $_{n}$ -> _{n}
+    (r'\$\_{([^}]+)}\$', r'_{\1}'),
+    (r'\$\^{([^}]+)}\$', r'^{\1}'),
+])
+
+regex_rule('unwrap_dollar_digit_scripts', [
+    (r'\$_\{(\d+)\}\$', r'_{\1}'),
+    (r'\$\^\{(\d+)\}\$', r'^{\1}'),
+    (r'q\$_\{([0-9]+)\}\$', r'q_{\1}'),
+    (r'c\$_\{([0-9]+)\}\$', r'c_{\1}'),
+    (r'y\$_\{([0-9pn]+)\}\$', r'y_{\1}'),
+    (r'x\$_\{([0-9]+)\}\$', r'x_{\1}'),
+    (r'a\$_\{([0-9]+)\}\$', r'a_{\1}'),
+    (r'b\$_\{([0-9]+)\}\$', r'b_{\1}'),
+    (r'\$\$([^$]+)\$\$\$', r'$$\1$$'),
+])
+
+regex_rule('unwrap_letter_dollar_scripts', [
+    # Fix specific patterns like q$_{0}$
+    (r'([a-zA-Z])\$_\{([^}]+)\}\$', r'\1_{\2}'),
+    (r'([a-zA-Z])\$\^\{([^}]+)\}\$', r'\1^{\2}'),
+])
+
+regex_rule('wrap_bare_scripts', [
+    (r'([^$\\])_([a-zA-Z0-9]+)', r'\1$_{\2}$'),
+    (r'([^$\\])\^([a-zA-Z0-9]+)', r'\1$^{\2}$'),
+], text_only=True)
+
+regex_rule('wrap_bare_braced_scripts', [
+    (r'([^$\\])_\{([^}]+)\}([^$])', r'\1$_{\2}$\3'),
+    (r'([^$\\])\^\{([^}]+)\}([^$])', r'\1$^{\2}$\3'),
+], text_only=True)
+
+regex_rule('repair_exponentials', [
+    # Fix malformed exponentials: $e^{-t$}$ -> e^{-t}
+    (r'\$e\^\{([^}]+)\$\}\$', r'e^{\1}'),
+    (r'\$([^$]*)\$e\^\{([^}]+)\$\}\$', r'\1 e^{\2}'),
+    # Fix mixed math modes in matrices and equations
+    (r'\$([^$]*e\^[^$]*)\$', lambda m: m.group(1)),
+])
+
+regex_rule('times_in_example_titles', [
+    (r'\\begin\{example\}\[(\d+)\\times(\d+)', r'\\begin{example}[\1$\\times$\2'),
+])
+
+regex_rule('repair_exponential_expressions', [
+    # Fix complex malformed expressions
+    (r'\$([^$]*)\$_\{([^}]+)\}\$([^$]*)\$', r'\1_{\2}\3'),
+    # Fix exponential expressions in matrices
+    (r'(\d+)\$e\^\{([^}]+)\}\$', r'\1e^{\2}'),
+    (r'([+-])\$e\^\{([^}]+)\}\$', r'\1e^{\2}'),
+    (r'W\(0\) = (\d+)\$', r'W(0) = $\1$'),
+])
+
+regex_rule('wrap_text_exponentials', [
+    # Fix plain exponentials not in math mode
+    (r'([^$\\\w])e\^\{([^}]+)\}([^$\\\w])', r'\1$e^{\2}$\3'),
+    (r'W\(t\) = ([^$\n]+)e\^\{([^}]+)\}', r'W(t) = $\1e^{\2}$'),
+], text_only=True)
+
+regex_rule('wrap_bare_exponentials', [
+    (r'([^\\$])(e\^[{]?[^$\s]+[}]?)([^$])', r'\1$\2$\3'),
+], text_only=True)
+
+# --- Math environments -----------------------------------------------------
+
+regex_rule('strip_dollars_in_align', [
+    (r'\\begin\{align\*?\}(.*?)\\end\{align\*?\}',
+     lambda m: m.group(0) if '$' not in m.group(1) else m.group(0).replace('$', '')),
+], flags=re.DOTALL)
+
+regex_rule('strip_single_dollar_in_align', [
+    (r'\\begin\{align\}([^$]*)\$([^$]*)\$([^$]*)\\end\{align\}', r'\\begin{align}\1\2\3\\end{align}'),
+])
+
+regex_rule('strip_double_dollars_in_align', [
+    (r'\\begin\{align\}([^$]*)\$\$([^$]*)\$\$([^$]*)\\end\{align\}', r'\\begin{align}\1\2\3\\end{align}'),
+], flags=re.DOTALL)
+
+# --- Document structure -----------------------------------------------------
+
+@rule('ensure_document_structure')
+def ensure_document_structure(content, ctx):
+    """Add a missing \\documentclass and \\begin{document}."""
+    hits = 0
+    if '\\documentclass' not in content:
+        content = '\\documentclass[12pt]{article}\n' + content
+        hits += 1
+
+    if '\\begin{document}' not in content and '\\title' in content:
+        title_end = content.find('\\date')
+        if title_end == -1:
+            title_end = content.find('\\maketitle')
+        if title_end > 0:
+            content = content[:title_end+20] + '\n\\begin{document}\n\\maketitle\n' + content[title_end+20:]
+            hits += 1
+    return content, hits
+
+@rule('ensure_end_document')
+def ensure_end_document(content, ctx):
+    """Close the document if \\end{document} is missing."""
+    if '\\end{document}' not in content:
+        return content + '\n\\end{document}', 1
+    return content, 0
+
+# --- Lesson metadata ---------------------------------------------------------
+
+@rule('number_lesson_title')
+def number_lesson_title(content, ctx):
+    """Prefix the \\title with 'ODE Lesson N:' when it lacks the lesson number."""
+    lesson_num = ctx.get('lesson_num')
+    if lesson_num is None or f'Lesson {lesson_num}:' in content:
+        return content, 0
+    return re.subn(r'\\title\{([^}]+)\}', f'\\\\title{{ODE Lesson {lesson_num}: \\1}}', content)
+
+@rule('course_author')
+def course_author(content, ctx):
+    """Credit the course in the \\author line."""
+    if 'Prof. Adi Ditkowski' in content:
+        return content, 0
+    return re.subn(r'\\author\{[^}]*\}', r'\\author{ODE 1 - Prof. Adi Ditkowski}', content)
+
+@rule('lesson_environments')
+def lesson_environments(content, ctx):
+    """Define the theorem and box environments of the lessons if none are."""
+    if '\\newmdenv' in content or '\\begin{document}' not in content:
+        return content, 0
+    environments = """% Custom environments
+\\newtheorem{definition}{Definition}
+\\newtheorem{theorem}{Theorem}
+\\newtheorem{method}{Method}
+\\newtheorem{example}{Example}
+\\newmdenv[linecolor=blue,linewidth=2pt]{keypoint}
+\\newmdenv[linecolor=red,linewidth=2pt]{warning}
+\\newmdenv[linecolor=green,linewidth=2pt]{insight}
+
+"""
+    return content.replace('\\begin{document}', environments + '\\begin{document}'), 1
+
+@rule('practice_problems_title')
+def practice_problems_title(content, ctx):
+    """Title a problems document 'Practice Problems: Lesson N'."""
+    lesson_num = ctx.get('lesson_num')
+    if lesson_num is None or 'Practice Problems' in content:
+        return content, 0
+    return re.subn(r'\\title\{([^}]+)\}', f'\\\\title{{Practice Problems: Lesson {lesson_num}}}', content)
+
+# --- Lesson specific ----------------------------------------------------------
+
+@rule('lesson_specific')
+def lesson_specific(content, ctx):
+    """One-off fixes for individual lessons."""
+    lesson_num = ctx.get('lesson_num')
+    hits = 0
+    if lesson_num == 32:
+        # Complex eigenvalues lesson - ensure proper formatting
+        content, n = map_text(content, lambda text: re.subn(r'\\lambda = \\alpha \\pm i\\beta',
+                                                            r'$\\lambda = \\alpha \\pm i\\beta$', text),
+                              with_commands=True)
+        hits += n
+    return content, hits
+
+# Ordered rule chains reproducing each script's fixer
+PROFILES = {
+    'fix_all_lessons': [
+        'remove_nicematrix_package',
+        'ode_title_prefix',
+        'unwrap_dollar_scripts',
+        'repair_exponentials',
+        'times_in_example_titles',
+        'repair_exponential_expressions',
+        'wrap_text_exponentials',
+    ],
+    'fix_latex': [
+        'translate_unicode',
+        'replace_undefined_shortcuts',
+        'wrap_bare_scripts',
+        'require_amssymb_amsmath',
+        'strip_dollars_in_align',
+        'ensure_document_structure',
+        'ensure_end_document',
+    ],
+    'fix_lessons_30_50': [
+        'remove_unavailable_packages',
+        'wrap_bare_braced_scripts',
+        'unwrap_letter_dollar_scripts',
+        'strip_double_dollars_in_align',
+        'replace_nicematrix_environments',
+        'replace_systeme',
+        'require_amsmath_after_documentclass',
+        'lesson_specific',
+    ],
+    'enhance_lessons': [
+        'unwrap_dollar_digit_scripts',
+        'checkmark_math_mode',
+        'wrap_bare_exponentials',
+        'require_used_packages',
+        'ensure_end_document',
+        'strip_single_dollar_in_align',
+    ],
+    # enhance_lessons.py: the shared chain, then each document's metadata
+    'enhance_theory': [
+        'unwrap_dollar_digit_scripts',
+        'checkmark_math_mode',
+        'wrap_bare_exponentials',
+        'require_used_packages',
+        'ensure_end_document',
+        'strip_single_dollar_in_align',
+        'number_lesson_title',
+        'course_author',
+        'lesson_environments',
+    ],
+    'enhance_problems': [
+        'unwrap_dollar_digit_scripts',
+        'checkmark_math_mode',
+        'wrap_bare_exponentials',
+        'require_used_packages',
+        'ensure_end_document',
+        'strip_single_dollar_in_align',
+        'practice_problems_title',
+    ],
+    # Everything that is safe to run on any document, in one pass. The
+    # unwrap_*_scripts repairs are not: they strip the $...$ that text-mode
+    # scripts need, including the ones translate_unicode adds.
+    'cleanup': [
+        'remove_unavailable_packages',
+        'replace_nicematrix_environments',
+        'replace_systeme',
+        'strip_dollars_in_align',
+        'translate_unicode',
+        'replace_undefined_shortcuts',
+        'ode_title_prefix',
+        'times_in_example_titles',
+        'require_amsmath_after_documentclass',
+        'require_amssymb_amsmath',
+        'ensure_document_structure',
+        'ensure_end_document',
+        'lesson_specific',
+    ],
+}
+
+def lesson_number(path):
+    """Lesson number from a file name like lesson_32.tex or problems_07.tex."""
+    match = re.search(r'(\d+)', Path(path).stem)
+    return int(match.group(1)) if match else None
+
+def apply_rules(content, rules, ctx=None):
+    """Run the named rules over content in order; return (content, hit counts)."""
+    ctx = ctx or {}
+    hits = Counter()
+    for name in rules:
+        with span('fix', rule=name, path=ctx.get('path')) as event:
+            content, n = RULES[name](content, ctx)
+            event['hits'] = n
+        if n:
+            hits[name] += n
+    return content, hits
+
+def fix_file(path, rules, lesson_num=None, dry_run=False):
+    """Read a document once, apply the rules, and write it once if it changed.
+
+    Returns (changed, hit counts).
+    """
+    path = Path(path)
+    original = path.read_bytes()
+    ctx = {
+        'path': str(path),
+        'lesson_num': lesson_num if lesson_num is not None else lesson_number(path),
+    }
+    content, hits = apply_rules(original.decode('utf-8'), rules, ctx)
+    updated = content.encode('utf-8')
+    changed = updated != original
+    if changed and not dry_run:
+        # Both versions go into the file's history in the artifact store
+        artifact_store.save(path, 'before fix', original)
+        path.write_bytes(updated)
+        artifact_store.save(path, 'fix', updated)
+    return changed, hits
+
+def main():
+    """Run a rule chain over lesson sources and report per-rule hit counts."""
+    parser = argparse.ArgumentParser(description="Apply LaTeX fix passes to lesson documents")
+    parser.add_argument('files', nargs='*', help="documents to fix (default: lesson_*/src/*.tex)")
+    parser.add_argument('--profile', default='cleanup', choices=sorted(PROFILES),
+                        help="named rule chain to run (default: cleanup)")
+    parser.add_argument('--rules', help="comma-separated rule names, overriding --profile")
+    parser.add_argument('--dry-run', action='store_true', help="report without writing files")
+    parser.add_argument('--list', action='store_true', help="list rules and profiles")
+    add_trace_argument(parser)
+    args = parser.parse_args()
+
+    if args.list:
+        print("Rules:")
+        for name in RULES:
+            print(f"  {name}")
+        print("Profiles:")
+        for name, rules in PROFILES.items():
+            print(f"  {name}: {', '.join(rules)}")
+        return 0
+
+    rules = args.rules.split(',') if args.rules else PROFILES[args.profile]
+    unknown = [name for name in rules if name not in RULES]
+    if unknown:
+        parser.error(f"unknown rules: {', '.join(unknown)}")
+
+    files = args.files or [str(path) for path in lesson_paths.documents()]
+    total = Counter()
+    changed_files = 0
+    for path in files:
+        changed, hits = fix_file(path, rules, dry_run=args.dry_run)
+        total.update(hits)
+        if changed:
+            changed_files += 1
+            print(f"Fixed {path}")
+
+    print(f"\n{changed_files}/{len(files)} files changed")
+    for name in rules:
+        print(f"  {name}: {total.get(name, 0)}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
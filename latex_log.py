@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Structured pdflatex log parsing and targeted, line-local fixes
+
+parse_log() turns pdflatex output into a list of errors with their kind,
+file, line, offending token and message; the first entry is the error
+that caused the rest. fix_errors() repairs only the lines those errors
+point at, so a failed compile is followed by a small edit rather than a
+whole-document rewrite.
+
+Usage:
+    latex_log.py LOGFILE    print the errors found in a pdflatex log
+"""
+
+import re
+import sys
+from collections import namedtuple
+from pathlib import Path
+
+LogError = namedtuple('LogError', ['kind', 'file', 'line', 'token', 'message'])
+
+# ./lesson_32.tex:45: Undefined control sequence.   (-file-line-error)
+# lesson_32.tex:45:7: $ inside align environment    (lint_latex)
+FILE_LINE_ERROR = re.compile(r'^(.*?\.(?:tex|sty|cls|aux|toc)):(\d+):(?:\d+:)? (.*)$')
+CONTEXT_LINE = re.compile(r'^l\.(\d+) (.*)$')
+CONTROL_SEQUENCE = re.compile(r'\\[A-Za-z@]+')
+
+ERROR_KINDS = [
+    ('undefined_control_sequence', re.compile(r'Undefined control sequence|Command (\\\S+) requires')),
+    ('missing_file', re.compile(r"LaTeX Error: File `([^']+)' not found")),
+    ('undefined_environment', re.compile(r'LaTeX Error: Environment (\S+) undefined|Environment (\S+) requires')),
+    ('missing_dollar', re.compile(r'Missing \$ inserted|\$ inside \S+ environment')),
+    ('environment_mismatch', re.compile(r'LaTeX Error: \\begin\{([^}]+)\} on input line \d+ ended by')),
+    ('extra_brace', re.compile(r'Extra \}, or forgotten')),
+    ('missing_brace', re.compile(r'Missing \} inserted')),
+    ('double_script', re.compile(r'Double (?:sub|super)script')),
+    ('misplaced_alignment', re.compile(r'Misplaced alignment tab')),
+    ('no_end_document', re.compile(r'no legal \\end found|Missing \\end\{document\}|Emergency stop')),
+]
+
+# Shortcut macros the documents use but never define
+REPLACEMENTS = {
+    '\\RR': '\\mathbb{R}',
+    '\\CC': '\\mathbb{C}',
+    '\\NN': '\\mathbb{N}',
+    '\\ZZ': '\\mathbb{Z}',
+    '\\QQ': '\\mathbb{Q}',
+    '\\dd': 'd',
+}
+
+# Commands and environments that only need a package loaded
+COMMAND_PACKAGES = {
+    '\\mathbb': 'amssymb', '\\checkmark': 'amssymb', '\\square': 'amssymb',
+    '\\blacksquare': 'amssymb', '\\nexists': 'amssymb', '\\therefore': 'amssymb',
+    '\\because': 'amssymb', '\\text': 'amsmath', '\\dfrac': 'amsmath',
+    '\\tfrac': 'amsmath', '\\binom': 'amsmath', '\\boxed': 'amsmath',
+    '\\eqref': 'amsmath', '\\iint': 'amsmath', '\\iiint': 'amsmath',
+    '\\coloneqq': 'mathtools', '\\textcolor': 'xcolor', '\\color': 'xcolor',
+    '\\includegraphics': 'graphicx', '\\tikz': 'tikz', '\\cancel': 'cancel',
+    '\\mathscr': 'mathrsfs', '\\ding': 'pifont', '\\toprule': 'booktabs',
+    '\\midrule': 'booktabs', '\\bottomrule': 'booktabs',
+}
+ENVIRONMENT_PACKAGES = {
+    'bmatrix': 'amsmath', 'pmatrix': 'amsmath', 'vmatrix': 'amsmath',
+    'align': 'amsmath', 'align*': 'amsmath', 'aligned': 'amsmath',
+    'cases': 'amsmath', 'gather': 'amsmath', 'gather*': 'amsmath',
+    'tikzpicture': 'tikz', 'axis': 'pgfplots', 'mdframed': 'mdframed',
+    'proof': 'amsthm',
+}
+ENVIRONMENT_REPLACEMENTS = {
+    'bNiceMatrix': 'bmatrix',
+    'pNiceMatrix': 'pmatrix',
+}
+
+MATH_ENVIRONMENT = re.compile(r'\\(begin|end)\{(?:align|equation|gather|multline|eqnarray)\*?\}')
+
+def _classify(message):
+    for kind, pattern in ERROR_KINDS:
+        match = pattern.search(message)
+        if match:
+            return kind, next((group for group in match.groups() if group), None)
+    return 'other', None
+
+def parse_log(text):
+    """Extract the errors from pdflatex output, in the order TeX reported them."""
+    lines = text.splitlines()
+    errors = []
+    for i, line in enumerate(lines):
+        match = FILE_LINE_ERROR.match(line)
+        if match:
+            file, line_number, message = match.group(1), int(match.group(2)), match.group(3)
+        elif line.startswith('! '):
+            file, line_number, message = None, None, line[2:]
+        else:
+            continue
+
+        kind, token = _classify(message)
+
+        # The l.N line shows the input up to the point of the error
+        for follow in lines[i + 1:i + 12]:
+            context = CONTEXT_LINE.match(follow)
+            if context:
+                if line_number is None:
+                    line_number = int(context.group(1))
+                if token is None:
+                    commands = CONTROL_SEQUENCE.findall(context.group(2))
+                    if kind == 'undefined_control_sequence' and commands:
+                        token = commands[-1]
+                    elif kind != 'undefined_control_sequence':
+                        token = context.group(2).split()[-1] if context.group(2).split() else None
+                break
+            if FILE_LINE_ERROR.match(follow) or follow.startswith('! '):
+                break
+
+        errors.append(LogError(kind, file, line_number, token, message))
+    return errors
+
+def first_error(errors):
+    """The error that caused the rest, or None."""
+    return errors[0] if errors else None
+
+def _is_loaded(content, package):
+    return re.search(r'\\usepackage(?:\[[^\]]*\])?\{[^}]*\b' + re.escape(package) + r'\b[^}]*\}', content) is not None
+
+def _require_package(lines, package):
+    """Insert \\usepackage{package} before \\begin{document}; True if it was added."""
+    content = ''.join(lines)
+    if _is_loaded(content, package):
+        return False
+    for i, line in enumerate(lines):
+        if '\\begin{document}' in line:
+            lines.insert(i, f'\\usepackage{{{package}}}\n')
+            return True
+    return False
+
+def _in_math_environment(lines, index):
+    """True if line `index` sits inside an align/equation-like environment."""
+    depth = 0
+    for line in lines[:index]:
+        for match in MATH_ENVIRONMENT.finditer(line):
+            depth += 1 if match.group(1) == 'begin' else -1
+    return depth > 0
+
+def _wrap_math_word(line, token):
+    """Wrap the whitespace-delimited word holding `token` (or the first _/^ word) in $...$."""
+    candidates = []
+    if token:
+        candidates.append(token)
+    candidates += ['_', '^']
+    for candidate in candidates:
+        for match in re.finditer(r'[^\s$]+', line):
+            if candidate in match.group() and '$' not in line[max(0, match.start() - 1):match.end() + 1]:
+                return line[:match.start()] + '$' + match.group() + '$' + line[match.end():]
+    return line
+
+def fix_errors(content, errors, filename=None):
+    """Apply fixes to the lines the errors point at.
+
+    Only errors in `filename` (or without a file) are considered. Returns
+    (content, applied) where applied describes each fix that was made;
+    an empty list means nothing could be fixed and recompiling is pointless.
+    """
+    lines = content.splitlines(keepends=True)
+    applied = []
+    # Line numbers shift when a package line is inserted; fix bottom-up
+    # and insert packages last
+    packages = []
+
+    # TeX and the linter often report one mistake several times on a line
+    relevant = {}
+    for e in errors:
+        if e.file is None or filename is None or Path(e.file).name == filename:
+            relevant.setdefault((e.kind, e.line, e.token), e)
+    for error in sorted(relevant.values(), key=lambda e: -(e.line or 0)):
+        index = error.line - 1 if error.line else None
+        if index is not None and not 0 <= index < len(lines):
+            continue
+
+        if error.kind == 'undefined_control_sequence' and error.token:
+            if error.token in REPLACEMENTS and index is not None:
+                new = re.sub(re.escape(error.token) + r'(?![A-Za-z])',
+                             lambda m: REPLACEMENTS[error.token], lines[index])
+                if new != lines[index]:
+                    lines[index] = new
+                    applied.append(f"line {error.line}: {error.token} -> {REPLACEMENTS[error.token]}")
+            elif error.token in COMMAND_PACKAGES:
+                packages.append((COMMAND_PACKAGES[error.token], error))
+
+        elif error.kind == 'undefined_environment' and error.token:
+            if error.token in ENVIRONMENT_PACKAGES:
+                packages.append((ENVIRONMENT_PACKAGES[error.token], error))
+            elif error.token in ENVIRONMENT_REPLACEMENTS and index is not None:
+                new_env = ENVIRONMENT_REPLACEMENTS[error.token]
+                lines[index] = lines[index].replace(f'\\begin{{{error.token}}}', f'\\begin{{{new_env}}}')
+                for j in range(index, len(lines)):
+                    if f'\\end{{{error.token}}}' in lines[j]:
+                        lines[j] = lines[j].replace(f'\\end{{{error.token}}}', f'\\end{{{new_env}}}', 1)
+                        break
+                applied.append(f"line {error.line}: {error.token} -> {new_env}")
+
+        elif error.kind == 'missing_file' and error.token and error.token.endswith('.sty'):
+            package = error.token[:-4]
+            for i, line in enumerate(lines):
+                match = re.match(r'(\s*\\usepackage(?:\[[^\]]*\])?\{)([^}]*)(\}.*)', line, re.DOTALL)
+                if match and package in [p.strip() for p in match.group(2).split(',')]:
+                    remaining = [p.strip() for p in match.group(2).split(',') if p.strip() != package]
+                    lines[i] = match.group(1) + ', '.join(remaining) + match.group(3) if remaining else ''
+                    applied.append(f"line {i + 1}: removed unavailable package {package}")
+                    break
+
+        elif error.kind == 'missing_dollar' and index is not None:
+            line = lines[index]
+            if _in_math_environment(lines, index):
+                new = line.replace('$', '')
+            else:
+                new = _wrap_math_word(line, error.token)
+            if new != line:
+                lines[index] = new
+                applied.append(f"line {error.line}: math mode around {error.token or 'script'}")
+
+        elif error.kind == 'no_end_document':
+            if '\\end{document}' not in ''.join(lines):
+                lines.append('\n\\end{document}\n')
+                applied.append("added \\end{document}")
+
+    for package, error in packages:
+        if _require_package(lines, package):
+            applied.append(f"line {error.line}: loaded {package} for {error.token}")
+
+    return ''.join(lines), applied
+
+def main():
+    """Print the errors found in a saved pdflatex log."""
+    for path in sys.argv[1:]:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            errors = parse_log(f.read())
+        for error in errors:
+            location = f"{error.file or '?'}:{error.line or '?'}"
+            print(f"{location}: [{error.kind}] {error.message} (token: {error.token})")
+
+if __name__ == "__main__":
+    main()
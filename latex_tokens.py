@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Math-mode-aware token model of a LaTeX document
+
+tokenize() splits a document into a flat stream of tokens in one forward
+pass:
+
+    text          ordinary text-mode material
+    inline_math   $...$ and \\(...\\)
+    display_math  $$...$$, \\[...\\] and align/equation-like environments
+    env           \\begin{name} / \\end{name} of other environments
+                  (verbatim-like environments and TikZ/pgfplots pictures
+                  span their whole body, so text rules never see their code)
+    command       a control sequence in text mode, together with the
+                  literal arguments of commands such as \\label and \\usepackage
+    comment       % to the end of the line
+
+Every character belongs to exactly one token, so joining the token texts
+gives the document back. map_text() lets a rewrite rule touch only
+text-mode material, which keeps it from guessing at math mode from
+neighbouring characters; map_tokens() does the same for any token kinds.
+Token streams are cached by content hash, so a chain of rules that leaves
+a document unchanged tokenizes it once.
+
+Usage:
+    latex_tokens.py FILE...    print token counts per kind
+"""
+
+import hashlib
+import re
+import sys
+from collections import Counter, OrderedDict, namedtuple
+
+Token = namedtuple('Token', ['kind', 'start', 'end'])
+
+TOKEN_START = re.compile(
+    r'(?P<comment>%)'
+    r'|(?P<display>\$\$|\\\[)'
+    r'|(?P<inline>\$|\\\()'
+    r'|(?P<env>\\(?P<side>begin|end)\s*\{(?P<name>[^{}]*)\})'
+    r'|(?P<verb>\\verb\*?(?P<delimiter>[^A-Za-z*\s]))'
+    r'|(?P<command>\\(?:[A-Za-z@]+\*?|.))',
+    re.DOTALL
+)
+
+MATH_ENVIRONMENTS = {
+    'align', 'align*', 'equation', 'equation*', 'gather', 'gather*',
+    'multline', 'multline*', 'flalign', 'flalign*', 'alignat', 'alignat*',
+    'eqnarray', 'eqnarray*', 'displaymath', 'math',
+}
+VERBATIM_ENVIRONMENTS = {'verbatim', 'verbatim*', 'lstlisting', 'minted', 'comment'}
+# Environments whose bodies are drawing code rather than text
+PICTURE_ENVIRONMENTS = {
+    'tikzpicture', 'pgfpicture', 'axis', 'semilogxaxis', 'semilogyaxis', 'loglogaxis', 'polaraxis',
+}
+OPAQUE_ENVIRONMENTS = VERBATIM_ENVIRONMENTS | PICTURE_ENVIRONMENTS
+
+# Commands whose arguments are names, not text, and belong to the command token
+LITERAL_ARGUMENT_COMMANDS = {
+    '\\documentclass', '\\usepackage', '\\RequirePackage', '\\usetikzlibrary',
+    '\\usepgfplotslibrary', '\\input', '\\include', '\\includeonly',
+    '\\includegraphics', '\\label', '\\ref', '\\eqref', '\\pageref', '\\cite',
+    '\\url', '\\newtheorem', '\\newmdenv', '\\setlength', '\\pgfplotsset',
+    '\\tikzset', '\\geometry', '\\hypersetup',
+}
+LITERAL_ARGUMENTS = re.compile(r'(?:\s*\[[^\[\]]*\])*(?:\s*\{[^{}]*\})*')
+
+MATH_CLOSERS = {
+    '$': re.compile(r'\\.|\$|\n[ \t]*\n', re.DOTALL),
+    '$$': re.compile(r'\\.|\$\$', re.DOTALL),
+    '\\(': re.compile(r'\\\)'),
+    '\\[': re.compile(r'\\\]'),
+}
+
+CACHE_SIZE = 64
+_cache = OrderedDict()
+
+def _math_end(content, opener, start):
+    """End offset of the math opened by `opener`, whose body starts at `start`."""
+    closer = MATH_CLOSERS[opener]
+    position = start
+    while True:
+        match = closer.search(content, position)
+        if match is None:
+            return len(content)
+        text = match.group()
+        if text.startswith('\n'):
+            # Inline math never survives a paragraph break
+            return match.start()
+        if text.startswith('\\') and opener in ('$', '$$'):
+            position = match.end()
+            continue
+        return match.end()
+
+def _scan(content):
+    tokens = []
+    text_start = 0
+    position = 0
+    length = len(content)
+
+    def flush(until):
+        if until > text_start:
+            tokens.append(Token('text', text_start, until))
+
+    while position < length:
+        match = TOKEN_START.search(content, position)
+        if match is None:
+            break
+        start = match.start()
+        kind = match.lastgroup
+
+        if kind == 'comment':
+            end = content.find('\n', start)
+            end = length if end < 0 else end
+            token = 'comment'
+        elif kind == 'display':
+            end = _math_end(content, match.group(), match.end())
+            token = 'display_math'
+        elif kind == 'inline':
+            end = _math_end(content, match.group(), match.end())
+            token = 'inline_math'
+        elif kind == 'env':
+            name = match.group('name').strip()
+            end = match.end()
+            token = 'env'
+            if match.group('side') == 'begin' and (name in MATH_ENVIRONMENTS or name in OPAQUE_ENVIRONMENTS):
+                closing = f'\\end{{{name}}}'
+                found = content.find(closing, end)
+                end = length if found < 0 else found + len(closing)
+                token = 'display_math' if name in MATH_ENVIRONMENTS else 'env'
+        elif kind == 'verb':
+            found = content.find(match.group('delimiter'), match.end())
+            end = length if found < 0 else found + 1
+            token = 'command'
+        else:
+            end = match.end()
+            token = 'command'
+            if match.group() in LITERAL_ARGUMENT_COMMANDS:
+                end = LITERAL_ARGUMENTS.match(content, end).end()
+
+        flush(start)
+        tokens.append(Token(token, start, end))
+        position = text_start = end
+
+    flush(length)
+    return tuple(tokens)
+
+def tokenize(content):
+    """Split a document into Tokens, reusing the stream for content seen before."""
+    digest = hashlib.sha1(content.encode('utf-8', 'surrogatepass')).digest()
+    tokens = _cache.get(digest)
+    if tokens is None:
+        tokens = _scan(content)
+        _cache[digest] = tokens
+        if len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    else:
+        _cache.move_to_end(digest)
+    return tokens
+
+def map_tokens(content, func, kinds=('text',)):
+    """Rewrite the tokens of the given kinds.
+
+    func(text) returns (new_text, hits). Returns (content, total hits);
+    every other token passes through untouched.
+    """
+    pieces = []
+    hits = 0
+    for token in tokenize(content):
+        piece = content[token.start:token.end]
+        if token.kind in kinds:
+            piece, n = func(piece)
+            hits += n
+        pieces.append(piece)
+    if not hits:
+        return content, 0
+    return ''.join(pieces), hits
+
+def _is_literal(piece):
+    name = re.match(r'\\[A-Za-z@]*\*?', piece).group()
+    return name in LITERAL_ARGUMENT_COMMANDS or name.startswith('\\verb')
+
+def map_text(content, func, with_commands=False):
+    """Rewrite only the text-mode material of a document.
+
+    func(text) returns (new_text, hits). By default func sees each text
+    token on its own; with_commands joins runs of text and control
+    sequences (apart from commands with literal arguments) so patterns can
+    span commands used in text. Math, environments and comments pass
+    through untouched.
+    """
+    if not with_commands:
+        return map_tokens(content, func)
+
+    pieces = []
+    run = []
+    hits = 0
+
+    def flush():
+        nonlocal hits
+        if run:
+            text, n = func(''.join(run))
+            hits += n
+            pieces.append(text)
+            run.clear()
+
+    for token in tokenize(content):
+        piece = content[token.start:token.end]
+        if token.kind == 'text' or (token.kind == 'command' and not _is_literal(piece)):
+            run.append(piece)
+        else:
+            flush()
+            pieces.append(piece)
+    flush()
+    if not hits:
+        return content, 0
+    return ''.join(pieces), hits
+
+def main():
+    """Print how much of each document falls into each token kind."""
+    for path in sys.argv[1:]:
+        with open(path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        counts = Counter(token.kind for token in tokenize(content))
+        print(f"{path}: " + ', '.join(f"{kind}={n}" for kind, n in sorted(counts.items())))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Single-pass Unicode to LaTeX translation for lesson documents
+
+One pass over the latex_tokens stream, which decides what is math mode
+(inline math ends at a blank line, as in the linter), replaces every run
+of non-ASCII characters from a precomputed table. Math symbols found in
+running text are wrapped in $...$; characters missing from the table are
+left in place and reported with their line and column.
+
+Usage:
+    latex_unicode.py FILE...    report unmapped characters (no rewrite)
+"""
+
+import functools
+import re
+import sys
+import unicodedata
+
+from latex_tokens import tokenize
+
+# char -> (replacement, mode); mode is 'math' (needs math mode),
+# 'text' (text mode only) or 'any'
+SYMBOLS = {
+    # Greek lowercase
+    'α': (r'\alpha', 'math'), 'β': (r'\beta', 'math'), 'γ': (r'\gamma', 'math'),
+    'δ': (r'\delta', 'math'), 'ε': (r'\varepsilon', 'math'), 'ϵ': (r'\epsilon', 'math'),
+    'ζ': (r'\zeta', 'math'), 'η': (r'\eta', 'math'), 'θ': (r'\theta', 'math'),
+    'ϑ': (r'\vartheta', 'math'), 'ι': (r'\iota', 'math'), 'κ': (r'\kappa', 'math'),
+    'λ': (r'\lambda', 'math'), 'μ': (r'\mu', 'math'), 'ν': (r'\nu', 'math'),
+    'ξ': (r'\xi', 'math'), 'π': (r'\pi', 'math'), 'ρ': (r'\rho', 'math'),
+    'ϱ': (r'\varrho', 'math'), 'σ': (r'\sigma', 'math'), 'ς': (r'\varsigma', 'math'),
+    'τ': (r'\tau', 'math'), 'υ': (r'\upsilon', 'math'), 'φ': (r'\phi', 'math'),
+    'ϕ': (r'\phi', 'math'), 'χ': (r'\chi', 'math'), 'ψ': (r'\psi', 'math'),
+    'ω': (r'\omega', 'math'),
+    # Greek uppercase (those that differ from Latin letters)
+    'Γ': (r'\Gamma', 'math'), 'Δ': (r'\Delta', 'math'), 'Θ': (r'\Theta', 'math'),
+    'Λ': (r'\Lambda', 'math'), 'Ξ': (r'\Xi', 'math'), 'Π': (r'\Pi', 'math'),
+    'Σ': (r'\Sigma', 'math'), 'Υ': (r'\Upsilon', 'math'), 'Φ': (r'\Phi', 'math'),
+    'Ψ': (r'\Psi', 'math'), 'Ω': (r'\Omega', 'math'),
+    # Number sets and letter-like symbols
+    'ℝ': (r'\mathbb{R}', 'math'), 'ℂ': (r'\mathbb{C}', 'math'), 'ℕ': (r'\mathbb{N}', 'math'),
+    'ℤ': (r'\mathbb{Z}', 'math'), 'ℚ': (r'\mathbb{Q}', 'math'), 'ℓ': (r'\ell', 'math'),
+    'ℏ': (r'\hbar', 'math'), 'ℑ': (r'\Im', 'math'), 'ℜ': (r'\Re', 'math'),
+    '℘': (r'\wp', 'math'), 'ℵ': (r'\aleph', 'math'),
+    # Operators
+    '×': (r'\times', 'math'), '÷': (r'\div', 'math'), '±': (r'\pm', 'math'),
+    '∓': (r'\mp', 'math'), '·': (r'\cdot', 'math'), '⋅': (r'\cdot', 'math'),
+    '∘': (r'\circ', 'math'), '∗': (r'\ast', 'math'), '⊗': (r'\otimes', 'math'),
+    '⊕': (r'\oplus', 'math'), '√': (r'\surd', 'math'), '∑': (r'\sum', 'math'),
+    '∏': (r'\prod', 'math'), '∫': (r'\int', 'math'), '∬': (r'\iint', 'math'),
+    '∭': (r'\iiint', 'math'), '∮': (r'\oint', 'math'), '∂': (r'\partial', 'math'),
+    '∇': (r'\nabla', 'math'), '∆': (r'\Delta', 'math'), '−': ('-', 'math'),
+    '∞': (r'\infty', 'math'), '∝': (r'\propto', 'math'), '∠': (r'\angle', 'math'),
+    '⌊': (r'\lfloor', 'math'), '⌋': (r'\rfloor', 'math'), '⌈': (r'\lceil', 'math'),
+    '⌉': (r'\rceil', 'math'), '‖': (r'\|', 'math'), '∣': (r'\mid', 'math'),
+    '⟨': (r'\langle', 'math'), '⟩': (r'\rangle', 'math'),
+    # Relations
+    '≈': (r'\approx', 'math'), '≠': (r'\neq', 'math'), '≤': (r'\leq', 'math'),
+    '≥': (r'\geq', 'math'), '≡': (r'\equiv', 'math'), '≅': (r'\cong', 'math'),
+    '∼': (r'\sim', 'math'), '≃': (r'\simeq', 'math'), '≪': (r'\ll', 'math'),
+    '≫': (r'\gg', 'math'), '≺': (r'\prec', 'math'), '≻': (r'\succ', 'math'),
+    '⊥': (r'\perp', 'math'), '∥': (r'\parallel', 'math'), '≔': (r'\coloneqq', 'math'),
+    # Sets and logic
+    '∈': (r'\in', 'math'), '∉': (r'\notin', 'math'), '∋': (r'\ni', 'math'),
+    '⊂': (r'\subset', 'math'), '⊆': (r'\subseteq', 'math'), '⊃': (r'\supset', 'math'),
+    '⊇': (r'\supseteq', 'math'), '∪': (r'\cup', 'math'), '∩': (r'\cap', 'math'),
+    '∅': (r'\emptyset', 'math'), '∀': (r'\forall', 'math'), '∃': (r'\exists', 'math'),
+    '∄': (r'\nexists', 'math'), '¬': (r'\neg', 'math'), '∧': (r'\wedge', 'math'),
+    '∨': (r'\vee', 'math'), '∴': (r'\therefore', 'math'), '∵': (r'\because', 'math'),
+    # Arrows
+    '→': (r'\rightarrow', 'math'), '←': (r'\leftarrow', 'math'), '↔': (r'\leftrightarrow', 'math'),
+    '↑': (r'\uparrow', 'math'), '↓': (r'\downarrow', 'math'), '↦': (r'\mapsto', 'math'),
+    '⇒': (r'\Rightarrow', 'math'), '⇐': (r'\Leftarrow', 'math'), '⇔': (r'\Leftrightarrow', 'math'),
+    '⟶': (r'\longrightarrow', 'math'), '⟵': (r'\longleftarrow', 'math'),
+    '⟹': (r'\Longrightarrow', 'math'), '⟸': (r'\Longleftarrow', 'math'),
+    '⟺': (r'\Longleftrightarrow', 'math'), '↗': (r'\nearrow', 'math'),
+    '↘': (r'\searrow', 'math'), '⇌': (r'\rightleftharpoons', 'math'),
+    # Fractions
+    '½': (r'\tfrac{1}{2}', 'math'), '⅓': (r'\tfrac{1}{3}', 'math'), '⅔': (r'\tfrac{2}{3}', 'math'),
+    '¼': (r'\tfrac{1}{4}', 'math'), '¾': (r'\tfrac{3}{4}', 'math'),
+    # Marks usable in either mode
+    '✓': (r'\checkmark', 'any'), '✔': (r'\checkmark', 'any'), '✅': (r'\checkmark', 'any'),
+    '□': (r'\square', 'math'), '∎': (r'\blacksquare', 'math'), '…': (r'\ldots', 'any'),
+    '⋯': (r'\cdots', 'math'), '⋮': (r'\vdots', 'math'), '⋱': (r'\ddots', 'math'),
+    '′': ("'", 'any'), '″': ("''", 'any'), '‴': ("'''", 'any'),
+    '°': (r'^{\circ}', 'math'), ' ': ('~', 'any'), ' ': (r'\,', 'any'),
+    # Text punctuation
+    '—': ('---', 'text'), '–': ('--', 'text'), '‘': ('`', 'text'), '’': ("'", 'text'),
+    '“': ('``', 'text'), '”': ("''", 'text'), '•': (r'\textbullet', 'text'),
+    '§': (r'\S', 'text'), '¶': (r'\P', 'text'), '©': (r'\copyright', 'text'),
+    '✗': (r'$\times$', 'text'), '✘': (r'$\times$', 'text'), '€': ('EUR', 'text'),
+    # Accented letters that show up in names (Poincaré, Lyapunov variants, ...)
+    'é': (r"\'e", 'text'), 'è': (r'\`e', 'text'), 'ê': (r'\^e', 'text'), 'ë': (r'\"e', 'text'),
+    'á': (r"\'a", 'text'), 'à': (r'\`a', 'text'), 'â': (r'\^a', 'text'), 'ä': (r'\"a', 'text'),
+    'í': (r"\'i", 'text'), 'ï': (r'\"i', 'text'), 'ó': (r"\'o", 'text'), 'ô': (r'\^o', 'text'),
+    'ö': (r'\"o', 'text'), 'ú': (r"\'u", 'text'), 'ü': (r'\"u', 'text'), 'ç': (r'\c{c}', 'text'),
+    'ñ': (r'\~n', 'text'), 'É': (r"\'E", 'text'), 'Ö': (r'\"O', 'text'), 'Ü': (r'\"U', 'text'),
+    'ß': (r'\ss{}', 'text'), 'ø': (r'\o{}', 'text'), 'å': (r'\aa{}', 'text'),
+}
+
+# Math-mode forms of symbols whose SYMBOLS entry only works in text; any
+# other text-only piece found in math is wrapped in \text{...}
+MATH_FORMS = {
+    '✗': (r'\times', 'math'), '✘': (r'\times', 'math'), '•': (r'\bullet', 'math'),
+    '—': (r'\text{---}', 'math'), '–': (r'\text{--}', 'math'), '’': ("'", 'math'),
+    '§': (r'\S', 'math'), '¶': (r'\P', 'math'),
+}
+
+# Sub- and superscript characters are merged into one _{...} or ^{...}
+SUBSCRIPTS = dict(zip('₀₁₂₃₄₅₆₇₈₉₊₋₌₍₎ₐₑₒₓₕₖₗₘₙₚₛₜᵢⱼᵤᵥ',
+                      '0123456789+-=()aeoxhklmnpstijuv'))
+SUPERSCRIPTS = dict(zip('⁰¹²³⁴⁵⁶⁷⁸⁹⁺⁻⁼⁽⁾ⁿⁱᵀᵗˣʸᵏʳᵐ',
+                        '0123456789+-=()niTtxykrm'))
+
+# Combining marks wrap the unit before them: x̄ -> \bar{x}
+COMBINING = {
+    '̄': r'\bar', '̅': r'\bar', '̂': r'\hat', '̃': r'\tilde',
+    '̇': r'\dot', '̈': r'\ddot', '⃗': r'\vec', '́': r'\acute',
+}
+
+_SCRIPTS = set(SUBSCRIPTS) | set(SUPERSCRIPTS)
+_ATTACHING = ''.join(SUBSCRIPTS) + ''.join(SUPERSCRIPTS) + ''.join(COMBINING)
+
+# A run of non-ASCII characters, with the letter or digit a script or
+# combining mark attaches to
+RUN_PATTERN = re.compile(r'(?:[A-Za-z0-9](?=[' + _ATTACHING + r']))?[^\x00-\x7f]+')
+
+MATH_TOKENS = ('inline_math', 'display_math')
+
+CONTROL_WORD_END = re.compile(r'\\[A-Za-z]+$')
+
+@functools.lru_cache(maxsize=None)
+def _accented(ch):
+    """Map a precomposed letter such as ẋ to a math accent, or None."""
+    decomposed = unicodedata.normalize('NFD', ch)
+    if len(decomposed) == 2 and decomposed[0].isascii() and decomposed[1] in COMBINING:
+        return (f'{COMBINING[decomposed[1]]}{{{decomposed[0]}}}', 'math')
+    return None
+
+def _run_pieces(run, unmapped, line, column, in_math=False):
+    """Split a run of characters into (latex, mode) pieces."""
+    pieces = []
+    i = 0
+    while i < len(run):
+        ch = run[i]
+        if ch in SUBSCRIPTS or ch in SUPERSCRIPTS:
+            table, marker = (SUBSCRIPTS, '_') if ch in SUBSCRIPTS else (SUPERSCRIPTS, '^')
+            j = i
+            while j < len(run) and run[j] in table:
+                j += 1
+            pieces.append((marker + '{' + ''.join(table[c] for c in run[i:j]) + '}', 'math'))
+            i = j
+            continue
+        if ch in COMBINING and pieces:
+            base, _ = pieces.pop()
+            pieces.append((f'{COMBINING[ch]}{{{base}}}', 'math'))
+        elif in_math and ch in MATH_FORMS:
+            pieces.append(MATH_FORMS[ch])
+        elif ch in SYMBOLS:
+            pieces.append(SYMBOLS[ch])
+        elif _accented(ch):
+            pieces.append(_accented(ch))
+        elif ch.isascii():
+            # A leading letter or digit joins the sub/superscript after it
+            pieces.append((ch, 'math' if run[i + 1:i + 2] in _SCRIPTS else 'any'))
+        else:
+            unmapped.append((line, column + i, ch))
+            pieces.append((ch, 'any'))
+        i += 1
+    return pieces
+
+def _join(pieces, in_math, prev_char, next_char):
+    """Join run pieces, wrapping math-only pieces in $...$ when in text
+    and text-only pieces in \\text{...} when in math."""
+    out = []
+    segment = []
+
+    def flush():
+        if segment:
+            joined = ''.join(segment)
+            if in_math:
+                out.append(f'\\text{{{joined}}}')
+            else:
+                if not out and prev_char == '$':
+                    out.append('{}')
+                out.append(f'${joined}$')
+            segment.clear()
+
+    wrapped = 'text' if in_math else 'math'
+    for latex, mode in pieces:
+        if mode != wrapped:
+            flush()
+            if out and CONTROL_WORD_END.search(out[-1]) and latex[:1].isalpha():
+                out.append(' ' if in_math else '{}')
+            out.append(latex)
+        else:
+            if segment and CONTROL_WORD_END.search(segment[-1]) and latex[:1].isalpha():
+                segment.append(' ')
+            segment.append(latex)
+    flush()
+
+    result = ''.join(out)
+    if result.endswith('$') and next_char == '$':
+        result += '{}'
+    elif CONTROL_WORD_END.search(result):
+        if in_math and next_char.isalpha():
+            result += ' '
+        elif not in_math and (next_char.isalpha() or next_char == ' '):
+            result += '{}'
+    return result
+
+def translate(content):
+    """Translate Unicode to LaTeX in one pass.
+
+    Returns (translated text, unmapped) where unmapped lists
+    (line, column, character) for every non-ASCII character that has no
+    LaTeX equivalent. Comments are left untouched.
+    """
+    if content.isascii():
+        return content, []
+
+    unmapped = []
+    out = []
+    line, line_start, position = 1, 0, 0
+    for token in tokenize(content):
+        if token.kind == 'comment':
+            continue
+        in_math = token.kind in MATH_TOKENS
+        for match in RUN_PATTERN.finditer(content, token.start, token.end):
+            start, end = match.span()
+            newlines = content.count('\n', position, start)
+            if newlines:
+                line += newlines
+                line_start = content.rfind('\n', position, start) + 1
+            out.append(content[position:start])
+            position = end
+            pieces = _run_pieces(match.group(), unmapped, line, start - line_start + 1, in_math)
+            prev_char = content[start - 1] if start else ''
+            next_char = content[end] if end < len(content) else ''
+            out.append(_join(pieces, in_math, prev_char, next_char))
+    out.append(content[position:])
+    return ''.join(out), unmapped
+
+def describe_unmapped(unmapped):
+    """Human-readable lines for the unmapped characters found by translate()."""
+    lines = []
+    for line, column, ch in unmapped:
+        name = unicodedata.name(ch, 'UNKNOWN')
+        lines.append(f"line {line}, col {column}: U+{ord(ch):04X} {name} ({ch})")
+    return lines
+
+def main():
+    """Report the characters the translator cannot map."""
+    status = 0
+    for path in sys.argv[1:]:
+        with open(path, 'r', encoding='utf-8') as f:
+            _, unmapped = translate(f.read())
+        for message in describe_unmapped(unmapped):
+            print(f"{path}: {message}")
+            status = 1
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
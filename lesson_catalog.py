@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+SQLite catalog of the problems, definitions, theorems and examples of every lesson
+
+Each lesson_NN.tex and problems_NN.tex is parsed once into entries:
+
+    problem     a top-level \\item of a Part's list (or a problem
+                environment), with its Part letter and difficulty
+    definition, theorem, method, example, ...
+                every theorem-like environment the document declares
+                with \\newtheorem, with its optional title
+
+The Parts themselves are kept too, with the problem count their heading
+promises ("Part B: ... (6 problems)"). A file is parsed again only when
+its content hash changes, so counting problems, checking Part coverage or
+finding "every Part D problem on eigenvalues" is a query on the index,
+not a scan of the sources.
+
+Difficulty comes from a bracketed tag on the problem ("[... Challenge]")
+or else from the words of its Part heading: Basic, Advanced/Theoretical,
+Exam-Style; anything else is "standard".
+
+Usage:
+    lesson_catalog.py update [--lessons SPEC]
+    lesson_catalog.py stats [--lessons SPEC]
+    lesson_catalog.py check [--lessons SPEC] [--problems N] [--parts A-E]
+    lesson_catalog.py query [--kind K] [--part P] [--difficulty D] [--text WORDS] [--lessons SPEC]
+"""
+
+import argparse
+import hashlib
+import re
+import sqlite3
+import sys
+import time
+
+import lesson_paths
+from build_cache import CACHE_DIR
+from latex_tokens import tokenize
+from lesson_paths import DOCUMENT_KINDS, add_lessons_argument
+
+CATALOG_PATH = CACHE_DIR / 'catalog.sqlite'
+
+# Bumped whenever parsing changes, so every file is parsed again
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY, lesson INTEGER, doc TEXT, hash TEXT);
+CREATE TABLE IF NOT EXISTS parts (
+    path TEXT, lesson INTEGER, part TEXT, title TEXT, declared INTEGER);
+CREATE TABLE IF NOT EXISTS entries (
+    path TEXT, lesson INTEGER, doc TEXT, kind TEXT, part TEXT,
+    difficulty TEXT, title TEXT, text TEXT, line INTEGER);
+CREATE INDEX IF NOT EXISTS entries_kind ON entries (kind, lesson);
+CREATE INDEX IF NOT EXISTS parts_lesson ON parts (lesson);
+"""
+
+PROBLEM_TARGET = 28
+REQUIRED_PARTS = 'ABCDE'
+
+LISTS = {'enumerate', 'itemize'}
+SECTIONS = {'\\section', '\\section*', '\\subsection', '\\subsection*'}
+PART_HEADING = re.compile(r'Part\s+([A-Z])\s*[:.]\s*(.*?)\s*(?:\((\d+)\s+problems?\))?\s*$', re.IGNORECASE)
+ITEM_TAG = re.compile(r'\s*\\textbf\{\s*\[([^\]]*)\]')
+NEWTHEOREM = re.compile(r'\\newtheorem\*?\s*\{([^}]+)\}')
+NEWMDENV = re.compile(r'\\newmdenv\s*(?:\[[^\]]*\])?\s*\{([^}]+)\}')
+OPTIONAL_TITLE = re.compile(r'\s*\[([^\]]*)\]')
+
+# First match wins; tags on the problem are looked at before the Part heading
+DIFFICULTIES = (
+    ('challenge', re.compile(r'challenge|tricky', re.IGNORECASE)),
+    ('exam', re.compile(r'exam', re.IGNORECASE)),
+    ('advanced', re.compile(r'advanced|theoretical|theory', re.IGNORECASE)),
+    ('basic', re.compile(r'basic|recognition|warm-?up', re.IGNORECASE)),
+)
+
+def difficulty(*labels):
+    for label in labels:
+        for name, pattern in DIFFICULTIES:
+            if label and pattern.search(label):
+                return name
+    return 'standard'
+
+def _argument(content, position):
+    """Text of the brace group at or after `position`, and the offset after it."""
+    start = content.find('{', position)
+    if start < 0:
+        return '', position
+    depth = 0
+    for i in range(start, len(content)):
+        if content[i] == '{':
+            depth += 1
+        elif content[i] == '}':
+            depth -= 1
+            if depth == 0:
+                return content[start + 1:i], i + 1
+    return content[start + 1:], len(content)
+
+def _clean(text):
+    return ' '.join(text.split())
+
+def parse_document(content, doc):
+    """Parts and entries of one document.
+
+    Returns (parts, entries): parts are (letter, title, declared count)
+    and entries are (kind, part, difficulty, title, text, line).
+    """
+    theorem_kinds = set(NEWTHEOREM.findall(content)) | {'problem'}
+    # Framed boxes hold hints and strategies, not problems
+    box_kinds = set(NEWMDENV.findall(content)) | {'mdframed'}
+    # Tokenized on its own, so broken math in the preamble cannot swallow it
+    begin = max(content.find('\\begin{document}'), 0)
+    preamble_lines = content.count('\n', 0, begin)
+    content = content[begin:]
+    parts = []
+    entries = []
+    part = None             # (letter, title) of the current Part, if any
+    counting = doc == 'problems'
+    solutions = False       # inside a Solutions section, whose Parts are answers
+    lists = 0               # depth of nested enumerate/itemize
+    open_item = None        # [start, tag] of the problem being read
+    open_envs = []          # [kind, title, start] of theorem-like environments
+    boxes = 0               # depth of framed boxes
+
+    def line_of(offset):
+        return preamble_lines + content.count('\n', 0, offset) + 1
+
+    def close_item(end):
+        nonlocal open_item
+        if open_item is not None:
+            start, tag = open_item
+            text = content[start:end]
+            entries.append(('problem', part and part[0], difficulty(tag, part and part[1]),
+                            tag, _clean(text), line_of(start)))
+            open_item = None
+
+    for token in tokenize(content):
+        text = content[token.start:token.end]
+        if token.kind == 'command' and text in SECTIONS:
+            close_item(token.start)
+            heading, _ = _argument(content, token.end)
+            heading = _clean(heading)
+            match = PART_HEADING.match(heading)
+            if text.startswith('\\section'):
+                solutions = not match and re.search(r'solution|answer|hint', heading, re.IGNORECASE) is not None
+            if match and not solutions and doc == 'problems':
+                part = (match.group(1).upper(), match.group(2))
+                parts.append((part[0], part[1], int(match.group(3)) if match.group(3) else None))
+                counting = True
+            else:
+                # Solutions, hints and answer keys hold no problems
+                part = None
+                counting = doc == 'problems' and not solutions
+        elif token.kind == 'command' and text == '\\item' and lists == 1 and counting and not open_envs and not boxes:
+            close_item(token.start)
+            tag = ITEM_TAG.match(content, token.end)
+            open_item = [token.end, tag.group(1) if tag else None]
+        elif token.kind == 'env':
+            match = re.match(r'\\(begin|end)\s*\{([^}]*)\}', text)
+            if match is None:
+                continue
+            side, name = match.group(1), match.group(2).strip()
+            if name in LISTS:
+                if side == 'end' and lists == 1:
+                    close_item(token.start)
+                lists += 1 if side == 'begin' else -1
+            elif name in box_kinds:
+                boxes += 1 if side == 'begin' else -1
+            elif name in theorem_kinds:
+                if side == 'begin':
+                    title = OPTIONAL_TITLE.match(content, token.end)
+                    open_envs.append([name, title.group(1) if title else None,
+                                      title.end() if title else token.end])
+                elif open_envs and open_envs[-1][0] == name:
+                    kind, title, start = open_envs.pop()
+                    if kind == 'problem':
+                        entries.append(('problem', part and part[0], difficulty(title, part and part[1]),
+                                        title, _clean(content[start:token.start]), line_of(start)))
+                    else:
+                        entries.append((kind, part and part[0], None, title,
+                                        _clean(content[start:token.start]), line_of(start)))
+    close_item(len(content))
+    return parts, entries
+
+def open_catalog(path=CATALOG_PATH):
+    """Connection to the catalog, creating or resetting it as needed."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(str(path), timeout=30)
+    # Parallel lesson workers update the catalog at the same time
+    connection.execute('PRAGMA journal_mode=WAL')
+    if connection.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+        with connection:
+            for table in ('files', 'parts', 'entries'):
+                connection.execute(f'DROP TABLE IF EXISTS {table}')
+            connection.executescript(SCHEMA)
+            connection.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    return connection
+
+def _relative(tex):
+    return tex.resolve().relative_to(lesson_paths.root()).as_posix()
+
+def update_file(connection, tex, lesson_num, doc):
+    """Parse one document again if its content changed; True if it did."""
+    path = _relative(tex)
+    try:
+        data = tex.read_bytes()
+    except OSError:
+        with connection:
+            for table in ('files', 'parts', 'entries'):
+                connection.execute(f'DELETE FROM {table} WHERE path = ?', (path,))
+        return False
+    digest = hashlib.sha256(data).hexdigest()
+    row = connection.execute('SELECT hash FROM files WHERE path = ?', (path,)).fetchone()
+    if row is not None and row[0] == digest:
+        return False
+    parts, entries = parse_document(data.decode('utf-8', errors='replace'), doc)
+    with connection:
+        for table in ('parts', 'entries'):
+            connection.execute(f'DELETE FROM {table} WHERE path = ?', (path,))
+        connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)', (path, lesson_num, doc, digest))
+        connection.executemany('INSERT INTO parts VALUES (?, ?, ?, ?, ?)',
+                               [(path, lesson_num) + part for part in parts])
+        connection.executemany('INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                               [(path, lesson_num, doc) + entry for entry in entries])
+    return True
+
+def update(connection, lessons=None):
+    """Bring the catalog up to date with the sources; returns the number of files parsed."""
+    lessons = lesson_paths.selected(lessons)
+    parsed = 0
+    for lesson_num in lessons:
+        for doc in DOCUMENT_KINDS:
+            parsed += update_file(connection, lesson_paths.tex_path(lesson_num, doc), lesson_num, doc)
+    return parsed
+
+def _lesson_filter(lessons, column='lesson'):
+    if lessons is None:
+        return '', []
+    return f" AND {column} IN ({','.join('?' * len(lessons))})", list(lessons)
+
+def problem_count(connection, lesson_num):
+    return connection.execute(
+        "SELECT COUNT(*) FROM entries WHERE kind = 'problem' AND doc = 'problems' AND lesson = ?",
+        (lesson_num,)).fetchone()[0]
+
+def missing_parts(connection, lesson_num, required=REQUIRED_PARTS):
+    found = {row[0] for row in connection.execute('SELECT part FROM parts WHERE lesson = ?', (lesson_num,))}
+    return [part for part in required if part not in found]
+
+def miscounted_parts(connection, lesson_num):
+    """Parts whose heading promises a different number of problems than they hold.
+
+    Returns [(part, declared, found)].
+    """
+    return connection.execute(
+        "SELECT p.part, p.declared, COUNT(e.kind) FROM parts p"
+        " LEFT JOIN entries e ON e.path = p.path AND e.part = p.part AND e.kind = 'problem'"
+        " WHERE p.lesson = ? AND p.declared IS NOT NULL GROUP BY p.path, p.part"
+        " HAVING COUNT(e.kind) != p.declared ORDER BY p.part", (lesson_num,)).fetchall()
+
+def query(connection, kind=None, part=None, level=None, text=None, lessons=None):
+    """Entries matching every given filter, as (lesson, kind, part, difficulty, title, text, path, line)."""
+    sql = 'SELECT lesson, kind, part, difficulty, title, text, path, line FROM entries WHERE 1'
+    parameters = []
+    for column, value in (('kind', kind), ('part', part and part.upper()), ('difficulty', level)):
+        if value is not None:
+            sql += f' AND {column} = ?'
+            parameters.append(value)
+    for word in (text or '').split():
+        sql += ' AND (text LIKE ? OR title LIKE ?)'
+        parameters += [f'%{word}%'] * 2
+    where, values = _lesson_filter(lessons)
+    sql += where + ' ORDER BY lesson, doc, line'
+    return connection.execute(sql, parameters + values).fetchall()
+
+def stats(connection, lessons=None):
+    """Entry counts per lesson and kind, as {lesson: {kind: count}}."""
+    where, values = _lesson_filter(lessons)
+    counts = {}
+    for lesson_num, kind, count in connection.execute(
+            'SELECT lesson, kind, COUNT(*) FROM entries WHERE 1' + where + ' GROUP BY lesson, kind', values):
+        counts.setdefault(lesson_num, {})[kind] = count
+    return counts
+
+def main():
+    """Update, summarize, check or query the lesson catalog."""
+    parser = argparse.ArgumentParser(description="Index of problems, theorems and examples across the lessons")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('update', help="parse the sources that changed")
+    commands.add_parser('stats', help="entries per lesson and kind")
+    check_parser = commands.add_parser('check', help="problem counts and Part coverage of the problem sets")
+    check_parser.add_argument('--problems', type=int, default=PROBLEM_TARGET,
+                              help=f"problems each set should have (default: {PROBLEM_TARGET})")
+    check_parser.add_argument('--parts', default='A-E', help="Parts each set should have (default: A-E)")
+    query_parser = commands.add_parser('query', help="list matching entries")
+    query_parser.add_argument('--kind', help="problem, definition, theorem, method, example, ...")
+    query_parser.add_argument('--part', help="Part letter of problems")
+    query_parser.add_argument('--difficulty', choices=[name for name, _ in DIFFICULTIES] + ['standard'])
+    query_parser.add_argument('--text', help="words that must all appear")
+    for command_parser in commands.choices.values():
+        add_lessons_argument(command_parser)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    connection = open_catalog()
+    parsed = update(connection)
+    lessons = args.lessons
+
+    if args.command == 'update':
+        print(f"Parsed {parsed} changed files in {(time.perf_counter() - start) * 1000:.1f} ms")
+    elif args.command == 'stats':
+        counts = stats(connection, lessons)
+        kinds = sorted({kind for lesson in counts.values() for kind in lesson})
+        print('lesson ' + ' '.join(f'{kind[:10]:>10}' for kind in kinds))
+        for lesson_num in sorted(counts):
+            print(f'{lesson_num:6} ' + ' '.join(f'{counts[lesson_num].get(kind, 0):10}' for kind in kinds))
+    elif args.command == 'check':
+        required = ''.join(chr(c) for c in range(ord(args.parts[0]), ord(args.parts[-1]) + 1))
+        problems = 0
+        for lesson_num in lessons or lesson_paths.all_lessons():
+            if not lesson_paths.tex_path(lesson_num, 'problems').exists():
+                continue
+            count = problem_count(connection, lesson_num)
+            notes = []
+            if count < args.problems:
+                notes.append(f"{count}/{args.problems} problems")
+            missing = missing_parts(connection, lesson_num, required)
+            if missing:
+                notes.append(f"no Part {', '.join(missing)}")
+            for part, declared, found in miscounted_parts(connection, lesson_num):
+                notes.append(f"Part {part} promises {declared}, has {found}")
+            if notes:
+                problems += 1
+                print(f"problems_{lesson_num:02d}: {'; '.join(notes)}")
+        print(f"{problems} problem sets need attention")
+        return 1 if problems else 0
+    else:
+        rows = query(connection, args.kind, args.part, args.difficulty, args.text, lessons)
+        for lesson_num, kind, part, level, title, text, path, line in rows:
+            label = f"Part {part} " if part else ''
+            label += f"[{level}] " if level else ''
+            label += f"{title}: " if title else ''
+            print(f"{path}:{line}: {kind} {label}{text[:100]}")
+        print(f"{len(rows)} entries in {(time.perf_counter() - start) * 1000:.1f} ms")
+    connection.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Where the lesson files live, and which lessons a command works on
+
+Every script finds lessons through these helpers instead of a hardcoded
+checkout path. The root is this checkout, or ODE_LESSONS_ROOT when set:
+
+    lesson_NN/lesson_script.txt     audio script
+    lesson_NN/episode_NN.wav        narrated audio script (not committed)
+    lesson_NN/lesson_NN.pdf         published theory PDF
+    lesson_NN/problems_NN.pdf       published problems PDF
+    lesson_NN/src/lesson_NN.tex     theory source
+    lesson_NN/src/problems_NN.tex   problems source
+    Lessons 19 and more/N.txt       raw source of lessons 19 on
+    prompts/lessons.txt             prompt dump holding the earlier lessons
+
+Usage:
+    lesson_paths.py [SPEC]    list the lessons a spec such as 19-50,7 selects
+"""
+
+import os
+import re
+import sys
+from pathlib import Path
+
+ROOT_ENV = 'ODE_LESSONS_ROOT'
+
+RAW_DIR = 'Lessons 19 and more'
+PROMPT_DUMP = Path('prompts') / 'lessons.txt'
+
+# Documents of a lesson: theory (lesson_NN) and problems (problems_NN)
+DOCUMENT_KINDS = ('lesson', 'problems')
+
+def root():
+    """Directory holding the lesson_NN folders."""
+    return Path(os.environ.get(ROOT_ENV) or Path(__file__).resolve().parent)
+
+def lesson_dir(lesson_num):
+    return root() / f"lesson_{lesson_num:02d}"
+
+def tex_path(lesson_num, kind='lesson'):
+    """Source of a lesson document; kind is 'lesson' or 'problems'."""
+    return lesson_dir(lesson_num) / 'src' / f"{kind}_{lesson_num:02d}.tex"
+
+def pdf_path(lesson_num, kind='lesson'):
+    """Published PDF of a lesson document."""
+    return lesson_dir(lesson_num) / f"{kind}_{lesson_num:02d}.pdf"
+
+def script_path(lesson_num):
+    return lesson_dir(lesson_num) / 'lesson_script.txt'
+
+def audio_path(lesson_num):
+    """Narrated episode rendered from the audio script."""
+    return lesson_dir(lesson_num) / f"episode_{lesson_num:02d}.wav"
+
+def raw_dir():
+    return root() / RAW_DIR
+
+def raw_source(lesson_num):
+    """Raw source of a lesson in `Lessons 19 and more`, which may not exist."""
+    return raw_dir() / f"{lesson_num}.txt"
+
+def prompt_dump():
+    return root() / PROMPT_DUMP
+
+def all_lessons():
+    """Every lesson with a directory or a raw source, in order."""
+    numbers = set()
+    for path in root().glob('lesson_*'):
+        match = re.fullmatch(r'lesson_(\d+)', path.name)
+        if match and path.is_dir():
+            numbers.add(int(match.group(1)))
+    numbers.update(raw_lessons())
+    return sorted(numbers)
+
+def raw_lessons():
+    """Lessons that have a raw source, in order."""
+    return sorted(int(path.stem) for path in raw_dir().glob('*.txt') if path.stem.isdigit())
+
+def parse_lessons(spec):
+    """Parse a lesson list such as '9-12,15' into sorted lesson numbers."""
+    lessons = set()
+    for part in spec.split(','):
+        part = part.strip()
+        if '-' in part:
+            first, last = part.split('-')
+            lessons.update(range(int(first), int(last) + 1))
+        elif part:
+            lessons.add(int(part))
+    return sorted(lessons)
+
+def add_lessons_argument(parser, default=None):
+    """Add the shared --lessons option; `default` is a spec, or None for every lesson."""
+    parser.add_argument(
+        '--lessons',
+        type=parse_lessons,
+        default=parse_lessons(default) if default else None,
+        help=f"lessons to work on, e.g. 19-50,7 (default: {default or 'every lesson'})"
+    )
+
+def selected(lessons=None):
+    """The lessons a --lessons value selects."""
+    return list(lessons) if lessons is not None else all_lessons()
+
+def documents(lessons=None):
+    """Source of every document the selected lessons have, in order."""
+    paths = []
+    for lesson_num in selected(lessons):
+        for kind in DOCUMENT_KINDS:
+            path = tex_path(lesson_num, kind)
+            if path.exists():
+                paths.append(path)
+    return paths
+
+def main():
+    """Print the lessons a spec selects, with the documents they have."""
+    lessons = parse_lessons(sys.argv[1]) if len(sys.argv) > 1 else all_lessons()
+    for lesson_num in lessons:
+        present = [kind for kind in DOCUMENT_KINDS if tex_path(lesson_num, kind).exists()]
+        raw = 'raw' if raw_source(lesson_num).exists() else '-'
+        print(f"{lesson_num:3}  {raw:4} {' '.join(present) or '-'}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
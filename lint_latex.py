@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Pure-Python pre-compile linter for the lesson documents
+
+One linear scan over a document catches the failures the fixers otherwise
+patch after a pdflatex run: unbalanced braces, unmatched \\begin/\\end,
+stray $ inside align-like environments, inline math left open at a
+paragraph break, a missing \\begin or \\end{document}, and environments or
+commands whose package is never loaded. Every issue has a line and column.
+
+Usage:
+    lint_latex.py [FILE...]    lint the files (default: lesson_*/src/*.tex)
+"""
+
+import argparse
+import glob
+import re
+import sys
+from collections import namedtuple
+from pathlib import Path
+
+from latex_log import COMMAND_PACKAGES, ENVIRONMENT_PACKAGES
+from latex_tokens import MATH_ENVIRONMENTS, VERBATIM_ENVIRONMENTS
+
+LintIssue = namedtuple('LintIssue', ['line', 'column', 'kind', 'message'])
+
+TOKEN_PATTERN = re.compile(
+    r'(?P<env>\\(?P<side>begin|end)\s*\{(?P<name>[^{}]*)\})'
+    r'|(?P<command>\\(?:[A-Za-z@]+\*?|.))'
+    r'|(?P<comment>%[^\n]*)'
+    r'|(?P<open>\{)'
+    r'|(?P<close>\})'
+    r'|(?P<dollars>\$\$?)'
+    r'|(?P<paragraph>\n[ \t]*\n)'
+    r'|(?P<newline>\n)',
+    re.DOTALL
+)
+
+# Arguments of these are typeset in text mode, so $ is legal inside them
+TEXT_COMMANDS = {
+    '\\text', '\\textrm', '\\textbf', '\\textit', '\\textsf', '\\texttt',
+    '\\textnormal', '\\mbox', '\\hbox', '\\fbox', '\\intertext', '\\shortintertext',
+    '\\emph', '\\parbox', '\\makebox', '\\framebox',
+}
+
+# Packages that load others on their own
+IMPLIED_PACKAGES = {
+    'mathtools': {'amsmath'},
+    'amssymb': {'amsfonts'},
+    'pgfplots': {'tikz', 'xcolor', 'graphicx'},
+    'tikz': {'xcolor', 'graphicx'},
+    'mdframed': {'xcolor'},
+    'tcolorbox': {'tikz', 'xcolor', 'graphicx'},
+    'physics': {'amsmath'},
+}
+CLASS_PACKAGES = {
+    'amsart': {'amsmath', 'amsfonts', 'amsthm'},
+    'amsbook': {'amsmath', 'amsfonts', 'amsthm'},
+    'beamer': {'amsmath', 'amssymb', 'amsthm', 'xcolor', 'graphicx'},
+}
+PACKAGE_LINE = re.compile(r'\\(?:usepackage|RequirePackage)\s*(?:\[[^\]]*\])?\s*\{([^}]*)\}')
+CLASS_LINE = re.compile(r'\\documentclass\s*(?:\[[^\]]*\])?\s*\{([^}]*)\}')
+DEFINITION = re.compile(
+    r'\\(?:(?:re)?newcommand\*?|providecommand\*?|DeclareMathOperator\*?|def|let)\s*\{?(\\[A-Za-z@]+)'
+)
+
+def loaded_packages(preamble):
+    """Packages loaded by a preamble, including the ones they pull in."""
+    packages = set()
+    for match in PACKAGE_LINE.finditer(preamble):
+        packages.update(p.strip() for p in match.group(1).split(',') if p.strip())
+    document_class = CLASS_LINE.search(preamble)
+    if document_class:
+        packages.update(CLASS_PACKAGES.get(document_class.group(1).strip(), ()))
+
+    pending = list(packages)
+    while pending:
+        for implied in IMPLIED_PACKAGES.get(pending.pop(), ()):
+            if implied not in packages:
+                packages.add(implied)
+                pending.append(implied)
+    return packages
+
+def _provided(package, packages):
+    if package == 'amssymb':
+        # \mathbb and friends only need amsfonts
+        return 'amssymb' in packages or 'amsfonts' in packages
+    return package in packages
+
+def lint(content):
+    """Lint a document; returns LintIssues in document order."""
+    issues = []
+    line = 1
+    line_start = 0
+
+    def add(kind, message, position=None, at=None):
+        if at is None:
+            at = (line, position - line_start + 1)
+        issues.append(LintIssue(at[0], at[1], kind, message))
+
+    braces = []          # (line, column, text_mode)
+    environments = []    # (name, line, column)
+    inline_math = None   # (line, column) of the opening $ or \(
+    display_math = None  # (line, column) of the opening $$ or \[
+    display_reported = None
+    pending_text = False
+    begin_document = None
+    end_document = False
+    first_use = {}       # env or command -> (line, column)
+    defined = set(DEFINITION.findall(content))
+
+    position = 0
+    while True:
+        match = TOKEN_PATTERN.search(content, position)
+        if match is None:
+            break
+        position = match.end()
+        kind = match.lastgroup
+        column = match.start() - line_start + 1
+        text_token = pending_text
+        pending_text = False
+
+        if kind == 'newline':
+            line += 1
+            line_start = match.end()
+        elif kind == 'paragraph':
+            if inline_math is not None:
+                add('unclosed_math', "Inline math opened here is still open at a paragraph break",
+                    at=inline_math)
+                inline_math = None
+            if display_math is not None:
+                add('unclosed_math', "Display math opened here is still open at a paragraph break",
+                    at=display_math)
+                display_math = None
+            line += match.group().count('\n')
+            line_start = match.end() - len(match.group().rsplit('\n', 1)[1])
+        elif kind == 'comment':
+            pass
+        elif kind == 'command':
+            command = match.group('command')
+            if command in TEXT_COMMANDS:
+                pending_text = True
+            elif command in ('\\(', '\\)'):
+                inline_math = (line, column) if command == '\\(' else None
+            elif command in ('\\[', '\\]'):
+                display_math = (line, column) if command == '\\[' else None
+            elif command in COMMAND_PACKAGES:
+                first_use.setdefault(command, (line, column))
+        elif kind == 'open':
+            braces.append((line, column, text_token))
+        elif kind == 'close':
+            if braces:
+                braces.pop()
+            else:
+                add('unbalanced_brace', "'}' has no matching '{'", match.start())
+        elif kind == 'dollars':
+            in_text = any(text for _, _, text in braces)
+            math_env = next((name for name, _, _ in reversed(environments) if name in MATH_ENVIRONMENTS), None)
+            if math_env and not in_text:
+                add('dollar_in_display', f"$ inside {math_env} environment", match.start())
+            elif display_math and match.group() == '$' and not in_text:
+                # Report once per display; the rest are the same mistake
+                if display_reported != display_math:
+                    add('dollar_in_display', "$ inside display math", match.start())
+                    display_reported = display_math
+            elif match.group() == '$$':
+                display_math = None if display_math else (line, column)
+            else:
+                inline_math = None if inline_math else (line, column)
+        elif kind == 'env':
+            name = match.group('name').strip()
+            if match.group('side') == 'begin':
+                if name == 'document':
+                    begin_document = (line, column)
+                if name in VERBATIM_ENVIRONMENTS:
+                    closing = f'\\end{{{name}}}'
+                    end = content.find(closing, match.end())
+                    end = len(content) if end < 0 else end + len(closing)
+                    skipped = content[match.end():end]
+                    if skipped.count('\n'):
+                        line += skipped.count('\n')
+                        line_start = match.end() + skipped.rfind('\n') + 1
+                    position = end
+                    continue
+                environments.append((name, line, column))
+                if name in ENVIRONMENT_PACKAGES:
+                    first_use.setdefault(name, (line, column))
+            else:
+                if name == 'document':
+                    end_document = True
+                if not environments:
+                    add('unmatched_environment', f"\\end{{{name}}} without \\begin{{{name}}}", match.start())
+                elif environments[-1][0] == name:
+                    environments.pop()
+                elif any(env == name for env, _, _ in environments):
+                    # Everything opened after the matching \begin was left open
+                    while environments[-1][0] != name:
+                        open_name, open_line, open_column = environments.pop()
+                        add('unmatched_environment',
+                            f"\\begin{{{open_name}}} ended by \\end{{{name}}} on line {line}",
+                            at=(open_line, open_column))
+                    environments.pop()
+                else:
+                    add('unmatched_environment', f"\\end{{{name}}} without \\begin{{{name}}}", match.start())
+                if end_document:
+                    break
+
+    for open_line, open_column, _ in braces:
+        add('unbalanced_brace', "'{' is never closed", at=(open_line, open_column))
+    for name, open_line, open_column in environments:
+        if name != 'document':
+            add('unmatched_environment', f"\\begin{{{name}}} is never ended", at=(open_line, open_column))
+    if inline_math is not None:
+        add('unclosed_math', "Inline math is never closed", at=inline_math)
+    if display_math is not None:
+        add('unclosed_math', "Display math is never closed", at=display_math)
+
+    if begin_document is None:
+        add('document_structure', "Missing \\begin{document}", at=(1, 1))
+    elif not end_document:
+        add('document_structure', "Missing \\end{document}", at=(line, 1))
+
+    preamble_end = content.find('\\begin{document}')
+    packages = loaded_packages(content[:preamble_end] if preamble_end >= 0 else content)
+    for name, at in first_use.items():
+        if name in defined:
+            continue
+        if name.startswith('\\'):
+            package = COMMAND_PACKAGES[name]
+            if not _provided(package, packages):
+                add('missing_package', f"Command {name} requires {package}", at=at)
+        else:
+            package = ENVIRONMENT_PACKAGES[name]
+            if not _provided(package, packages):
+                add('missing_package', f"Environment {name} requires {package}", at=at)
+
+    return sorted(issues, key=lambda issue: (issue.line, issue.column))
+
+def lint_file(path):
+    """Lint a document on disk."""
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        return lint(f.read())
+
+def format_issues(path, issues):
+    """Render issues as file:line:column: message lines."""
+    return '\n'.join(f"{path}:{issue.line}:{issue.column}: {issue.message}" for issue in issues)
+
+def main():
+    """Lint lesson documents and exit nonzero if any have issues."""
+    parser = argparse.ArgumentParser(description="Lint LaTeX documents without running TeX")
+    parser.add_argument('files', nargs='*', help="documents to lint (default: lesson_*/src/*.tex)")
+    parser.add_argument('-q', '--quiet', action='store_true', help="only print the summary")
+    args = parser.parse_args()
+
+    files = args.files or sorted(glob.glob(str(Path(__file__).resolve().parent / 'lesson_*' / 'src' / '*.tex')))
+    broken = 0
+    total = 0
+    for path in files:
+        issues = lint_file(path)
+        if issues:
+            broken += 1
+            total += len(issues)
+            if not args.quiet:
+                print(format_issues(path, issues))
+
+    print(f"{total} issues in {broken} of {len(files)} files")
+    return 1 if broken else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Precompiled preamble formats shared by the lesson and problem documents
+
+The package-loading head of a document (\\documentclass, \\usepackage,
+\\usetikzlibrary, ...) is what makes every pdflatex run slow: tikz and
+pgfplots alone dominate start-up. Documents with the same head share one
+format file, dumped once with `pdflatex -ini` and cached under
+.build_cache/formats keyed by a hash of the head and the TeX toolchain.
+Each document is then compiled against that format from a body file in
+which the head lines are blanked out, so line numbers in the log still
+match the original source.
+
+Usage:
+    preamble_format.py TEX...    build the formats these documents need
+"""
+
+import fcntl
+import hashlib
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+from build_cache import CACHE_DIR, find_inputs, toolchain_version
+
+FORMAT_DIR = CACHE_DIR / 'formats'
+
+# Lines that belong in a dumped format: class and package loading only.
+# \newtheorem/\newmdenv blocks stay in the document; they are cheap and
+# differ between lessons, so leaving them out keeps the formats shared.
+# A loading line ends after its argument, so a line that goes on into
+# \begin{document} (as after tikz_externalize adds graphicx) ends the head.
+HEAD_LINE = re.compile(
+    r'\s*(?:%.*|\\(?:documentclass|usepackage|RequirePackage|usetikzlibrary|usepgfplotslibrary)'
+    r'\s*(?:\[[^\]]*\])?\s*\{[^{}]*\}\s*(?:%.*)?)?$'
+)
+
+def split_head(content):
+    """Return the lines of the package-loading head and the number of lines it spans."""
+    lines = content.splitlines(keepends=True)
+    head = []
+    for line in lines:
+        if not HEAD_LINE.match(line) or line.count('{') != line.count('}'):
+            break
+        head.append(line)
+
+    # Drop trailing blank and comment lines so they never split a format
+    while head and not head[-1].strip().startswith('\\'):
+        head.pop()
+
+    if not any(line.lstrip().startswith('\\documentclass') for line in head):
+        return '', 0
+    return ''.join(head), len(head)
+
+def format_name(head):
+    """Cache name of the format dumped from a preamble head."""
+    digest = hashlib.sha256()
+    digest.update(toolchain_version().encode('utf-8'))
+    digest.update(b'\0' + head.encode('utf-8'))
+    return f"preamble-{digest.hexdigest()[:16]}"
+
+def build_format(head, timeout=120):
+    """Dump a format for this head unless it is cached; return its name or None."""
+    name = format_name(head)
+    FORMAT_DIR.mkdir(parents=True, exist_ok=True)
+    fmt_file = FORMAT_DIR / f"{name}.fmt"
+    failed_marker = FORMAT_DIR / f"{name}.failed"
+
+    with open(FORMAT_DIR / f"{name}.lock", 'w') as lock:
+        # Parallel workers wait here while the first one dumps the format
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if fmt_file.exists():
+            return name
+        if failed_marker.exists():
+            return None
+
+        ini_file = FORMAT_DIR / f"{name}.ini.tex"
+        ini_file.write_text(head, encoding='utf-8')
+        try:
+            result = subprocess.run(
+                ['pdflatex', '-ini', '-interaction=nonstopmode',
+                 f'-jobname={name}', f'&pdflatex {ini_file.name}\\dump'],
+                cwd=FORMAT_DIR,
+                capture_output=True,
+                text=True,
+                errors='replace',
+                timeout=timeout
+            )
+            ok = result.returncode == 0 and fmt_file.exists()
+        except (OSError, subprocess.SubprocessError):
+            ok = False
+
+        if not ok:
+            fmt_file.unlink(missing_ok=True)
+            failed_marker.touch()
+            return None
+        return name
+
+def prepare(tex_path, content=None):
+    """Return (format name, body text) for compiling tex_path, or None.
+
+    None means the document has no usable head (no \\documentclass, a
+    locally provided package, or a head that cannot be dumped) and must be
+    compiled the normal way.
+    """
+    tex_path = Path(tex_path)
+    if content is None:
+        content = tex_path.read_text(encoding='utf-8')
+
+    head, head_lines = split_head(content)
+    if not head or find_inputs(tex_path, head):
+        return None
+
+    name = build_format(head)
+    if name is None:
+        return None
+
+    lines = content.splitlines(keepends=True)
+    body = '%\n' * head_lines + ''.join(lines[head_lines:])
+    return name, body
+
+def format_env():
+    """Environment that lets pdflatex find the cached formats."""
+    env = dict(os.environ)
+    # The trailing separator keeps the default search path after ours
+    env['TEXFORMATS'] = f"{FORMAT_DIR}{os.pathsep}{env.get('TEXFORMATS', '')}"
+    return env
+
+def main():
+    """Build the formats for the documents named on the command line."""
+    for tex in sys.argv[1:]:
+        content = Path(tex).read_text(encoding='utf-8')
+        head, _ = split_head(content)
+        name = build_format(head) if head else None
+        print(f"{tex}: {name or 'no format'}")
+
+if __name__ == "__main__":
+    main()
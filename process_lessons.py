@@ -1,44 +1,46 @@
 #!/usr/bin/env python3
 """
-Process ODE Lessons 19-50 from raw text files into structured lesson format
+Process ODE lessons from their raw text files into structured lesson format
 """
 
-import os
+import argparse
 import re
-import subprocess
 from pathlib import Path
 
+import lesson_paths
+from build_cache import is_up_to_date, record_build
+from build_trace import add_trace_argument, span
+from compile_stage import add_jobs_argument, add_server_argument, run_lessons, run_pdflatex
+from component_index import read_components
+from latex_unicode import describe_unmapped
+from latex_unicode import translate as translate_unicode
+from lesson_paths import add_lessons_argument
+
 def extract_lesson_components(filepath):
     """Extract the three components from a lesson file."""
-    with open(filepath, 'r', encoding='utf-8') as f:
-        content = f.read()
+    with span('extract', source=str(filepath)):
+        components = read_components(filepath)
     
     # Initialize components
     audio_script = ""
     theory_latex = ""
     problems_latex = ""
     
-    # Try to find audio script (Part 1, Component 1, or before first latex block)
-    audio_match = re.search(r'(Component 1:|Part 1:)(.*?)```latex', content, re.DOTALL)
-    if audio_match:
-        audio_script = audio_match.group(2).strip()
-    else:
-        # Try to get content before first latex block
-        first_latex = content.find('```latex')
-        if first_latex > 0:
-            audio_script = content[:first_latex].strip()
-            # Remove the lesson title if present
-            audio_script = re.sub(r'^#.*?\n+', '', audio_script)
-    
-    # Find LaTeX blocks
-    latex_blocks = re.findall(r'```latex(.*?)```', content, re.DOTALL)
-    
-    if len(latex_blocks) >= 2:
-        theory_latex = latex_blocks[0].strip()
-        problems_latex = latex_blocks[1].strip()
-    elif len(latex_blocks) == 1:
+    # Audio script is Part 1 / Component 1, or whatever precedes the first latex block
+    if components['audio_mode'] == 'component':
+        audio_script = components['audio'].strip()
+    elif components['audio_mode'] == 'prefix':
+        audio_script = components['audio'].strip()
+        # Remove the lesson title if present
+        audio_script = re.sub(r'^#.*?\n+', '', audio_script)
+    
+    # LaTeX blocks
+    if components['block_count'] >= 2:
+        theory_latex = components['theory'].strip()
+        problems_latex = components['problems'].strip()
+    elif components['block_count'] == 1:
         # Sometimes theory and problems might be in one block
-        theory_latex = latex_blocks[0].strip()
+        theory_latex = components['theory'].strip()
         # Try to split at common section marker
         if '\\title{Practice Problems' in theory_latex:
             parts = theory_latex.split('\\begin{document}', 1)
@@ -57,67 +59,17 @@ def extract_lesson_components(filepath):
     lesson_num = int(Path(filepath).stem)
     if not audio_script.startswith('Episode'):
         # Try to extract title from the file
-        title_match = re.search(r'Lesson \d+:\s*(.+?)(?:\n|$)', content)
-        if title_match:
-            title = title_match.group(1)
+        title = components['title']
+        if title:
             audio_script = f"Episode {lesson_num}: {title}\n\n{audio_script}"
     
     return audio_script, theory_latex, problems_latex
 
 def fix_latex_unicode(latex_content):
     """Fix common Unicode issues in LaTeX content."""
-    replacements = {
-        '✓': '\\checkmark',
-        '×': '\\times',
-        '∞': '\\infty',
-        'α': '\\alpha',
-        'β': '\\beta',
-        'γ': '\\gamma',
-        'δ': '\\delta',
-        'ε': '\\varepsilon',
-        'θ': '\\theta',
-        'λ': '\\lambda',
-        'μ': '\\mu',
-        'π': '\\pi',
-        'σ': '\\sigma',
-        'τ': '\\tau',
-        'φ': '\\phi',
-        'ω': '\\omega',
-        'Ω': '\\Omega',
-        '∂': '\\partial',
-        '∇': '\\nabla',
-        '∈': '\\in',
-        '∉': '\\notin',
-        '⊂': '\\subset',
-        '⊆': '\\subseteq',
-        '∪': '\\cup',
-        '∩': '\\cap',
-        '≈': '\\approx',
-        '≠': '\\neq',
-        '≤': '\\leq',
-        '≥': '\\geq',
-        '→': '\\rightarrow',
-        '⇒': '\\Rightarrow',
-        '⇔': '\\Leftrightarrow',
-        '∀': '\\forall',
-        '∃': '\\exists',
-        '∑': '\\sum',
-        '∏': '\\prod',
-        '∫': '\\int',
-        '√': '\\sqrt',
-        '±': '\\pm',
-        '·': '\\cdot',
-        '…': '\\ldots',
-        '′': "'",
-        '″': "''",
-        '—': '---',
-        '–': '--',
-    }
-    
-    result = latex_content
-    for unicode_char, latex_cmd in replacements.items():
-        result = result.replace(unicode_char, latex_cmd)
-    
+    result, unmapped = translate_unicode(latex_content)
+    for message in describe_unmapped(unmapped):
+        print(f"  Warning: unmapped character at {message}")
     return result
 
 def ensure_latex_packages(latex_content):
@@ -145,9 +97,21 @@ def ensure_latex_packages(latex_content):
     
     return latex_content
 
-def process_lesson(lesson_num, source_dir, target_dir):
+def prepare_latex(latex_content):
+    """Turn an extracted LaTeX block into the document written to src/."""
+    return ensure_latex_packages(fix_latex_unicode(latex_content))
+
+def write_document(lesson_num, kind, latex_content):
+    """Write a prepared document to its source path and return the path."""
+    path = lesson_paths.tex_path(lesson_num, kind)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(latex_content)
+    return path
+
+def process_lesson(lesson_num):
     """Process a single lesson."""
-    source_file = source_dir / f"{lesson_num}.txt"
+    source_file = lesson_paths.raw_source(lesson_num)
     if not source_file.exists():
         print(f"Warning: {source_file} not found")
         return False
@@ -155,7 +119,7 @@ def process_lesson(lesson_num, source_dir, target_dir):
     print(f"Processing Lesson {lesson_num}...")
     
     # Create lesson directory
-    lesson_dir = target_dir / f"lesson_{lesson_num:02d}"
+    lesson_dir = lesson_paths.lesson_dir(lesson_num)
     lesson_dir.mkdir(exist_ok=True)
     
     # Extract components
@@ -170,80 +134,74 @@ def process_lesson(lesson_num, source_dir, target_dir):
     
     # Save audio script
     if audio:
-        audio_file = lesson_dir / "lesson_script.txt"
+        audio_file = lesson_paths.script_path(lesson_num)
         with open(audio_file, 'w', encoding='utf-8') as f:
             f.write(audio)
         print(f"  Created: {audio_file}")
     
     # Process and save theory LaTeX
     if theory:
-        theory = fix_latex_unicode(theory)
-        theory = ensure_latex_packages(theory)
-        theory_file = lesson_dir / f"lesson_{lesson_num:02d}.tex"
-        with open(theory_file, 'w', encoding='utf-8') as f:
-            f.write(theory)
+        theory_file = write_document(lesson_num, 'lesson', prepare_latex(theory))
         print(f"  Created: {theory_file}")
         
-        # Compile to PDF
-        try:
-            result = subprocess.run(
-                ['pdflatex', f'lesson_{lesson_num:02d}.tex'],
-                cwd=lesson_dir,
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
-            if result.returncode == 0:
-                print(f"  Compiled: lesson_{lesson_num:02d}.pdf")
-            else:
-                print(f"  Warning: Failed to compile theory PDF")
-        except Exception as e:
-            print(f"  Warning: Could not compile theory PDF: {e}")
+        # Compile to PDF unless it is already built from this source
+        theory_pdf = lesson_paths.pdf_path(lesson_num, 'lesson')
+        if is_up_to_date(theory_file, theory_pdf):
+            print(f"  Up to date: lesson_{lesson_num:02d}.pdf")
+        else:
+            try:
+                result = run_pdflatex(theory_file, pdf_path=theory_pdf)
+                if result.ok:
+                    record_build(theory_file, theory_pdf)
+                    print(f"  Compiled: lesson_{lesson_num:02d}.pdf")
+                else:
+                    print(f"  Warning: Failed to compile theory PDF")
+            except Exception as e:
+                print(f"  Warning: Could not compile theory PDF: {e}")
     
     # Process and save problems LaTeX
     if problems:
-        problems = fix_latex_unicode(problems)
-        problems = ensure_latex_packages(problems)
-        problems_file = lesson_dir / f"problems_{lesson_num:02d}.tex"
-        with open(problems_file, 'w', encoding='utf-8') as f:
-            f.write(problems)
+        problems_file = write_document(lesson_num, 'problems', prepare_latex(problems))
         print(f"  Created: {problems_file}")
         
-        # Compile to PDF
-        try:
-            result = subprocess.run(
-                ['pdflatex', f'problems_{lesson_num:02d}.tex'],
-                cwd=lesson_dir,
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
-            if result.returncode == 0:
-                print(f"  Compiled: problems_{lesson_num:02d}.pdf")
-            else:
-                print(f"  Warning: Failed to compile problems PDF")
-        except Exception as e:
-            print(f"  Warning: Could not compile problems PDF: {e}")
+        # Compile to PDF unless it is already built from this source
+        problems_pdf = lesson_paths.pdf_path(lesson_num, 'problems')
+        if is_up_to_date(problems_file, problems_pdf):
+            print(f"  Up to date: problems_{lesson_num:02d}.pdf")
+        else:
+            try:
+                result = run_pdflatex(problems_file, pdf_path=problems_pdf)
+                if result.ok:
+                    record_build(problems_file, problems_pdf)
+                    print(f"  Compiled: problems_{lesson_num:02d}.pdf")
+                else:
+                    print(f"  Warning: Failed to compile problems PDF")
+            except Exception as e:
+                print(f"  Warning: Could not compile problems PDF: {e}")
     
     return True
 
 def main():
     """Main processing function."""
-    base_dir = Path("/home/archer/Desktop/ODE 50 Lessons Plan")
-    source_dir = base_dir / "Lessons 19 and more"
-    
-    # Process lessons 19-50
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    add_jobs_argument(parser)
+    add_server_argument(parser)
+    add_trace_argument(parser)
+    add_lessons_argument(parser)
+    args = parser.parse_args()
+    
+    # Every lesson with a raw source unless --lessons says otherwise
+    lessons = args.lessons if args.lessons is not None else lesson_paths.raw_lessons()
     successful = 0
     failed = []
     
-    for lesson_num in range(19, 51):
-        try:
-            if process_lesson(lesson_num, source_dir, base_dir):
-                successful += 1
-            else:
-                failed.append(lesson_num)
-        except Exception as e:
-            print(f"Error processing lesson {lesson_num}: {e}")
+    for lesson_num, ok, error in run_lessons(process_lesson, lessons, args.jobs):
+        if error is not None:
+            print(f"Error processing lesson {lesson_num}: {error}")
+            failed.append(lesson_num)
+        elif ok:
+            successful += 1
+        else:
             failed.append(lesson_num)
     
     print(f"\n{'='*50}")
@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+Narrated episodes rendered from the audio scripts
+
+Each lesson_script.txt is turned into speakable text (markup dropped,
+symbols such as y', q₀ and ∫ spelled out) and split into chunks that end
+on sentence boundaries and never cross a paragraph, each short enough for
+the text-to-speech backend. A chunk is rendered once into the cache under
+.build_cache/audio as <hash>.wav, keyed by its text and the backend's
+voice settings, so editing one paragraph re-renders only that
+paragraph's chunks. Missing chunks of every selected lesson are rendered
+in parallel.
+
+The episode (lesson_NN/episode_NN.wav) is then joined from the cached
+chunks with short pauses between them, copying a block of frames at a
+time, and is rewritten only when its list of chunks changed.
+
+Backends register under a name. `tone` is a deterministic stand-in that
+needs nothing installed: every word becomes a short tone pitched by the
+word's hash. `espeak` narrates with espeak-ng.
+
+Usage:
+    render_audio.py [--lessons 19-50] [--backend tone|espeak] [--voice V] [--rate WPM] [-j N] [--dry-run]
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+import subprocess
+import sys
+import wave
+import zlib
+from array import array
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import compile_stage
+import lesson_paths
+from build_cache import CACHE_DIR
+from lesson_paths import add_lessons_argument
+
+AUDIO_DIR = CACHE_DIR / 'audio'
+EPISODE_STATE = AUDIO_DIR / 'episodes.json'
+
+# Silence after a chunk that ends a sentence, and after one that ends a paragraph
+SENTENCE_PAUSE = 0.25
+PARAGRAPH_PAUSE = 0.7
+
+# Frames copied at a time when joining an episode
+BLOCK_FRAMES = 1 << 16
+
+RENDER_TIMEOUT = 300
+
+# text: what the backend speaks, paragraph_end: whether a paragraph ends with it
+Chunk = namedtuple('Chunk', ['text', 'paragraph_end'])
+
+# --- Speakable text --------------------------------------------------------
+
+SPOKEN = {
+    '√': ' root ', '∫': ' integral of ', '∂': ' partial ',
+    '∑': ' sum of ', 'Σ': ' sum of ', '→': ' to ', '≠': ' not equal to ', '≈': ' approximately ',
+    '≤': ' less than or equal to ', '≥': ' greater than or equal to ', '≡': ' identically ',
+    '±': ' plus or minus ', '·': ' times ', '×': ' times ', '−': ' minus ', '∞': ' infinity ',
+    '✓': '', '•': '', '_': ' ',
+    'α': ' alpha ', 'β': ' beta ', 'γ': ' gamma ', 'δ': ' delta ', 'Δ': ' delta ',
+    'ε': ' epsilon ', 'θ': ' theta ', 'λ': ' lambda ', 'μ': ' mu ', 'ν': ' nu ', 'ξ': ' xi ',
+    'π': ' pi ', 'σ': ' sigma ', 'τ': ' tau ', 'φ': ' phi ', 'Φ': ' Phi ', 'ψ': ' psi ',
+    'ω': ' omega ', 'Ω': ' omega ',
+}
+SUBSCRIPTS = str.maketrans('₀₁₂₃₄₅₆₇₈₉₊₋ₙᵢⱼₖₜ', '0123456789+-nijkt')
+SUPERSCRIPTS = str.maketrans('⁰¹²³⁴⁵⁶⁷⁸⁹⁺⁻⁽⁾ⁿᵀᵗˣ', '0123456789+-()nTtx')
+
+SUBSCRIPT_RUN = re.compile('[₀₁₂₃₄₅₆₇₈₉₊₋ₙᵢⱼₖₜ]+')
+SUPERSCRIPT_RUN = re.compile('[⁰¹²³⁴⁵⁶⁷⁸⁹⁺⁻⁽⁾ⁿᵀᵗˣ]+')
+POWERS = {'2': 'squared', '3': 'cubed', 'T': 'transpose'}
+DOTTED = re.compile('([A-Za-z])̇|([ẋẏż])')
+PRIME = re.compile(r"\b([A-Za-z])('+)(?=[\s=(),.;:+\-]|$)")
+PRIMES = {1: 'prime', 2: 'double prime', 3: 'triple prime'}
+
+# Lines that are labels of the script rather than narration
+SKIPPED_LINES = re.compile(r'(?i)^(audio lesson script|\[.*\])$')
+
+def _superscript(match):
+    power = match.group(0).translate(SUPERSCRIPTS)
+    if power in POWERS:
+        return f" {POWERS[power]} "
+    return f" to the {power} "
+
+def _dotted(match):
+    letter = match.group(1) or {'ẋ': 'x', 'ẏ': 'y', 'ż': 'z'}[match.group(2)]
+    return f"{letter} dot"
+
+def speakable(line):
+    """A script line as plain words a speech engine reads sensibly."""
+    line = line.replace('**', '').replace('`', '')
+    line = re.sub(r'^\s*(#+|[-*•]|\d+\.)\s+', '', line)
+    line = DOTTED.sub(_dotted, line)
+    line = PRIME.sub(lambda m: f"{m.group(1)} {PRIMES.get(len(m.group(2)), 'prime')}", line)
+    line = SUBSCRIPT_RUN.sub(lambda m: f" {m.group(0).translate(SUBSCRIPTS)} ", line)
+    line = SUPERSCRIPT_RUN.sub(_superscript, line)
+    line = ''.join(SPOKEN.get(ch, ch) for ch in line)
+    return ' '.join(line.split())
+
+def paragraphs(script):
+    """Speakable paragraphs of a script: its non-empty lines."""
+    result = []
+    for line in script.splitlines():
+        text = speakable(line)
+        if text and not SKIPPED_LINES.match(text):
+            result.append(text)
+    return result
+
+# --- Chunks ----------------------------------------------------------------
+
+SENTENCE_END = re.compile(r'(?<=[.!?])["\')\]]*\s+(?=["\'(\[]?[A-Z0-9])')
+CLAUSE_END = re.compile(r'(?<=[,;:])\s+')
+
+def _pieces(text, pattern, limit):
+    """Split text at a pattern's matches into pieces of at most limit characters."""
+    pieces = []
+    start = 0
+    for match in pattern.finditer(text):
+        pieces.append(text[start:match.start()].strip())
+        start = match.end()
+    pieces.append(text[start:].strip())
+    result = []
+    for piece in filter(None, pieces):
+        if len(piece) <= limit:
+            result.append(piece)
+        elif pattern is SENTENCE_END:
+            result.extend(_pieces(piece, CLAUSE_END, limit))
+        else:
+            result.extend(_words(piece, limit))
+    return result
+
+def _words(text, limit):
+    """Split text at spaces into pieces of at most limit characters."""
+    pieces = []
+    current = ''
+    for word in text.split():
+        if current and len(current) + 1 + len(word) > limit:
+            pieces.append(current)
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    if current:
+        pieces.append(current)
+    return pieces
+
+def chunk_script(script, max_chars):
+    """Chunks of a script, packing whole sentences of one paragraph up to max_chars.
+
+    A chunk never spans two paragraphs, so an edit changes only the
+    chunks of the paragraph it touches.
+    """
+    chunks = []
+    for paragraph in paragraphs(script):
+        packed = []
+        current = ''
+        for sentence in _pieces(paragraph, SENTENCE_END, max_chars):
+            if current and len(current) + 1 + len(sentence) > max_chars:
+                packed.append(current)
+                current = sentence
+            else:
+                current = f"{current} {sentence}" if current else sentence
+        packed.append(current)
+        chunks.extend(Chunk(text, i == len(packed) - 1) for i, text in enumerate(packed))
+    return chunks
+
+# --- Backends --------------------------------------------------------------
+
+# name -> Backend subclass
+BACKENDS = {}
+
+def backend(name):
+    """Register a backend class under `name`."""
+    def register(cls):
+        cls.name = name
+        BACKENDS[name] = cls
+        return cls
+    return register
+
+class Backend:
+    """A text-to-speech engine that renders one chunk into a WAV file.
+
+    Subclasses set max_chars, the longest chunk the engine handles well,
+    and implement identity() and render(). Every chunk of a backend must
+    come out with the same channels, sample width and rate.
+    """
+
+    name = None
+    max_chars = 500
+
+    def __init__(self, voice=None, rate=None):
+        self.voice = voice
+        self.rate = rate
+
+    def identity(self):
+        """Everything besides the text that changes the audio, for the cache key."""
+        raise NotImplementedError
+
+    def render(self, text, path):
+        """Write the spoken text to path as a WAV file; raise RuntimeError on failure."""
+        raise NotImplementedError
+
+def _write_wav(path, frames, sample_rate):
+    if sys.byteorder == 'big':
+        frames.byteswap()
+    with wave.open(str(path), 'wb') as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(sample_rate)
+        out.writeframes(frames.tobytes())
+
+@backend('tone')
+class ToneBackend(Backend):
+    """Deterministic stand-in: a tone per word, pitched by the word's hash."""
+
+    max_chars = 400
+    sample_rate = 16000
+    amplitude = 6000
+
+    def identity(self):
+        return f"tone-1:{self.rate or 160}"
+
+    def render(self, text, path):
+        # Average word length in characters is about 5, so this keeps rate in words per minute
+        char_seconds = 60 / (self.rate or 160) / 6
+        frames = array('h')
+        for word in text.split():
+            period = 40 + zlib.crc32(word.encode('utf-8')) % 60
+            cycle = array('h', (int(self.amplitude * math.sin(2 * math.pi * i / period))
+                                for i in range(period)))
+            length = int(self.sample_rate * char_seconds * (len(word) + 1))
+            frames.extend(cycle * max(1, length // period))
+            gap = self.sample_rate * char_seconds * (3 if word[-1] in '.,;:!?' else 1)
+            frames.extend(array('h', bytes(2 * int(gap))))
+        _write_wav(path, frames, self.sample_rate)
+
+@backend('espeak')
+class EspeakBackend(Backend):
+    """Narration by espeak-ng (or espeak)."""
+
+    max_chars = 1000
+
+    def __init__(self, voice=None, rate=None):
+        super().__init__(voice or 'en-us', rate or 160)
+        self.binary = shutil.which('espeak-ng') or shutil.which('espeak')
+        if self.binary is None:
+            raise OSError("espeak-ng not found")
+        result = subprocess.run([self.binary, '--version'], capture_output=True, text=True)
+        self.version = result.stdout.strip()
+
+    def identity(self):
+        return f"espeak:{self.version}:{self.voice}:{self.rate}"
+
+    def render(self, text, path):
+        result = subprocess.run(
+            [self.binary, '-v', self.voice, '-s', str(self.rate), '-w', str(path), '--stdin'],
+            input=text, capture_output=True, text=True, timeout=RENDER_TIMEOUT
+        )
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip() or f"{self.binary} exited with {result.returncode}")
+
+# --- Rendering -------------------------------------------------------------
+
+def chunk_key(engine, chunk):
+    """Cache key of a chunk rendered by a backend."""
+    digest = hashlib.sha256()
+    digest.update(engine.identity().encode('utf-8'))
+    digest.update(b'\0' + chunk.text.encode('utf-8'))
+    return digest.hexdigest()[:24]
+
+def chunk_path(key):
+    return AUDIO_DIR / f"{key}.wav"
+
+def render_chunk(engine, key, text):
+    """Render a chunk into the cache; returns an error message or None."""
+    path = chunk_path(key)
+    tmp = path.with_name(f".{path.stem}.{os.getpid()}.tmp.wav")
+    try:
+        engine.render(text, tmp)
+        with wave.open(str(tmp), 'rb') as check:
+            if check.getnframes() == 0:
+                raise RuntimeError("no audio")
+        os.replace(tmp, path)
+        return None
+    except (OSError, RuntimeError, EOFError, wave.Error, subprocess.TimeoutExpired) as e:
+        return str(e) or type(e).__name__
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+def render_chunks(engine, texts, jobs=None):
+    """Render the chunks {key: text} missing from the cache, in parallel.
+
+    Returns {key: error} for the chunks that failed.
+    """
+    missing = {key: text for key, text in texts.items() if not chunk_path(key).exists()}
+    if not missing:
+        return {}
+    AUDIO_DIR.mkdir(parents=True, exist_ok=True)
+    workers = min(jobs or compile_stage.default_jobs(), len(missing))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        errors = dict(zip(missing, executor.map(lambda key: render_chunk(engine, key, missing[key]), missing)))
+    return {key: error for key, error in errors.items() if error}
+
+def join_episode(parts, output):
+    """Write the chunks (key, pause seconds) one after another into output.
+
+    Frames are streamed a block at a time, so memory use does not grow
+    with the episode.
+    """
+    tmp = output.with_name(f".{output.stem}.{os.getpid()}.tmp.wav")
+    params = None
+    try:
+        with wave.open(str(tmp), 'wb') as out:
+            for key, pause in parts:
+                with wave.open(str(chunk_path(key)), 'rb') as chunk:
+                    shape = (chunk.getnchannels(), chunk.getsampwidth(), chunk.getframerate())
+                    if params is None:
+                        params = shape
+                        out.setnchannels(shape[0])
+                        out.setsampwidth(shape[1])
+                        out.setframerate(shape[2])
+                    elif shape != params:
+                        raise ValueError(f"chunk {key} is {shape}, the episode {params}")
+                    while True:
+                        frames = chunk.readframes(BLOCK_FRAMES)
+                        if not frames:
+                            break
+                        out.writeframesraw(frames)
+                silence = int(pause * params[2])
+                while silence > 0:
+                    count = min(silence, BLOCK_FRAMES)
+                    out.writeframesraw(bytes(count * params[0] * params[1]))
+                    silence -= count
+        os.replace(tmp, output)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+def _read_state():
+    try:
+        with open(EPISODE_STATE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _write_state(state):
+    AUDIO_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = EPISODE_STATE.with_name(f".{EPISODE_STATE.name}.{os.getpid()}.tmp")
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=1)
+    os.replace(tmp, EPISODE_STATE)
+
+def episode_parts(engine, chunks):
+    """(key, pause) for each chunk of an episode."""
+    return [(chunk_key(engine, chunk), PARAGRAPH_PAUSE if chunk.paragraph_end else SENTENCE_PAUSE)
+            for chunk in chunks]
+
+def render_lessons(engine, lessons, jobs=None, dry_run=False):
+    """Render the episodes of the given lessons; returns {lesson: Counter}."""
+    plans = {}
+    texts = {}
+    for lesson_num in lessons:
+        script = lesson_paths.script_path(lesson_num)
+        if not script.exists():
+            continue
+        chunks = chunk_script(script.read_text(encoding='utf-8'), engine.max_chars)
+        plans[lesson_num] = episode_parts(engine, chunks)
+        texts.update((key, chunk.text) for (key, _), chunk in zip(plans[lesson_num], chunks))
+
+    stats = {lesson_num: Counter() for lesson_num in plans}
+    for lesson_num, parts in plans.items():
+        for key, _ in parts:
+            stats[lesson_num]['cached' if chunk_path(key).exists() else 'rendered'] += 1
+    if dry_run:
+        return stats
+
+    errors = render_chunks(engine, texts, jobs)
+    state = _read_state()
+    for lesson_num, parts in plans.items():
+        failed = sum(1 for key, _ in parts if key in errors)
+        if failed:
+            stats[lesson_num]['failed'] = failed
+            stats[lesson_num]['rendered'] -= failed
+            stats[lesson_num]['error'] = next(errors[key] for key, _ in parts if key in errors)
+            continue
+        output = lesson_paths.audio_path(lesson_num)
+        digest = hashlib.sha256(json.dumps(parts).encode('utf-8')).hexdigest()
+        if output.exists() and state.get(str(lesson_num)) == digest:
+            continue
+        join_episode(parts, output)
+        state[str(lesson_num)] = digest
+        stats[lesson_num]['joined'] = 1
+    _write_state(state)
+    return stats
+
+def main():
+    """Render the episodes of the selected lessons and report what was done."""
+    parser = argparse.ArgumentParser(description="Render the audio scripts into narrated episodes")
+    add_lessons_argument(parser)
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='tone',
+                        help="text-to-speech backend (default: tone, a deterministic stand-in)")
+    parser.add_argument('--voice', help="voice of the backend")
+    parser.add_argument('--rate', type=int, help="speaking rate in words per minute")
+    parser.add_argument('--dry-run', action='store_true', help="report which chunks would be rendered")
+    compile_stage.add_jobs_argument(parser)
+    args = parser.parse_args()
+
+    try:
+        engine = BACKENDS[args.backend](args.voice, args.rate)
+    except OSError as e:
+        print(f"{args.backend}: {e}", file=sys.stderr)
+        return 1
+
+    stats = render_lessons(engine, lesson_paths.selected(args.lessons), args.jobs, args.dry_run)
+    failed = 0
+    for lesson_num, counts in stats.items():
+        line = f"Lesson {lesson_num:2}: {counts['cached']} cached, {counts['rendered']} rendered"
+        if counts['failed']:
+            failed += 1
+            line += f", {counts['failed']} failed ({counts['error']})"
+        elif counts['joined']:
+            line += f" -> {lesson_paths.audio_path(lesson_num).name}"
+        print(line)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,12 @@
 #!/bin/bash
 
 # Reorganize all lesson directories
-# Move .tex and .aux files to src/ subdirectory
+# Move .tex files to src/ subdirectory
 # Keep .pdf files and lesson_script.txt in main directory
+# (.aux/.log files are written to .build/, outside the lesson directories)
+
+# Work from the checkout this script lives in
+cd "$(dirname "$0")" || exit 1
 
 echo "Reorganizing lesson directories..."
 
@@ -35,20 +39,6 @@ for i in {7..50}; do
             echo "  Moved problems_${lesson_num}.tex to src/"
         fi
         
-        # Move auxiliary files to src/
-        if [ -f "$lesson_dir/lesson_${lesson_num}.aux" ]; then
-            mv "$lesson_dir/lesson_${lesson_num}.aux" "$lesson_dir/src/"
-        fi
-        
-        if [ -f "$lesson_dir/problems_${lesson_num}.aux" ]; then
-            mv "$lesson_dir/problems_${lesson_num}.aux" "$lesson_dir/src/"
-        fi
-        
-        # Move any .log files to src/
-        if ls "$lesson_dir"/*.log 1> /dev/null 2>&1; then
-            mv "$lesson_dir"/*.log "$lesson_dir/src/"
-        fi
-        
         # Verify PDFs remain in main directory
         if [ -f "$lesson_dir/lesson_${lesson_num}.pdf" ]; then
             echo "  ✓ lesson_${lesson_num}.pdf remains in main directory"
@@ -76,5 +66,4 @@ echo "    ├── lesson_XX.pdf         (theory PDF)"
 echo "    ├── problems_XX.pdf       (problems PDF)"
 echo "    └── src/"
 echo "        ├── lesson_XX.tex     (theory LaTeX source)"
-echo "        ├── problems_XX.tex   (problems LaTeX source)"
-echo "        └── *.aux, *.log      (auxiliary files)"
\ No newline at end of file
+echo "        └── problems_XX.tex   (problems LaTeX source)"
\ No newline at end of file
@@ -0,0 +1,532 @@
+#!/usr/bin/env python3
+"""
+Full-text search over the audio scripts and the LaTeX sources
+
+Every lesson_script.txt, lesson_NN.tex and problems_NN.tex is split into
+passages (a LaTeX \\section or \\subsection, a paragraph of a script) and
+put in an SQLite inverted index under .build_cache/. The index keeps the
+positions of each term in each passage, so quoted phrases match exactly.
+
+LaTeX is tokenized with the math-aware token model: words come from
+text-mode material, Greek letters from their commands, and math,
+comments and markup are left out. Words are lower-cased and lightly
+stemmed ("isoclines" finds "isocline"). Common words are not indexed
+but still count as positions, so "method of undetermined coefficients"
+matches as a phrase.
+
+A query returns passages that contain every word and phrase, ranked by
+BM25. When the rarest term is rare, its postings give the candidates
+and only those are scored. Otherwise each term's postings are read in
+order of their precomputed BM25 impact and reading stops once no unseen
+passage can beat the current top results, so a query over common words
+reads a few hundred postings, not all of them. A file is indexed again
+only when its content hash changes.
+
+Usage:
+    search_lessons.py update
+    search_lessons.py query [--kind script|lesson|problems] [--lessons SPEC] [--top N] WORDS...
+    search_lessons.py query '"variation of parameters"' wronskian
+"""
+
+import argparse
+import hashlib
+import heapq
+import math
+import re
+import sqlite3
+import sys
+import time
+from array import array
+
+import lesson_paths
+from build_cache import CACHE_DIR
+from latex_tokens import tokenize
+from lesson_paths import DOCUMENT_KINDS, add_lessons_argument
+
+INDEX_PATH = CACHE_DIR / 'search.sqlite'
+
+# Bumped whenever tokenization changes, so every file is indexed again
+SCHEMA_VERSION = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, hash TEXT);
+CREATE TABLE IF NOT EXISTS passages (
+    id INTEGER PRIMARY KEY, path TEXT, lesson INTEGER, kind TEXT,
+    title TEXT, line INTEGER, length INTEGER, text TEXT);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT, passage INTEGER, kind TEXT, impact REAL, positions BLOB,
+    PRIMARY KEY (term, passage)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, df INTEGER) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL);
+CREATE INDEX IF NOT EXISTS passages_path ON passages (path);
+CREATE INDEX IF NOT EXISTS passages_lesson ON passages (lesson);
+CREATE INDEX IF NOT EXISTS postings_passage ON postings (passage);
+CREATE INDEX IF NOT EXISTS postings_impact ON postings (term, impact DESC);
+CREATE INDEX IF NOT EXISTS postings_kind_impact ON postings (term, kind, impact DESC);
+"""
+
+# Okapi BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Impacts are recomputed when the average passage length moves this much
+IMPACT_DRIFT = 0.1
+
+# Below this many postings for the rarest term, every candidate is scored
+EXHAUSTIVE_LIMIT = 2000
+TOP_BATCH = 64
+
+SNIPPET_WORDS = 12
+SNIPPET_MATH = 40
+
+# Variables bound into one SQL statement at most
+SQL_VARIABLES = 900
+
+# Math is stored between these marks so it shows in snippets but holds no words
+MATH_START, MATH_END = '\x02', '\x03'
+WORD = re.compile(r"\x02[^\x03]*\x03?|[^\W\d_]+(?:'[^\W\d_]+)?")
+QUERY_PART = re.compile(r'"([^"]*)"|(\S+)')
+
+# First line of an audio script, which has no ** around it
+EPISODE_HEADING = re.compile(r'Episode \d+:')
+
+STOPWORDS = frozenset("""
+a about all also an and any are as at be because been but by can do does for from has have
+here how if in into is it its just let like may more must no not now of on once one or our
+so such than that the their them then there these they this those to too up us very was we
+what when where which while who why will with would you your
+""".split())
+
+GREEK = frozenset("""
+alpha beta gamma delta epsilon varepsilon zeta eta theta vartheta iota kappa lambda mu nu xi
+pi rho sigma tau upsilon phi varphi chi psi omega Gamma Delta Theta Lambda Xi Pi Sigma Phi Psi Omega
+""".split())
+
+SECTIONS = {'\\section', '\\section*', '\\subsection', '\\subsection*'}
+
+def stem(word):
+    """Strip plural and possessive endings, which is enough for course vocabulary."""
+    if word.endswith("'s"):
+        word = word[:-2]
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 4 and word.endswith(('sses', 'xes', 'ches', 'shes')):
+        return word[:-2]
+    if len(word) > 3 and word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+def words(text):
+    """Yield (position, term, start, end) for every word; stopwords have term None."""
+    position = 0
+    for match in WORD.finditer(text):
+        word = match.group().lower()
+        if word.startswith(MATH_START):
+            continue
+        yield position, None if word in STOPWORDS else stem(word), match.start(), match.end()
+        position += 1
+
+def _argument(content, position):
+    """Text of the brace group at or after `position`, and the offset after it."""
+    start = content.find('{', position)
+    if start < 0:
+        return '', position
+    depth = 0
+    for i in range(start, len(content)):
+        if content[i] == '{':
+            depth += 1
+        elif content[i] == '}':
+            depth -= 1
+            if depth == 0:
+                return content[start + 1:i], i + 1
+    return content[start + 1:], len(content)
+
+def _plain_piece(kind, text):
+    """What a token contributes to a passage's plain text."""
+    if kind == 'text':
+        return text.replace('{', '').replace('}', '')
+    if kind == 'command' and text[1:] in GREEK:
+        return f" {text[1:]} "
+    if kind in ('inline_math', 'display_math'):
+        # Letters in math are symbols, not words
+        return f" {MATH_START}{' '.join(text.split())}{MATH_END} "
+    return ' '
+
+def _plain_pieces(fragment):
+    return [_plain_piece(token.kind, fragment[token.start:token.end]) for token in tokenize(fragment)]
+
+def latex_passages(content):
+    """Split a LaTeX document into (title, line, plain text) per section.
+
+    Plain text keeps the text-mode words and Greek letter names; math is
+    kept as its source for snippets but holds no words of its own.
+    """
+    begin = max(content.find('\\begin{document}'), 0)
+    title = re.search(r'\\title\{([^}]*)\}', content[:begin])
+    preamble_lines = content.count('\n', 0, begin)
+    body = content[begin:]
+    passages = []
+    # The heading's words belong to its passage, so a heading alone finds it
+    current = [title.group(1) if title else '', preamble_lines + 1, []]
+    if title:
+        current[2] += _plain_pieces(title.group(1)) + [' ']
+    skip_until = 0
+    for token in tokenize(body):
+        if token.end <= skip_until:
+            continue
+        # A text token may run on past the end of a heading's argument
+        text = body[max(token.start, skip_until):token.end]
+        if token.kind == 'command' and text in SECTIONS:
+            passages.append(current)
+            heading, skip_until = _argument(body, token.end)
+            current = [' '.join(heading.split()), preamble_lines + body.count('\n', 0, token.start) + 1,
+                       _plain_pieces(heading) + [' ']]
+        else:
+            current[2].append(_plain_piece(token.kind, text))
+    passages.append(current)
+    result = []
+    for heading, line, pieces in passages:
+        text = ' '.join(''.join(pieces).split())
+        if text:
+            result.append((heading, line, text))
+    return result
+
+def script_passages(content):
+    """Split an audio script into (title, line, text) per paragraph."""
+    passages = []
+    title = ''
+    line = 1
+    for block in re.split(r'\n\s*\n', content):
+        lines = block.strip().splitlines()
+        if lines:
+            text = ' '.join(' '.join(lines).split())
+            if len(lines) == 1 and (text.endswith('**') or EPISODE_HEADING.match(text)):
+                # A heading line such as "**Opening**" or "Episode 9: ..."
+                title = text.strip('*').strip()
+            else:
+                passages.append((title, line, text))
+        line += block.count('\n') + 2
+    return passages
+
+def sources(lessons=None):
+    """Yield (path, lesson, kind) for every file to index."""
+    for lesson_num in lesson_paths.selected(lessons):
+        script = lesson_paths.script_path(lesson_num)
+        if script.exists():
+            yield script, lesson_num, 'script'
+        for kind in DOCUMENT_KINDS:
+            tex = lesson_paths.tex_path(lesson_num, kind)
+            if tex.exists():
+                yield tex, lesson_num, kind
+
+def open_index(path=INDEX_PATH):
+    """Connection to the index, creating or resetting it as needed."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(str(path), timeout=30)
+    connection.execute('PRAGMA journal_mode=WAL')
+    if connection.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+        with connection:
+            for table in ('files', 'passages', 'postings', 'terms', 'meta'):
+                connection.execute(f'DROP TABLE IF EXISTS {table}')
+            connection.executescript(SCHEMA)
+            connection.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    return connection
+
+def _remove(connection, path, touched):
+    ids = [row[0] for row in connection.execute('SELECT id FROM passages WHERE path = ?', (path,))]
+    for start in range(0, len(ids), SQL_VARIABLES):
+        chunk = ids[start:start + SQL_VARIABLES]
+        marks = ','.join('?' * len(chunk))
+        touched.update(row[0] for row in connection.execute(
+            f'SELECT DISTINCT term FROM postings WHERE passage IN ({marks})', chunk))
+        connection.execute(f'DELETE FROM postings WHERE passage IN ({marks})', chunk)
+    connection.execute('DELETE FROM passages WHERE path = ?', (path,))
+    connection.execute('DELETE FROM files WHERE path = ?', (path,))
+
+def _add(connection, path, lesson_num, kind, content, touched):
+    """Index one file; its impacts are filled in by _set_impacts()."""
+    split = script_passages if kind == 'script' else latex_passages
+    for title, line, text in split(content):
+        positions = {}
+        length = 0
+        for position, term, _, _ in words(text):
+            length = position + 1
+            if term is not None:
+                positions.setdefault(term, array('I')).append(position)
+        passage = connection.execute(
+            'INSERT INTO passages (path, lesson, kind, title, line, length, text) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (path, lesson_num, kind, title, line, length, text)).lastrowid
+        connection.executemany('INSERT INTO postings VALUES (?, ?, ?, NULL, ?)',
+                               [(term, passage, kind, found.tobytes()) for term, found in positions.items()])
+        touched.update(positions)
+
+def _set_impacts(connection):
+    """Fill in the BM25 term-frequency part of the postings that have none yet.
+
+    It depends on the average passage length, so every posting is
+    recomputed when the average has drifted since the last time.
+    """
+    meta = dict(connection.execute('SELECT key, value FROM meta'))
+    average = connection.execute('SELECT AVG(length) FROM passages').fetchone()[0] or 1
+    scored_with = meta.get('impact_length')
+    every = scored_with is None or abs(average - scored_with) > IMPACT_DRIFT * scored_with
+    if every:
+        scored_with = average
+        connection.execute("INSERT OR REPLACE INTO meta VALUES ('impact_length', ?)", (average,))
+    # A posting's positions are 4-byte integers, so its term frequency is length / 4
+    connection.execute(
+        f'UPDATE postings SET impact = (length(positions) / 4.0 * {K1 + 1}) / (length(positions) / 4.0'
+        f' + {K1} * (1 - {B} + {B} * (SELECT length FROM passages WHERE id = postings.passage) / ?))'
+        + ('' if every else ' WHERE impact IS NULL'), (scored_with,))
+
+def update(connection, lessons=None):
+    """Index the files whose content changed; returns the number indexed."""
+    touched = set()
+    indexed = 0
+    present = set()
+    with connection:
+        known = dict(connection.execute('SELECT path, hash FROM files'))
+        for source, lesson_num, kind in sources(lessons):
+            path = source.resolve().relative_to(lesson_paths.root()).as_posix()
+            present.add(path)
+            data = source.read_bytes()
+            digest = hashlib.sha256(data).hexdigest()
+            if known.get(path) == digest:
+                continue
+            _remove(connection, path, touched)
+            _add(connection, path, lesson_num, kind, data.decode('utf-8', errors='replace'), touched)
+            connection.execute('INSERT INTO files VALUES (?, ?)', (path, digest))
+            indexed += 1
+        if lessons is None:
+            for path in set(known) - present:
+                _remove(connection, path, touched)
+        if touched:
+            terms = sorted(touched)
+            for start in range(0, len(terms), SQL_VARIABLES):
+                chunk = terms[start:start + SQL_VARIABLES]
+                marks = ','.join('?' * len(chunk))
+                connection.execute(f'DELETE FROM terms WHERE term IN ({marks})', chunk)
+                connection.execute(f'INSERT INTO terms SELECT term, COUNT(*) FROM postings'
+                                   f' WHERE term IN ({marks}) GROUP BY term', chunk)
+            connection.execute("INSERT OR REPLACE INTO meta SELECT 'passages', COUNT(*) FROM passages")
+            _set_impacts(connection)
+    return indexed
+
+def parse_query(text):
+    """Split a query into groups of (offset, term); a quoted phrase is one group.
+
+    Stopwords are dropped but keep their place in the offsets.
+    """
+    groups = []
+    for match in QUERY_PART.finditer(text):
+        group = [(position, term) for position, term, _, _ in words(match.group(1) or match.group(2))
+                 if term is not None]
+        if group:
+            groups.append(group)
+    return groups
+
+class _Query:
+    """Scores passages for one parsed query; None for a passage that does not match."""
+
+    def __init__(self, connection, groups, idf, kind):
+        self.connection = connection
+        self.terms = sorted(idf)
+        self.phrases = [group for group in groups if len(group) > 1]
+        self.idf = idf
+        self.kind = kind
+        self.marks = ','.join('?' * len(self.terms))
+
+    def scores(self, passages):
+        """{passage: score} for those of `passages` that hold every term."""
+        impacts = {}
+        for passage, term, impact in self.connection.execute(
+                f"SELECT passage, term, impact FROM postings"
+                f" WHERE term IN ({self.marks}) AND passage IN ({','.join('?' * len(passages))})",
+                self.terms + list(passages)):
+            impacts.setdefault(passage, []).append(self.idf[term] * impact)
+        return {passage: sum(found) for passage, found in impacts.items() if len(found) == len(self.terms)}
+
+    def positions(self, passages):
+        """{passage: {term: positions}} for the query's terms."""
+        found = {}
+        for passage, term, blob in self.connection.execute(
+                f"SELECT passage, term, positions FROM postings"
+                f" WHERE term IN ({self.marks}) AND passage IN ({','.join('?' * len(passages))})",
+                self.terms + list(passages)):
+            found.setdefault(passage, {})[term] = array('I', blob)
+        return found
+
+    def phrases_match(self, positions):
+        return all(_phrase_at(positions, group) for group in self.phrases)
+
+def _phrase_at(positions, group):
+    """Whether the group's terms appear at the group's relative offsets."""
+    first_offset, first_term = group[0]
+    following = [(offset - first_offset, set(positions[term])) for offset, term in group[1:]]
+    return any(all(start + delta in found for delta, found in following) for start in positions[first_term])
+
+def _rank_all(query, candidates, parameters, top):
+    """Score every passage the `candidates` SQL selects, reading their postings in one query."""
+    # Positions are only read when there is a phrase to check
+    positions = 'positions' if query.phrases else 'NULL'
+    postings = {}
+    for passage, term, impact, blob in query.connection.execute(
+            f'SELECT passage, term, impact, {positions} FROM postings'
+            f' WHERE term IN ({query.marks}) AND passage IN ({candidates})', query.terms + parameters):
+        postings.setdefault(passage, {})[term] = (impact, blob)
+    scored = []
+    for passage, found in postings.items():
+        if len(found) < len(query.terms):
+            continue
+        if query.phrases and not query.phrases_match({term: array('I', blob) for term, (_, blob) in found.items()}):
+            continue
+        scored.append((sum(query.idf[term] * impact for term, (impact, _) in found.items()), passage))
+    return heapq.nlargest(top, scored)
+
+def _rank_top(query, top):
+    """The best `top` passages, reading each term's postings best impact first.
+
+    This is Fagin's threshold algorithm: a passage not seen yet can score
+    at most the sum of the impacts each list has reached, so reading
+    stops once `top` passages score at least that much.
+    """
+    sql = 'SELECT passage, impact FROM postings WHERE term = ?'
+    if query.kind is not None:
+        sql += ' AND kind = ?'
+    cursors = {term: query.connection.execute(sql + ' ORDER BY impact DESC',
+                                              (term,) if query.kind is None else (term, query.kind))
+               for term in query.terms}
+    reached = {}
+    seen = set()
+    best = []           # min-heap of (score, passage)
+    while True:
+        exhausted = True
+        for term, cursor in cursors.items():
+            rows = cursor.fetchmany(TOP_BATCH)
+            reached[term] = rows[-1][1] if rows else 0.0
+            exhausted = exhausted and not rows
+            new = [passage for passage, _ in rows if passage not in seen]
+            seen.update(new)
+            if not new:
+                continue
+            scores = query.scores(new)
+            if len(best) >= top:
+                scores = {passage: score for passage, score in scores.items() if score > best[0][0]}
+            if query.phrases and scores:
+                positions = query.positions(list(scores))
+                scores = {passage: score for passage, score in scores.items()
+                          if query.phrases_match(positions[passage])}
+            for passage, score in scores.items():
+                if len(best) < top:
+                    heapq.heappush(best, (score, passage))
+                elif score > best[0][0]:
+                    heapq.heapreplace(best, (score, passage))
+        threshold = sum(query.idf[term] * reached[term] for term in query.terms)
+        if exhausted or (len(best) >= top and best[0][0] >= threshold):
+            break
+    return sorted(best, reverse=True)
+
+def search(connection, query, kind=None, lessons=None, top=10):
+    """Passages matching every word and phrase, best first.
+
+    Returns [(score, lesson, kind, title, path, line, snippet)].
+    """
+    groups = parse_query(query)
+    terms = sorted({term for group in groups for _, term in group})
+    if not terms:
+        return []
+    df = dict(connection.execute(f"SELECT term, df FROM terms WHERE term IN ({','.join('?' * len(terms))})", terms))
+    if len(df) < len(terms):
+        return []
+    total = dict(connection.execute('SELECT key, value FROM meta')).get('passages', 0)
+    idf = {term: math.log(1 + (total - df[term] + 0.5) / (df[term] + 0.5)) for term in terms}
+    scorer = _Query(connection, groups, idf, kind)
+
+    rarest = min(terms, key=df.get)
+    if lessons is not None:
+        candidates = f"SELECT id FROM passages WHERE lesson IN ({','.join('?' * len(lessons))})"
+        parameters = list(lessons)
+        if kind is not None:
+            candidates += ' AND kind = ?'
+            parameters.append(kind)
+    elif df[rarest] <= EXHAUSTIVE_LIMIT:
+        candidates = 'SELECT passage FROM postings WHERE term = ?'
+        parameters = [rarest]
+        if kind is not None:
+            candidates += ' AND kind = ?'
+            parameters.append(kind)
+    else:
+        candidates = None
+    if candidates is None:
+        ranked = _rank_top(scorer, top)
+    else:
+        ranked = _rank_all(scorer, candidates, parameters, top)
+
+    results = []
+    for score, passage in ranked:
+        lesson_num, passage_kind, title, path, line, text = connection.execute(
+            'SELECT lesson, kind, title, path, line, text FROM passages WHERE id = ?', (passage,)).fetchone()
+        first = min(scorer.positions([passage])[passage][rarest])
+        results.append((score, lesson_num, passage_kind, title, path, line, snippet(text, first, set(terms))))
+    return results
+
+def _short_math(match):
+    math = match.group(1)
+    return math if len(math) <= SNIPPET_MATH else math[:SNIPPET_MATH - 3] + '...'
+
+def snippet(text, position, terms):
+    """The words around `position`, with the query terms marked."""
+    found = list(words(text))
+    start = max(0, position - SNIPPET_WORDS // 2)
+    window = found[start:start + SNIPPET_WORDS]
+    if not window:
+        return ''
+    begin = window[0][2]
+    pieces = []
+    last = begin
+    for _, term, word_start, word_end in window:
+        pieces.append(text[last:word_start])
+        word = text[word_start:word_end]
+        pieces.append(f"*{word}*" if term in terms else word)
+        last = word_end
+    pieces = [re.sub(f'{MATH_START}([^{MATH_END}]*){MATH_END}?', _short_math, piece) for piece in pieces]
+    prefix = '...' if start > 0 else ''
+    suffix = '...' if start + SNIPPET_WORDS < len(found) else ''
+    return prefix + ''.join(pieces) + suffix
+
+def main():
+    """Update the index or run a query."""
+    parser = argparse.ArgumentParser(description="Search the lesson scripts and LaTeX sources")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('update', help="index the files that changed")
+    query_parser = commands.add_parser('query', help="ranked passages matching all words and phrases")
+    query_parser.add_argument('words', nargs='+', help='words, and phrases in double quotes')
+    query_parser.add_argument('--kind', choices=('script',) + DOCUMENT_KINDS)
+    add_lessons_argument(query_parser)
+    query_parser.add_argument('--top', type=int, default=10, help="hits shown (default: 10)")
+    query_parser.add_argument('--no-update', action='store_true',
+                              help="search the index as it is, without hashing the sources")
+    args = parser.parse_args()
+
+    connection = open_index()
+    start = time.perf_counter()
+    if args.command == 'update' or not args.no_update:
+        indexed = update(connection)
+        if args.command == 'update':
+            print(f"Indexed {indexed} changed files in {(time.perf_counter() - start) * 1000:.1f} ms")
+            connection.close()
+            return 0
+
+    start = time.perf_counter()
+    results = search(connection, ' '.join(args.words), args.kind, args.lessons, args.top)
+    elapsed = time.perf_counter() - start
+    for score, lesson_num, kind, title, path, line, text in results:
+        heading = f" - {title}" if title else ''
+        print(f"{score:6.2f}  lesson {lesson_num} {kind}{heading}")
+        print(f"        {path}:{line}: {text}")
+    print(f"{len(results)} hits in {elapsed * 1000:.1f} ms")
+    connection.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Split a prompt dump (prompts/lessons.txt) into lesson directories
+
+The dump is read line by line in a single pass. `LESSON N:` headers start
+a lesson, and the "Audio Lesson Script", "LaTeX Theory Document" and
+"Practice Problems" headings start its sections. Each section is streamed
+straight into its output file, so memory use does not depend on the size
+of the dump:
+
+    lesson_NN/lesson_script.txt
+    lesson_NN/src/lesson_NN.tex
+    lesson_NN/src/problems_NN.tex
+"""
+
+import argparse
+import os
+import re
+from pathlib import Path
+
+import lesson_paths
+
+# "LESSON 9: ...", "\LESSON 10: ...", "# **Lesson 14: ...**", and headers
+# glued onto the end of the previous lesson's closing line
+LESSON_HEADER = re.compile(r'(?:^|#)[\\#*\s]*LESSON\s+(\d+)\s*:\s*(.+)$', re.IGNORECASE)
+
+SECTION_HEADING = re.compile(
+    r'^[#*\s]*(?:(?:Part|Component)\s+\d+:\s*|\d+\.\s*)?(?:LaTeX\s+)?'
+    r'(Audio Lesson Script|Theory Document|Practice Problems)\b'
+)
+SECTION_KINDS = {
+    'Audio Lesson Script': 'script',
+    'Theory Document': 'theory',
+    'Practice Problems': 'problems',
+}
+
+WORD_COUNT_NOTE = re.compile(r'^\*?\[[^\]]*words\]\*?\s*$')
+FENCE = re.compile(r'^\s*```')
+
+def iter_sections(lines):
+    """Turn the lines of a prompt dump into a stream of section events.
+
+    Yields ('lesson', number, title), ('start', kind), ('line', text) and
+    ('end', kind) tuples. Only the current line is held in memory, apart
+    from the blank and '---' lines at the end of an audio script, which are
+    held back until it is clear more text follows.
+    """
+    lesson = None
+    kind = None          # section being emitted
+    in_latex = False     # inside \documentclass ... \end{document}
+    pending = []         # held-back separator lines of an audio script
+    script_started = False
+
+    def end_section():
+        nonlocal kind, in_latex, script_started
+        if kind is not None:
+            yield ('end', kind)
+        kind = None
+        in_latex = False
+        script_started = False
+        pending.clear()
+
+    for line in lines:
+        text = line.rstrip('\n')
+
+        if in_latex:
+            if FENCE.match(text):
+                yield from end_section()
+                continue
+            end = text.find('\\end{document}')
+            if end >= 0:
+                yield ('line', text[:end + len('\\end{document}')])
+                yield from end_section()
+            else:
+                yield ('line', text)
+            continue
+
+        header = LESSON_HEADER.search(text)
+        if header:
+            yield from end_section()
+            lesson = int(header.group(1))
+            title = re.sub(r'[^\w)\]!?.]+$', '', header.group(2)).strip()
+            yield ('lesson', lesson, title)
+            continue
+
+        heading = SECTION_HEADING.match(text)
+        if heading and lesson is not None:
+            yield from end_section()
+            kind = SECTION_KINDS[heading.group(1)]
+            yield ('start', kind)
+            continue
+
+        if kind == 'script':
+            if WORD_COUNT_NOTE.match(text):
+                continue
+            if not text.strip() or text.strip() == '---':
+                pending.append(text)
+                continue
+            if script_started:
+                for held in pending:
+                    yield ('line', held)
+            pending.clear()
+            script_started = True
+            yield ('line', text)
+        elif kind in ('theory', 'problems'):
+            start = text.find('\\documentclass')
+            if start >= 0:
+                in_latex = True
+                yield ('line', text[start:])
+
+    yield from end_section()
+
+def output_path(out_dir, lesson, kind):
+    """Where a section of a lesson is written."""
+    lesson_dir = Path(out_dir) / f"lesson_{lesson:02d}"
+    if kind == 'script':
+        return lesson_dir / "lesson_script.txt"
+    name = 'lesson' if kind == 'theory' else 'problems'
+    return lesson_dir / "src" / f"{name}_{lesson:02d}.tex"
+
+def split_dump(source, out_dir, force=False, lessons=None):
+    """Stream a prompt dump into lesson directories; return the files written."""
+    written = []
+    lesson = None
+    title = ''
+    target = None
+    tmp_path = None
+    handle = None
+
+    with open(source, 'r', encoding='utf-8') as f:
+        for event in iter_sections(f):
+            if event[0] == 'lesson':
+                _, lesson, title = event
+            elif event[0] == 'start':
+                kind = event[1]
+                target = output_path(out_dir, lesson, kind)
+                if lessons is not None and lesson not in lessons:
+                    continue
+                if target.exists() and not force:
+                    print(f"  Skipping existing {target}")
+                    continue
+                target.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = target.with_name(f".{target.name}.tmp")
+                handle = open(tmp_path, 'w', encoding='utf-8')
+                if kind == 'script':
+                    handle.write(f"Episode {lesson}: {title}\n\n")
+            elif event[0] == 'line':
+                if handle is not None:
+                    handle.write(event[1] + '\n')
+            elif event[0] == 'end' and handle is not None:
+                handle.close()
+                os.replace(tmp_path, target)
+                handle = None
+                written.append(target)
+                print(f"  Created: {target}")
+
+    if handle is not None:
+        handle.close()
+        os.unlink(tmp_path)
+    return written
+
+def main():
+    """Split prompts/lessons.txt into lesson directories."""
+    parser = argparse.ArgumentParser(description="Split a prompt dump into lesson directories")
+    parser.add_argument('source', nargs='?', default=lesson_paths.prompt_dump(),
+                        help="prompt dump to split (default: prompts/lessons.txt)")
+    parser.add_argument('-o', '--output', default=lesson_paths.root(),
+                        help="directory holding the lesson_NN folders (default: repository root)")
+    parser.add_argument('--lessons', type=lesson_paths.parse_lessons, help="only these lessons, e.g. 9-12,15")
+    parser.add_argument('--force', action='store_true', help="overwrite existing files")
+    args = parser.parse_args()
+
+    written = split_dump(args.source, args.output, args.force, args.lessons)
+    print(f"\nWrote {len(written)} files")
+
+if __name__ == "__main__":
+    main()
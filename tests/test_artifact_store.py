@@ -0,0 +1,79 @@
+import os
+
+import pytest
+
+import artifact_store
+import lesson_paths
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store_dir = tmp_path / 'store'
+    monkeypatch.setattr(artifact_store, 'STORE_DIR', store_dir)
+    monkeypatch.setattr(artifact_store, 'OBJECT_DIR', store_dir / 'objects')
+    monkeypatch.setattr(artifact_store, 'HISTORY_DIR', store_dir / 'history')
+    monkeypatch.setenv(lesson_paths.ROOT_ENV, str(tmp_path))
+    return tmp_path
+
+
+def age(digest, seconds=2 * artifact_store.GC_GRACE):
+    path = artifact_store.object_path(digest)
+    stamp = path.stat().st_mtime - seconds
+    os.utime(path, (stamp, stamp))
+
+
+def test_restore_puts_back_the_previous_version(store):
+    tex = store / 'lesson_01.tex'
+    tex.write_text('first')
+    artifact_store.save(tex, 'before fix')
+    tex.write_text('second')
+    artifact_store.save(tex, 'fix')
+
+    artifact_store.restore(tex)
+    assert tex.read_text() == 'first'
+    assert [version['note'] for version in artifact_store.history(tex)][:2] == ['before fix', 'fix']
+    artifact_store.restore(tex)
+    assert tex.read_text() == 'second'
+
+
+def test_restore_refuses_missing_versions(store):
+    tex = store / 'lesson_01.tex'
+    tex.write_text('only')
+    artifact_store.save(tex, 'fix')
+    with pytest.raises(ValueError):
+        artifact_store.restore(tex)
+
+
+def test_gc_trims_histories_and_keeps_referenced_objects(store):
+    tex = store / 'lesson_01.tex'
+    digests = []
+    for text in ('one', 'two', 'three'):
+        tex.write_text(text)
+        digests.append(artifact_store.save(tex, 'fix'))
+        age(digests[-1])
+
+    assert artifact_store.gc(keep=2, dry_run=True) == (1, 3)
+    assert artifact_store.object_path(digests[0]).exists()
+    assert len(artifact_store.history(tex)) == 3
+
+    assert artifact_store.gc(keep=2) == (1, 3)
+    assert not artifact_store.object_path(digests[0]).exists()
+    assert [version['digest'] for version in artifact_store.history(tex)] == digests[1:]
+    with pytest.raises(ValueError):
+        artifact_store.restore(tex, 2)
+
+
+def test_gc_keeps_young_and_hardlinked_objects(store):
+    young = artifact_store.put_bytes(b'just written')
+    published = store / 'lesson_01.pdf'
+    built = store / 'build.pdf'
+    built.write_bytes(b'%PDF')
+    linked = artifact_store.publish(built, published)
+    if published.stat().st_nlink == 1:
+        pytest.skip("the filesystem cloned the PDF instead of hardlinking it")
+    age(linked)
+    (artifact_store.HISTORY_DIR / 'lesson_01.pdf.jsonl').unlink()
+
+    assert artifact_store.gc() == (0, 0)
+    assert artifact_store.object_path(young).exists()
+    assert published.read_bytes() == b'%PDF'
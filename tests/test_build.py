@@ -0,0 +1,39 @@
+import os
+
+import build
+import file_watch
+import lesson_paths
+
+
+def names(documents):
+    return [doc.name for doc in documents]
+
+
+def test_changed_files_map_to_the_documents_they_feed(tmp_path, monkeypatch):
+    monkeypatch.setenv(lesson_paths.ROOT_ENV, str(tmp_path))
+    src = lesson_paths.tex_path(9).parent
+    assert names(build.affected_documents(src / 'problems_09.tex', [9])) == ['problems_09']
+    assert names(build.affected_documents(src / 'figure.sty', [9])) == ['lesson_09', 'problems_09']
+    assert names(build.affected_documents(lesson_paths.raw_source(21), [9, 21])) == ['lesson_21', 'problems_21']
+    assert build.affected_documents(src / 'lesson_09.tex', [10]) == []
+
+
+def test_an_overflowed_directory_rebuilds_everything_it_holds(tmp_path, monkeypatch):
+    monkeypatch.setenv(lesson_paths.ROOT_ENV, str(tmp_path))
+    lesson_paths.raw_dir().mkdir()
+    lesson_paths.raw_source(21).write_text('Lesson 21', encoding='utf-8')
+    assert names(build.affected_documents(lesson_paths.tex_path(9).parent, [9])) == ['lesson_09', 'problems_09']
+    assert names(build.affected_documents(lesson_paths.raw_dir(), [9, 21])) == ['lesson_21', 'problems_21']
+
+
+def test_inotify_overflow_reports_the_watched_directories(tmp_path):
+    read_end, write_end = os.pipe()
+    watcher = file_watch.InotifyWatcher.__new__(file_watch.InotifyWatcher)
+    watcher.fd = read_end
+    watcher.directories = {1: tmp_path / 'a', 2: tmp_path / 'b'}
+    os.write(write_end, file_watch.EVENT_HEADER.pack(-1, file_watch.IN_Q_OVERFLOW, 0, 0))
+    try:
+        assert watcher.wait(1) == {tmp_path / 'a', tmp_path / 'b'}
+    finally:
+        os.close(read_end)
+        os.close(write_end)
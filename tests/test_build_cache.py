@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+import build_cache
+
+
+@pytest.fixture
+def lesson(tmp_path, monkeypatch):
+    monkeypatch.setattr(build_cache, 'CACHE_DIR', tmp_path / 'cache')
+    monkeypatch.setattr(build_cache, '_toolchain_version', 'pdfTeX 3.14')
+    src = tmp_path / 'lesson_01' / 'src'
+    src.mkdir(parents=True)
+    tex = src / 'lesson_01.tex'
+    tex.write_text('\\documentclass{article}\n\\input{macros}\n\\begin{document}x\\end{document}\n')
+    (src / 'macros.tex').write_text('\\newcommand{\\RR}{\\mathbb{R}}\n')
+    (tmp_path / 'lesson_01' / 'lesson_01.pdf').write_bytes(b'%PDF-1.5 built')
+    build_cache.record_build(tex)
+    return tex
+
+
+def test_recorded_build_is_up_to_date_until_the_source_changes(lesson):
+    assert build_cache.is_up_to_date(lesson)
+    lesson.write_text(lesson.read_text() + '% edit\n')
+    assert not build_cache.is_up_to_date(lesson)
+
+
+def test_timestamps_alone_do_not_make_a_build_stale(lesson):
+    os.utime(lesson, (0, 0))
+    assert build_cache.is_up_to_date(lesson)
+
+
+def test_changed_input_file_makes_the_build_stale(lesson):
+    (lesson.parent / 'macros.tex').write_text('\\newcommand{\\RR}{\\mathbf{R}}\n')
+    assert not build_cache.is_up_to_date(lesson)
+
+
+def test_replaced_or_missing_pdf_makes_the_build_stale(lesson):
+    pdf = build_cache.default_pdf_path(lesson)
+    pdf.write_bytes(b'%PDF-1.5 something else')
+    assert not build_cache.is_up_to_date(lesson)
+    pdf.unlink()
+    assert not build_cache.is_up_to_date(lesson)
+
+
+def test_new_toolchain_makes_the_build_stale(lesson, monkeypatch):
+    monkeypatch.setattr(build_cache, '_toolchain_version', 'pdfTeX 3.141592653')
+    assert not build_cache.is_up_to_date(lesson)
+
+
+def test_clear_forgets_recorded_builds(lesson):
+    build_cache.clear()
+    assert not build_cache.is_up_to_date(lesson)
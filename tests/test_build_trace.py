@@ -0,0 +1,16 @@
+from build_trace import lesson_of, summarize
+
+
+def test_events_group_by_lesson_and_skip_figure_builds():
+    events = [
+        {'stage': 'pdflatex', 'seconds': 2.0, 'tex': 'lesson_32/src/lesson_32.tex'},
+        {'stage': 'pdflatex', 'seconds': 1.0, 'tex': 'lesson_32/src/problems_32.tex'},
+        {'stage': 'extract', 'seconds': 0.5, 'source': 'Lessons 19 and more/32.txt'},
+        {'stage': 'pdflatex', 'seconds': 4.0, 'tex': '.build_cache/figures/build/cfb5278ae6d6e906df1de9d8.tex'},
+        {'stage': 'fix', 'seconds': 0.25, 'rule': 'translate_unicode', 'path': 'lesson_07/src/lesson_07.tex'},
+    ]
+    stages, lessons, rules = summarize(events)
+    assert stages['pdflatex'] == [3, 7.0, 4.0]
+    assert lessons == {'lesson_32': 3.5, 'lesson_07': 0.25}
+    assert rules == {'translate_unicode': 0.25}
+    assert lesson_of({'tex': 'course_notes.tex'}) == 'course_notes'
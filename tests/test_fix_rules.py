@@ -0,0 +1,48 @@
+from fix_rules import PROFILES, apply_rules
+
+DOCUMENT = ('\\documentclass{article}\n\\usepackage{amsmath}\n\\begin{document}\n'
+            '{body}\n\\end{document}\n')
+
+
+def cleanup(body):
+    content, _ = apply_rules(DOCUMENT.replace('{body}', body), PROFILES['cleanup'],
+                             {'path': 'lesson_25.tex', 'lesson_num': 25})
+    return content.split('\\begin{document}\n')[1].split('\n\\end{document}')[0]
+
+
+def test_cleanup_keeps_translated_scripts_in_math():
+    assert cleanup('Right angles (90°), x² and y₀.') == \
+        'Right angles (90$^{\\circ}$), $x^{2}$ and $y_{0}$.'
+    assert cleanup('So $x² + y₀ = 45°$.') == 'So $x^{2} + y_{0} = 45^{\\circ}$.'
+
+
+def test_cleanup_keeps_authored_text_scripts_in_math():
+    assert cleanup('At 90$^{\\circ}$ and q$_{0}$.') == 'At 90$^{\\circ}$ and q$_{0}$.'
+
+
+def test_enhance_profiles_fill_in_the_lesson_metadata():
+    theory, _ = apply_rules('\\documentclass{article}\n\\title{Bernoulli Equations}\n\\author{}\n'
+                            '\\begin{document}\n\\end{document}\n', PROFILES['enhance_theory'],
+                            {'lesson_num': 31})
+    assert '\\title{ODE Lesson 31: Bernoulli Equations}' in theory
+    assert '\\author{ODE 1 - Prof. Adi Ditkowski}' in theory
+    assert '\\newmdenv[linecolor=green,linewidth=2pt]{insight}\n\n\\begin{document}' in theory
+    problems, _ = apply_rules('\\title{Problems}\n\\begin{document}\n\\end{document}\n',
+                              PROFILES['enhance_problems'], {'lesson_num': 31})
+    assert problems.startswith('\\title{Practice Problems: Lesson 31}')
+
+
+def test_fix_file_writes_once_and_records_both_versions(tmp_path, monkeypatch):
+    import artifact_store
+    from fix_rules import fix_file
+    monkeypatch.setattr(artifact_store, 'OBJECT_DIR', tmp_path / 'store' / 'objects')
+    monkeypatch.setattr(artifact_store, 'HISTORY_DIR', tmp_path / 'store' / 'history')
+    tex = tmp_path / 'lesson_31.tex'
+    tex.write_text('\\begin{document}\nx ∈ A\n', encoding='utf-8')
+    assert fix_file(tex, ['translate_unicode', 'ensure_end_document'], dry_run=True)[0]
+    assert tex.read_text(encoding='utf-8') == '\\begin{document}\nx ∈ A\n'
+    changed, hits = fix_file(tex, ['translate_unicode', 'ensure_end_document'])
+    assert changed and hits == {'translate_unicode': 1, 'ensure_end_document': 1}
+    assert tex.read_text(encoding='utf-8') == '\\begin{document}\nx $\\in$ A\n\n\\end{document}'
+    assert [version['note'] for version in artifact_store.history(tex)] == ['before fix', 'fix']
+    assert fix_file(tex, ['translate_unicode', 'ensure_end_document']) == (False, {})
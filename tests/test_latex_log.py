@@ -0,0 +1,49 @@
+from latex_log import fix_errors, parse_log
+
+DOCUMENT = '\\documentclass{article}\n\\usepackage{amsmath, nicematrix}\n\\begin{document}\n{body}\n'
+
+
+def fix(body, log):
+    return fix_errors(DOCUMENT.replace('{body}', body), parse_log(log), 'lesson_32.tex')
+
+
+def test_parse_log_reads_the_offending_token():
+    errors = parse_log('./lesson_32.tex:4: Undefined control sequence.\nl.4 Let $x \\in \\RR\n                 $.\n')
+    assert [(error.kind, error.file, error.line, error.token) for error in errors] == [
+        ('undefined_control_sequence', './lesson_32.tex', 4, '\\RR')]
+
+
+def test_undefined_shortcut_is_replaced_on_its_line():
+    content, applied = fix('Let $x \\in \\RR$.', './lesson_32.tex:4: Undefined control sequence.\nl.4 Let $x \\in \\RR\n')
+    assert 'Let $x \\in \\mathbb{R}$.' in content
+    assert applied == ['line 4: \\RR -> \\mathbb{R}']
+
+
+def test_undefined_package_command_loads_its_package_before_the_document():
+    content, applied = fix('\\mathbb{Z}', './lesson_32.tex:4: Undefined control sequence.\nl.4 \\mathbb\n')
+    assert content.index('\\usepackage{amssymb}') < content.index('\\begin{document}')
+    assert applied == ['line 4: loaded amssymb for \\mathbb']
+
+
+def test_missing_dollar_wraps_the_word_or_strips_dollars_in_display_math():
+    content, _ = fix('The value x_0 is small.', './lesson_32.tex:4: Missing $ inserted.\nl.4 The value x_\n')
+    assert 'The value $x_0$ is small.' in content
+    content, _ = fix('\\begin{align}\na &= $b$\n\\end{align}', './lesson_32.tex:5: Missing $ inserted.\nl.5 a &= $\n')
+    assert 'a &= b\n' in content
+
+
+def test_unavailable_package_is_removed_from_its_usepackage_list():
+    content, applied = fix('x', "! LaTeX Error: File `nicematrix.sty' not found.\n")
+    assert '\\usepackage{amsmath}\n' in content
+    assert applied == ['line 2: removed unavailable package nicematrix']
+
+
+def test_emergency_stop_appends_end_document():
+    content, applied = fix('x', '! Emergency stop.\n')
+    assert content.rstrip().endswith('\\end{document}')
+    assert applied == ['added \\end{document}']
+
+
+def test_errors_in_other_files_are_ignored():
+    content, applied = fix('\\QQ', './other.tex:4: Undefined control sequence.\nl.4 \\QQ\n')
+    assert '\\QQ' in content and applied == []
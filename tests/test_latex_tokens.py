@@ -0,0 +1,39 @@
+from fix_rules import apply_rules
+from latex_tokens import map_text, tokenize
+
+PICTURE = ('Slopes:\n\\begin{tikzpicture}\n\\begin{axis}\n'
+           '\\edef\\norm{sqrt(1+(\\slope)^2)}\n\\addplot {x^2};\n'
+           '\\end{axis}\n\\end{tikzpicture}\nand x^2 after.')
+
+
+def kinds(content):
+    return [(token.kind, content[token.start:token.end]) for token in tokenize(content)]
+
+
+def test_tokens_cover_the_document():
+    content = 'Text $a_1$ and \\[ b \\] % note\n\\begin{itemize}\\item x\\end{itemize}'
+    assert ''.join(text for _, text in kinds(content)) == content
+    assert kinds(content)[:4] == [('text', 'Text '), ('inline_math', '$a_1$'), ('text', ' and '),
+                                  ('display_math', '\\[ b \\]')]
+
+
+def test_inline_math_ends_at_a_paragraph_break():
+    content = 'A stray $ sign\n\nx^2 here'
+    assert kinds(content)[1] == ('inline_math', '$ sign')
+    assert kinds(content)[-1] == ('text', '\n\nx^2 here')
+
+
+def test_picture_bodies_are_one_opaque_token():
+    picture = PICTURE[PICTURE.index('\\begin{tikzpicture}'):PICTURE.index('\nand')]
+    assert ('env', picture) in kinds(PICTURE)
+
+
+def test_text_rules_leave_picture_code_alone():
+    content, hits = apply_rules(PICTURE, ['wrap_bare_scripts'])
+    assert content == PICTURE.replace('and x^2 after', 'and x$^{2}$ after')
+    assert hits['wrap_bare_scripts'] == 1
+
+
+def test_map_text_skips_math_and_comments():
+    content, hits = map_text('a $a$ % a\na', lambda text: (text.replace('a', 'b'), text.count('a')))
+    assert (content, hits) == ('b $a$ % a\nb', 2)
@@ -0,0 +1,30 @@
+from latex_unicode import translate
+
+
+def test_symbols_in_text_are_wrapped_in_math():
+    assert translate('x ∈ ℝ and Poincaré')[0] == r"x $\in$ $\mathbb{R}$ and Poincar\'e"
+
+
+def test_dual_mode_symbols_take_their_math_form_in_math():
+    assert translate('$x ✗ y$')[0] == r'$x \times y$'
+    assert translate('✗ wrong')[0] == r'$\times$ wrong'
+    assert translate(r'\[ a • b \]')[0] == r'\[ a \bullet b \]'
+
+
+def test_text_only_pieces_in_math_are_wrapped_in_text():
+    assert translate('$é = 1$')[0] == r"$\text{\'e} = 1$"
+    assert translate(r'\begin{equation} ßé \end{equation}')[0] == \
+        r"\begin{equation} \text{\ss{}\'e} \end{equation}"
+    assert translate('$f’(x)$')[0] == "$f'(x)$"
+
+
+def test_a_stray_dollar_does_not_flip_later_paragraphs():
+    content = 'Simplify: $x^{2} + y^{2} = K\n\nRotated by 45°, and $a$ ↔ $b$.'
+    assert translate(content)[0] == \
+        'Simplify: $x^{2} + y^{2} = K\n\nRotated by 45$^{\\circ}$, and $a$ $\\leftrightarrow$ $b$.'
+
+
+def test_comments_are_left_alone_and_positions_reported():
+    translated, unmapped = translate('% α\nx ☃ y')
+    assert translated == '% α\nx ☃ y'
+    assert unmapped == [(2, 3, '☃')]
@@ -0,0 +1,34 @@
+from lint_latex import lint
+
+DOCUMENT = '\\documentclass{article}\n\\usepackage{amsmath}\n\\begin{document}\n{body}\n\\end{document}\n'
+
+
+def issues(body):
+    return [(issue.line, issue.column, issue.kind) for issue in lint(DOCUMENT.replace('{body}', body))]
+
+
+def test_a_clean_document_has_no_issues():
+    assert issues('Text with $x^2$, \\[ y \\] and \\textbf{bold $z$}.') == []
+
+
+def test_inline_math_left_open_at_a_paragraph_break():
+    assert issues('Open $x\n\nnext') == [(4, 6, 'unclosed_math')]
+
+
+def test_dollars_inside_align():
+    assert issues('\\begin{align} a $b$ \\end{align}') == [(4, 17, 'dollar_in_display'), (4, 19, 'dollar_in_display')]
+
+
+def test_unbalanced_braces_and_environments():
+    assert issues('{unclosed') == [(4, 1, 'unbalanced_brace')]
+    assert issues('x}') == [(4, 2, 'unbalanced_brace')]
+    assert issues('\\begin{itemize}\n\\item a') == [(4, 1, 'unmatched_environment')]
+
+
+def test_missing_package_and_document_structure():
+    assert issues('\\mathbb{R}') == [(4, 1, 'missing_package')]
+    assert [issue.kind for issue in lint('\\documentclass{article}\nx')] == ['document_structure']
+
+
+def test_verbatim_bodies_are_skipped_whole():
+    assert issues('\\begin{verbatim}\n{ $ \\end{itemize}\n\\end{verbatim}\n{') == [(7, 1, 'unbalanced_brace')]
@@ -0,0 +1,10 @@
+from preamble_format import split_head
+
+
+def test_head_stops_at_a_package_line_running_into_the_document():
+    content = ('\\documentclass{article}\n'
+               '\\usepackage[margin=1in]{geometry} % page size\n'
+               '\\usepackage{graphicx}\\begin{document}\n'
+               'Text\n'
+               '\\end{document}\n')
+    assert split_head(content) == ('\\documentclass{article}\n\\usepackage[margin=1in]{geometry} % page size\n', 2)
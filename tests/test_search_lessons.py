@@ -0,0 +1,43 @@
+import search_lessons
+
+LESSON = r"""\documentclass{article}
+\title{Lesson 50: Numerical Methods}
+\begin{document}
+\section*{Part B: Runge-Kutta Methods}
+Use the classical scheme with step $h$.
+\section*{Part C: Improved Euler}
+Heun's method averages two slopes.
+\end{document}
+"""
+
+def _index(tmp_path, monkeypatch):
+    monkeypatch.setenv('ODE_LESSONS_ROOT', str(tmp_path))
+    src = tmp_path / 'lesson_50' / 'src'
+    src.mkdir(parents=True)
+    (src / 'problems_50.tex').write_text(LESSON, encoding='utf-8')
+    (tmp_path / 'Lessons 19 and more').mkdir()
+    connection = search_lessons.open_index(tmp_path / 'search.sqlite')
+    search_lessons.update(connection)
+    return connection, src / 'problems_50.tex'
+
+def test_reindexing_the_last_file_scores_its_postings(tmp_path, monkeypatch):
+    connection, tex = _index(tmp_path, monkeypatch)
+    tex.write_text(LESSON + '%\n', encoding='utf-8')
+    assert search_lessons.update(connection) == 1
+    assert connection.execute('SELECT COUNT(*) FROM postings WHERE impact IS NULL').fetchone()[0] == 0
+    hits = search_lessons.search(connection, 'heun')
+    assert [hit[3] for hit in hits] == ['Part C: Improved Euler']
+
+def test_heading_words_are_indexed(tmp_path, monkeypatch):
+    connection, _ = _index(tmp_path, monkeypatch)
+    hits = search_lessons.search(connection, 'runge', kind='problems')
+    assert [hit[3] for hit in hits] == ['Part B: Runge-Kutta Methods']
+
+
+def test_script_headings_become_passage_titles():
+    script = ('Episode 9: Direction Fields and Isoclines\n\nHey there! Arrows everywhere.\n\n'
+              '**Why Not Always Use This Method?**\n\nBecause it is slow.\n')
+    assert search_lessons.script_passages(script) == [
+        ('Episode 9: Direction Fields and Isoclines', 3, 'Hey there! Arrows everywhere.'),
+        ('Why Not Always Use This Method?', 7, 'Because it is slow.'),
+    ]
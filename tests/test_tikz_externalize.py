@@ -0,0 +1,42 @@
+import subprocess
+
+import compile_stage
+import tikz_externalize
+from compile_stage import CompileResult
+
+TEX_ERROR = './figure.tex:3: Undefined control sequence.\nl.3 \\drw\n'
+
+
+def build(tmp_path, monkeypatch, outcome):
+    monkeypatch.setattr(tikz_externalize, 'FIGURE_DIR', tmp_path / 'figures')
+    monkeypatch.setenv(compile_stage.BUILD_DIR_ENV, str(tmp_path / 'build'))
+
+    def run_pdflatex(tex, **options):
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(compile_stage, 'run_pdflatex', run_pdflatex)
+    return tikz_externalize.build_figure('0123456789abcdef01234567', 'document')
+
+
+def test_a_tex_error_is_remembered(tmp_path, monkeypatch):
+    assert build(tmp_path, monkeypatch, CompileResult(False, TEX_ERROR, 1)) is None
+    marker = tmp_path / 'figures' / '0123456789abcdef01234567.failed'
+    assert marker.read_text(encoding='utf-8') == 'Undefined control sequence.\n'
+
+
+def test_timeouts_and_crashes_are_tried_again(tmp_path, monkeypatch):
+    assert build(tmp_path, monkeypatch, subprocess.TimeoutExpired('pdflatex', 120)) is None
+    assert build(tmp_path, monkeypatch, CompileResult(False, 'Killed\n', 1)) is None
+    assert not (tmp_path / 'figures' / '0123456789abcdef01234567.failed').exists()
+
+
+def figure_jobs(lesson_num):
+    return tikz_externalize.FIGURE_JOBS
+
+
+def test_lesson_workers_share_the_jobs_with_their_figures():
+    assert [result for _, result, _ in compile_stage.run_lessons(figure_jobs, [1, 2], jobs=4)] == [2, 2]
+    assert [result for _, result, _ in compile_stage.run_lessons(figure_jobs, [1, 2], jobs=1)] == [1, 1]
+    assert tikz_externalize.FIGURE_JOBS is None
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Externalized TikZ/pgfplots figures cached by their source
+
+Every tikzpicture in a document is compiled once on its own and cached
+under .build_cache/figures as <hash>.pdf, keyed by the document preamble,
+the picture source and the TeX toolchain. The document is then compiled
+with each picture replaced by \\includegraphics of its cached PDF, so
+editing prose never re-renders a figure and pgfplots sampling only runs
+when a figure changes. Missing figures are compiled in parallel.
+
+A figure is compiled with the document's own preamble plus the preview
+package, so fonts and macros match the inline rendering. The replacement
+is padded with comment lines to keep the document's line numbers.
+
+Usage:
+    tikz_externalize.py TEX...    build the figures these documents use
+"""
+
+import argparse
+import fcntl
+import hashlib
+import os
+import re
+import sys
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import compile_stage
+from build_cache import CACHE_DIR, find_inputs, toolchain_version
+from latex_log import first_error, parse_log
+from latex_tokens import tokenize
+from lint_latex import loaded_packages
+
+FIGURE_DIR = CACHE_DIR / 'figures'
+
+# Figures externalize() builds at once when not told otherwise; lesson
+# workers get their share of --jobs, so figures never multiply the pool
+FIGURE_JOBS = None
+
+FIGURE_PATTERN = re.compile(r'\\begin\{tikzpicture\}.*?\\end\{tikzpicture\}', re.DOTALL)
+
+# Crops each page of the figure document to the picture
+PREVIEW_SETUP = '\\usepackage[active,tightpage]{preview}\n\\PreviewEnvironment{tikzpicture}\n'
+
+def find_figures(content):
+    """Spans of the tikzpictures in a document body, skipping commented-out ones."""
+    begin = content.find('\\begin{document}')
+    if begin < 0:
+        return []
+    comments = [(t.start, t.end) for t in tokenize(content) if t.kind == 'comment']
+    spans = []
+    for match in FIGURE_PATTERN.finditer(content, begin):
+        if any(start <= match.start() < end for start, end in comments):
+            continue
+        spans.append((match.start(), match.end()))
+    return spans
+
+def figure_key(preamble, source):
+    """Cache key of a figure compiled with a preamble."""
+    digest = hashlib.sha256()
+    digest.update(toolchain_version().encode('utf-8'))
+    digest.update(b'\0' + preamble.encode('utf-8'))
+    digest.update(b'\0' + source.encode('utf-8'))
+    return digest.hexdigest()[:24]
+
+def figure_document(preamble, source):
+    """Standalone document rendering a single figure."""
+    return f"{preamble}{PREVIEW_SETUP}\\begin{{document}}\n{source}\n\\end{{document}}\n"
+
+def build_figure(key, document, timeout=120):
+    """Compile a figure document into the cache; return its PDF path or None."""
+    pdf = FIGURE_DIR / f"{key}.pdf"
+    failed_marker = FIGURE_DIR / f"{key}.failed"
+    if pdf.exists():
+        return pdf
+    if failed_marker.exists():
+        return None
+
+    work_dir = FIGURE_DIR / 'build'
+    work_dir.mkdir(parents=True, exist_ok=True)
+    with open(FIGURE_DIR / f"{key}.lock", 'w') as lock:
+        # Threads and processes needing the same figure wait here while the
+        # first one compiles it, so they never share its build files
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if pdf.exists():
+            return pdf
+        if failed_marker.exists():
+            return None
+
+        tex = work_dir / f"{key}.tex"
+        tex.write_text(document, encoding='utf-8')
+        try:
+            result = compile_stage.run_pdflatex(tex, timeout=timeout, local=True, externalize=False,
+                                                note_passes=False, pdf_path=pdf)
+            if result.ok:
+                return pdf
+            # Only a TeX error is remembered; a run that died without one
+            # (killed, out of memory) is tried again next time
+            error = first_error(parse_log(result.log))
+            if error is not None:
+                failed_marker.write_text(f"{error.message}\n", encoding='utf-8')
+            return None
+        except Exception:
+            # A timeout or a missing pdflatex; the figure is tried again next time
+            return None
+        finally:
+            for directory in (work_dir, compile_stage.build_dir_for(tex)):
+                for leftover in directory.glob(f"{key}.*"):
+                    leftover.unlink(missing_ok=True)
+
+def externalize(tex_path, content, jobs=None):
+    """Replace the document's figures with their cached PDFs.
+
+    Returns (content, stats) where stats counts 'cached', 'built' and
+    'failed' figures. A figure that fails to compile stays inline, so the
+    document compile reports its error.
+    """
+    stats = Counter()
+    spans = find_figures(content)
+    if not spans:
+        return content, stats
+
+    begin = content.find('\\begin{document}')
+    preamble = content[:begin]
+    # Figures are compiled elsewhere, so local inputs would not be found
+    if find_inputs(tex_path, preamble):
+        return content, stats
+
+    figures = []
+    for start, end in spans:
+        source = content[start:end]
+        key = figure_key(preamble, source)
+        figures.append((start, end, key, source))
+
+    missing = {key: source for _, _, key, source in figures if not (FIGURE_DIR / f"{key}.pdf").exists()}
+    stats['cached'] = len(figures) - sum(1 for _, _, key, _ in figures if key in missing)
+    if missing:
+        FIGURE_DIR.mkdir(parents=True, exist_ok=True)
+        workers = min(jobs or FIGURE_JOBS or compile_stage.default_jobs(), len(missing))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            built = dict(zip(missing, executor.map(
+                lambda key: build_figure(key, figure_document(preamble, missing[key])), missing)))
+    else:
+        built = {}
+
+    pieces = []
+    last = 0
+    tex_dir = Path(tex_path).resolve().parent
+    for start, end, key, source in figures:
+        pdf = FIGURE_DIR / f"{key}.pdf"
+        if key in built:
+            stats['built' if built[key] else 'failed'] += 1
+        if not pdf.exists():
+            continue
+        relative = os.path.relpath(pdf, tex_dir).replace(os.sep, '/')
+        # One comment-terminated line per line of the picture keeps line numbers
+        replacement = f"\\includegraphics{{{relative}}}" + '%\n' * source.count('\n')
+        pieces.append(content[last:start])
+        pieces.append(replacement)
+        last = end
+    if not pieces:
+        return content, stats
+    pieces.append(content[last:])
+    content = ''.join(pieces)
+
+    if 'graphicx' not in loaded_packages(preamble):
+        # Same line as \begin{document}, so no line moves
+        content = content.replace('\\begin{document}', '\\usepackage{graphicx}\\begin{document}', 1)
+    return content, stats
+
+def main():
+    """Build and report the figures of the given documents."""
+    parser = argparse.ArgumentParser(description="Externalize TikZ figures into the figure cache")
+    parser.add_argument('tex', nargs='+', help="documents whose figures to build")
+    compile_stage.add_jobs_argument(parser)
+    args = parser.parse_args()
+
+    failed = 0
+    for tex in args.tex:
+        content = Path(tex).read_text(encoding='utf-8')
+        _, stats = externalize(tex, content, args.jobs)
+        failed += stats['failed']
+        print(f"{tex}: {stats['cached']} cached, {stats['built']} built, {stats['failed']} failed")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
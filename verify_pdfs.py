@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Check that the lesson PDFs are complete, without external tools
+
+A PDF left by a killed or timed-out pdflatex run can exist and still be
+useless: zero bytes, cut off before its trailer, or with a cross-reference
+table pointing past the end of the file. Each PDF is memory-mapped and
+checked from both ends:
+
+- the %PDF- header,
+- %%EOF and the startxref offset at the end,
+- every cross-reference section (classic tables and the compressed
+  streams pdfTeX writes, following /Prev), each in-use entry of which
+  must point at its "N G obj" header,
+- the page count, read from the catalog's page tree.
+
+Only the few objects on the way to the page count are parsed, so the
+whole tree is checked in milliseconds. Documents with fewer pages than
+--min-pages are reported as suspiciously short.
+
+Usage:
+    verify_pdfs.py [--lessons SPEC] [--min-pages N] [PDF...]
+"""
+
+import argparse
+import mmap
+import re
+import sys
+import time
+import zlib
+from collections import namedtuple
+from pathlib import Path
+
+import lesson_paths
+from lesson_paths import DOCUMENT_KINDS, add_lessons_argument
+
+# error: why the PDF is unusable, or None; warning: why it looks wrong
+PdfCheck = namedtuple('PdfCheck', ['path', 'pages', 'size', 'error', 'warning'])
+
+MIN_PAGES = 2
+
+# How far from either end the header and trailer may be
+HEADER_WINDOW = 1024
+TRAILER_WINDOW = 1024
+
+STARTXREF = re.compile(rb'startxref\s+(\d+)\s+%%EOF')
+OBJECT_HEADER = re.compile(rb'\s*(\d+)\s+(\d+)\s+obj\b')
+XREF_SUBSECTION = re.compile(rb'\s*(\d+)\s+(\d+)\s*[\r\n]')
+XREF_ENTRY = re.compile(rb'(\d{10}) (\d{5}) ([nf])')
+STREAM_START = re.compile(rb'\s*stream\r?\n')
+REFERENCE = rb'\s+(\d+)\s+\d+\s+R'
+
+def _key(dictionary, name, pattern=rb'(\d+)'):
+    match = re.search(rb'/' + name + rb'\b\s*' + pattern, dictionary)
+    return match.group(1) if match else None
+
+def _numbers(dictionary, name):
+    match = re.search(rb'/' + name + rb'\s*\[([^\]]*)\]', dictionary)
+    return [int(n) for n in match.group(1).split()] if match else None
+
+def _dictionary(data, start):
+    """The <<...>> dictionary beginning at or after `start`, and the offset after it."""
+    begin = data.find(b'<<', start, start + 64)
+    if begin < 0:
+        raise ValueError(f"no dictionary at offset {start}")
+    depth = 0
+    position = begin
+    for match in re.finditer(rb'<<|>>', data[begin:begin + 256 * 1024]):
+        depth += 1 if match.group() == b'<<' else -1
+        if depth == 0:
+            position = begin + match.end()
+            return bytes(data[begin:position]), position
+    raise ValueError(f"unterminated dictionary at offset {begin}")
+
+def _decode(dictionary, raw):
+    """Undo the stream's FlateDecode filter and PNG predictor."""
+    if b'/FlateDecode' in dictionary:
+        raw = zlib.decompress(raw)
+    elif b'/Filter' in dictionary:
+        raise ValueError("unsupported stream filter")
+    predictor = int(_key(dictionary, b'Predictor') or 1)
+    if predictor < 10:
+        return raw
+    columns = int(_key(dictionary, b'Columns') or 1)
+    rows = []
+    previous = bytearray(columns)
+    for offset in range(0, len(raw), columns + 1):
+        kind, row = raw[offset], bytearray(raw[offset + 1:offset + 1 + columns])
+        if kind == 2:
+            for i in range(len(row)):
+                row[i] = (row[i] + previous[i]) & 0xFF
+        elif kind != 0:
+            raise ValueError(f"unsupported PNG predictor {kind}")
+        rows.append(bytes(row))
+        previous = row
+    return b''.join(rows)
+
+class PdfFile:
+    """A memory-mapped PDF, read through its cross-reference sections."""
+
+    def __init__(self, data):
+        self.data = data
+        self.size = len(data)
+        self.offsets = {}       # object number -> file offset
+        self.compressed = {}    # object number -> (object stream number, index)
+        self.trailer = None
+        self._object_streams = {}
+
+    def object_header(self, offset, number=None):
+        """Offset just past the "N G obj" header at `offset`."""
+        match = OBJECT_HEADER.match(self.data, offset) if offset < self.size else None
+        if match is None:
+            raise ValueError(f"no object at offset {offset}")
+        if number is not None and int(match.group(1)) != number:
+            raise ValueError(f"object {number} is not at offset {offset}")
+        return match.end()
+
+    def stream(self, dictionary, start):
+        """Decoded contents of the stream whose dictionary ends at `start`."""
+        match = STREAM_START.match(self.data, start)
+        if match is None:
+            raise ValueError(f"no stream at offset {start}")
+        length = _key(dictionary, b'Length', rb'(\d+)(\s+\d+\s+R)?')
+        if length is None or re.search(rb'/Length' + REFERENCE, dictionary):
+            end = self.data.find(b'endstream', match.end())
+        else:
+            end = match.end() + int(length)
+        if end < 0 or end > self.size:
+            raise ValueError("stream runs past the end of the file")
+        return _decode(dictionary, self.data[match.end():end])
+
+    def read_xref(self, offset):
+        """Read the cross-reference sections from `offset` back through /Prev."""
+        seen = set()
+        while offset is not None:
+            if offset in seen or offset >= self.size:
+                raise ValueError(f"bad cross-reference offset {offset}")
+            seen.add(offset)
+            if self.data[offset:offset + 4] == b'xref':
+                trailer = self._read_table(offset + 4)
+            else:
+                trailer = self._read_stream(offset)
+            # The newest section comes first and wins
+            if self.trailer is None:
+                self.trailer = trailer
+            prev = _key(trailer, b'Prev')
+            offset = int(prev) if prev is not None else None
+
+    def _add(self, number, kind, first, second):
+        if number in self.offsets or number in self.compressed:
+            return
+        if kind == 1:
+            self.offsets[number] = first
+        elif kind == 2:
+            self.compressed[number] = (first, second)
+
+    def _read_table(self, position):
+        while True:
+            match = XREF_SUBSECTION.match(self.data, position)
+            if match is None:
+                break
+            first, count = int(match.group(1)), int(match.group(2))
+            position = match.end()
+            for number in range(first, first + count):
+                # Entries are 20 bytes; leading whitespace of the first is tolerated
+                while self.data[position:position + 1] in (b' ', b'\r', b'\n'):
+                    position += 1
+                entry = XREF_ENTRY.match(self.data, position)
+                if entry is None:
+                    raise ValueError(f"bad cross-reference entry for object {number}")
+                if entry.group(3) == b'n':
+                    self._add(number, 1, int(entry.group(1)), 0)
+                position += 20
+        start = self.data.find(b'trailer', position, position + 64)
+        if start < 0:
+            raise ValueError("no trailer after the cross-reference table")
+        trailer, _ = _dictionary(self.data, start + 7)
+        return trailer
+
+    def _read_stream(self, offset):
+        dictionary, end = _dictionary(self.data, self.object_header(offset))
+        if not re.search(rb'/Type\s*/XRef\b', dictionary):
+            raise ValueError(f"no cross-reference at offset {offset}")
+        widths = _numbers(dictionary, b'W')
+        size = int(_key(dictionary, b'Size') or 0)
+        index = _numbers(dictionary, b'Index') or [0, size]
+        if not widths or len(widths) != 3:
+            raise ValueError("bad /W in cross-reference stream")
+        rows = self.stream(dictionary, end)
+        width = sum(widths)
+        position = 0
+        for first, count in zip(index[::2], index[1::2]):
+            for number in range(first, first + count):
+                row = rows[position:position + width]
+                if len(row) < width:
+                    raise ValueError("cross-reference stream is short")
+                position += width
+                fields = []
+                column = 0
+                for w in widths:
+                    fields.append(int.from_bytes(row[column:column + w], 'big'))
+                    column += w
+                kind = fields[0] if widths[0] else 1
+                self._add(number, kind, fields[1], fields[2])
+        return dictionary
+
+    def check_offsets(self):
+        """Raise unless every in-use object is where the cross-reference says."""
+        for number, offset in self.offsets.items():
+            self.object_header(offset, number)
+        for number, (stream, _) in self.compressed.items():
+            if stream not in self.offsets:
+                raise ValueError(f"object {number} is in missing object stream {stream}")
+
+    def object(self, number):
+        """The source of a dictionary object, from the file or its object stream."""
+        if number in self.offsets:
+            return _dictionary(self.data, self.object_header(self.offsets[number], number))[0]
+        if number not in self.compressed:
+            raise ValueError(f"object {number} is not in the cross-reference")
+        stream, index = self.compressed[number]
+        if stream not in self._object_streams:
+            dictionary, end = _dictionary(self.data, self.object_header(self.offsets[stream], stream))
+            self._object_streams[stream] = (dictionary, self.stream(dictionary, end))
+        dictionary, contents = self._object_streams[stream]
+        first = int(_key(dictionary, b'First') or 0)
+        pairs = [int(n) for n in contents[:first].split()]
+        numbers, starts = pairs[::2], pairs[1::2]
+        if index >= len(numbers) or numbers[index] != number:
+            raise ValueError(f"object {number} is not in object stream {stream}")
+        end = starts[index + 1] if index + 1 < len(starts) else len(contents) - first
+        return contents[first + starts[index]:first + end]
+
+    def page_count(self):
+        root = _key(self.trailer, b'Root', REFERENCE)
+        if root is None:
+            raise ValueError("trailer has no /Root")
+        pages = _key(self.object(int(root)), b'Pages', REFERENCE)
+        if pages is None:
+            raise ValueError("catalog has no /Pages")
+        count = _key(self.object(int(pages)), b'Count')
+        if count is None:
+            raise ValueError("page tree has no /Count")
+        return int(count)
+
+def check_pdf(path, min_pages=MIN_PAGES):
+    """Check one PDF; the result's error is None if it is complete."""
+    path = Path(path)
+    try:
+        size = path.stat().st_size
+    except OSError:
+        return PdfCheck(path, None, None, "missing", None)
+    if size == 0:
+        return PdfCheck(path, None, 0, "empty file", None)
+    try:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data.find(b'%PDF-', 0, HEADER_WINDOW) < 0:
+                raise ValueError("no %PDF- header")
+            startxref = STARTXREF.search(data, max(0, size - TRAILER_WINDOW))
+            if startxref is None:
+                raise ValueError("no startxref/%%EOF at the end (truncated?)")
+            pdf = PdfFile(data)
+            pdf.read_xref(int(startxref.group(1)))
+            pdf.check_offsets()
+            pages = pdf.page_count()
+    except (ValueError, zlib.error) as e:
+        return PdfCheck(path, None, size, str(e), None)
+    except OSError as e:
+        return PdfCheck(path, None, size, f"cannot read: {e}", None)
+    warning = None
+    if pages < min_pages:
+        warning = f"only {pages} page{'s' if pages != 1 else ''}"
+    return PdfCheck(path, pages, size, None, warning)
+
+def lesson_checks(lessons, min_pages=MIN_PAGES):
+    """Check the PDF of every document that has a .tex source.
+
+    Returns [(lesson, kind, PdfCheck)], so documents whose PDF is missing
+    are counted as well.
+    """
+    checks = []
+    for lesson_num in lessons:
+        for kind in DOCUMENT_KINDS:
+            if lesson_paths.tex_path(lesson_num, kind).exists():
+                checks.append((lesson_num, kind, check_pdf(lesson_paths.pdf_path(lesson_num, kind), min_pages)))
+    return checks
+
+def describe(check):
+    """One line for a PDF with a problem, or None if it has none."""
+    problem = check.error or check.warning
+    if problem is None:
+        return None
+    try:
+        name = check.path.resolve().relative_to(lesson_paths.root())
+    except ValueError:
+        name = check.path
+    return f"{name}: {'corrupt: ' if check.error and check.size else ''}{problem}"
+
+def main():
+    """Report missing, corrupt and suspiciously short PDFs."""
+    parser = argparse.ArgumentParser(description="Check lesson PDFs for completeness")
+    parser.add_argument('pdfs', nargs='*', help="PDFs to check (default: those of the selected lessons)")
+    add_lessons_argument(parser)
+    parser.add_argument('--min-pages', type=int, default=MIN_PAGES,
+                        help=f"report PDFs with fewer pages (default: {MIN_PAGES})")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.pdfs:
+        checks = [check_pdf(pdf, args.min_pages) for pdf in args.pdfs]
+    else:
+        checks = [check for _, _, check in lesson_checks(lesson_paths.selected(args.lessons), args.min_pages)]
+    elapsed = time.perf_counter() - start
+
+    for check in checks:
+        line = describe(check)
+        if line is not None:
+            print(line)
+    valid = sum(1 for check in checks if check.error is None)
+    short = sum(1 for check in checks if check.warning is not None)
+    pages = sum(check.pages for check in checks if check.pages)
+    print(f"Valid PDFs: {valid}/{len(checks)} ({pages} pages, {short} short) "
+          f"checked in {elapsed * 1000:.1f} ms")
+    return 0 if valid == len(checks) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())